@@ -1,88 +1,823 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.dependencies.utils import request_body_to_args
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError, parse_obj_as
+from pydantic.error_wrappers import ErrorWrapper
+from starlette.concurrency import run_in_threadpool
 
 import uvicorn
 
 from domain.engie_objects import *
+from domain.fleet import *
+from domain.codec import *
 from services.strategy import *
+from services.merit_order import *
+from services.batch import *
+from services.registry import *
+from services.supply_curve import *
+from services.time_series import *
+from services.incremental import *
+from services.unit_commitment import *
+from services.cache import *
+from services.coalescing import *
+from services.pool import *
+from services.instrumentation import *
+from services.admission import *
+from services.plant_types import *
+from services.monte_carlo import *
+from services.profiling import *
+from services.feasibility import *
+from services.audit import *
+from services.shared_fleets import *
+from services.subscriptions import *
 
 app = FastAPI()
 
+instrumentation = Instrumentation()
+profiler = Profiler()
+app.add_middleware(StageTimingMiddleware, instrumentation=instrumentation, profiler=profiler)
+
 orchestrator = StrategyOrchestrator()
 
-simple_dispatcher = SimplePowerDispatcher()
-gas_fired_dispatcher = GasFiredDispatcher()
+batch_planner = BatchPlanner()
+
+incremental_planners = IncrementalPlanners()
+
+plan_cache = PlanCache()
+
+single_flight = SingleFlight()
+
+plan_pool = PlanPool()
+
+admission_control = AdmissionControl()
+
+unit_commitment_solver = UnitCommitmentSolver()
+
+feasibility_indexes = FeasibilityIndexes()
+
+# The fleets are shared by the worker processes through the fleet store, if any
+fleet_registry = FleetRegistry(SharedFleetStore(DEFAULT_FLEET_STORE, feasibility_indexes) if DEFAULT_FLEET_STORE
+                               else None)
+
+audit_log = AuditLog(instrumentation=instrumentation)
+
+# The plans pushed to the subscribers are computed by batch, once per fleet and load
+plan_subscriptions = PlanSubscriptions(batch_planner.plan)
+
+
+@app.on_event("startup")
+async def start_plan_pool() -> None:
+    """
+    Starts the worker processes of the plan pool with the application when eager, out of the event loop, so that they
+    are warm before the first request. Otherwise, they are started on first use: each web server process would start
+    its own pool, even if it never serves '/productionplan/async'.
+    """
+    if plan_pool.eager:
+        await asyncio.get_running_loop().run_in_executor(None, plan_pool.start)
+
+
+@app.on_event("shutdown")
+def shutdown_plan_pool() -> None:
+    """
+    Stops the worker processes of the plan pool with the application.
+    """
+    plan_pool.shutdown()
+
+
+@app.on_event("shutdown")
+def close_audit_log() -> None:
+    """
+    Writes the plans waiting in the queue of the audit log, then stops its writer.
+    """
+    audit_log.close()
 
 
 @app.post("/productionplan")
-def production_plan(payload: Payload) -> [ResponseEntry]:
+async def serve_production_plan(payload: Payload, request: Request = None,
+                                response: Response = None) -> [ResponseEntry]:
     """
     REST endpoint accepting POST requests where the request body accepts a well-formatted payload.
+    The optional time budget (budget_ms query parameter or X-Time-Budget-Ms header) bounds the search of the cheapest
+    plan: the best plan found in time is returned, the X-Plan-Optimal header telling whether it is proven optimal.
+    Requests beyond the capacity of the admission queue are rejected with a 503.
+    An unreachable load may be rejected or snapped to the nearest reachable one (on_infeasible query parameter).
+    :param payload: the payload
+    :param request: the request, for its time budget and its behaviour on an unreachable load
+    :param response: the response, for its headers
+    :return: a list of ResponseEntry
+    """
+    instrumentation.mark_parsed()
+    budget = None if request is None else time_budget(request)
+    # The budget counts from the arrival of the request, the time spent waiting included
+    deadline = request_deadline(budget)
+    mode = infeasible_mode(request)
+
+    # The preparation is short and never waits: it may take a thread before the admission
+    payload, key, cached = await run_in_threadpool(prepare_production_plan, payload, mode, response)
+    if cached is None:
+        try:
+            if deadline is None:
+                # Concurrent identical requests share the same computation
+                cached = await single_flight.do_async(key, lambda: admit_production_plan_async(key, payload))
+            else:
+                # A budgeted computation is not shared, the other requests may have more time
+                cached = await admit_production_plan_async(key, payload, deadline)
+        except Overloaded as error:
+            instrumentation.increment('admission_rejected')
+            raise HTTPException(status_code=503, detail=str(error), headers={'Retry-After': '1'})
+
+    the_response, optimal = cached
+    await audit_log.record_async(key, payload.load, payload.fuels, the_response, payload.powerplants,
+                                 optimal=optimal)
+    if response is not None:
+        response.headers['X-Plan-Optimal'] = 'true' if optimal else 'false'
+    instrumentation.mark_handled()
+    return the_response
+
+
+def production_plan(payload: Payload) -> [ResponseEntry]:
+    """
+    Computes the production plan of the provided payload as the '/productionplan' endpoint does (cache, coalescing
+    and admission included), for the callers outside of the event loop.
+    :param payload: the payload
+    :return: a list of ResponseEntry
+    :raise Overloaded: if the computation is not admitted
+    """
+    payload, key, cached = prepare_production_plan(payload, IGNORE, None)
+    if cached is None:
+        cached = single_flight.do(key, lambda: admit_production_plan(key, payload))
+    return cached[0]
+
+
+def prepare_production_plan(payload: Payload, mode: str,
+                            response: Optional[Response]) -> Tuple[Payload, str, Optional[Tuple[List[ResponseEntry],
+                                                                                                bool]]]:
+    """
+    Checks the load of the provided payload against the feasibility index if asked, then looks for its plan in the
+    cache.
+    :param payload: the payload
+    :param mode: the behaviour on an unreachable load
+    :param response: the response, for its headers
+    :return: the payload (with the snapped load, if any), the key of its plan and the cached plan with its optimality
+    (None if not cached)
+    """
+    if mode != IGNORE:
+        load = feasible_load(Fleet(payload.powerplants), payload.load, payload.fuels, mode, response)
+        if load != payload.load:
+            payload = payload.copy(update={'load': load})
+
+    # Identical requests (whatever the order of the power plants) are answered from the cache
+    key = payload_key(payload)
+    return payload, key, plan_cache.lookup(key)
+
+
+def time_budget(request: Request) -> Optional[float]:
+    """
+    Gives the time budget of the provided request: the budget_ms query parameter, else the X-Time-Budget-Ms header.
+    :param request: the request
+    :return: the time budget in seconds, None if not provided
+    :raise HTTPException: if the time budget is not a positive count of milliseconds
+    """
+    value = request.query_params.get('budget_ms', request.headers.get('x-time-budget-ms'))
+    if value is None:
+        return None
+    try:
+        budget = int(value)
+    except ValueError:
+        budget = 0
+    if budget <= 0:
+        raise HTTPException(status_code=422, detail=f'Invalid time budget: {value}')
+    return budget / 1000
+
+
+def infeasible_mode(request: Optional[Request]) -> str:
+    """
+    Gives the behaviour of the provided request on an unreachable load: the on_infeasible query parameter.
+    :param request: the request
+    :return: ignore (the default), reject or snap
+    :raise HTTPException: if the behaviour is unknown
+    """
+    mode = IGNORE if request is None else request.query_params.get('on_infeasible', IGNORE)
+    if mode not in ON_INFEASIBLE:
+        raise HTTPException(status_code=422, detail=f'Invalid on_infeasible: {mode} (expected one of '
+                                                    f'{", ".join(ON_INFEASIBLE)})')
+    return mode
+
+
+def feasible_load(fleet: Fleet, load: int, fuels: dict, mode: str, response: Optional[Response]) -> int:
+    """
+    Checks the provided load against the feasibility index of the fleet, before any dispatch.
+    :param fleet: the fleet
+    :param load: the load
+    :param fuels: the fuels dict
+    :param mode: the behaviour on an unreachable load: reject or snap
+    :param response: the response, for the X-Snapped-Load header
+    :return: the load, or the nearest reachable one if snapped
+    :raise HTTPException: if the load is unreachable and rejected (422, with the nearest reachable loads)
+    """
+    with instrumentation.stage('feasibility'):
+        feasibility = feasibility_indexes.get(fleet).check(load, fuels, fleet)
+    if feasibility.feasible:
+        return load
+
+    instrumentation.increment('infeasible_load')
+    if mode == REJECT:
+        raise HTTPException(status_code=422, detail={'message': 'Unreachable load', **feasibility.to_dict()})
+    if response is not None:
+        response.headers['X-Snapped-Load'] = str(feasibility.nearest)
+    return feasibility.nearest
+
+
+def admit_production_plan(key: str, payload: Payload,
+                          deadline: Optional[float] = None) -> Tuple[List[ResponseEntry], bool]:
+    """
+    Computes the production plan of the provided payload once admitted, then puts it in the cache unless the deadline
+    stopped the search.
+    :param key: the key of the plan
+    :param payload: the payload
+    :param deadline: the deadline (time.monotonic), None for no deadline
+    :return: the plan and whether it is proven optimal
+    :raise Overloaded: if the request is not admitted
+    """
+    with admission_control.admit(deadline):
+        plan, optimal = compute_timed_production_plan(payload, deadline)
+    if deadline is None or optimal:
+        plan_cache.put(key, plan, optimal)
+    return plan, optimal
+
+
+async def admit_production_plan_async(key: str, payload: Payload,
+                                      deadline: Optional[float] = None) -> Tuple[List[ResponseEntry], bool]:
+    """
+    Coroutine counterpart of admit_production_plan: the request waits for its turn in the event loop, only the
+    admitted ones take a thread.
+    :param key: the key of the plan
+    :param payload: the payload
+    :param deadline: the deadline (time.monotonic), None for no deadline
+    :return: the plan and whether it is proven optimal
+    :raise Overloaded: if the request is not admitted
+    """
+    async with admission_control.admit_async(deadline):
+        plan, optimal = await run_in_threadpool(instrumentation.run_sampled, compute_timed_production_plan, payload,
+                                                deadline)
+    if deadline is None or optimal:
+        plan_cache.put(key, plan, optimal)
+    return plan, optimal
+
+
+def cache_plan(key: str, plan: [ResponseEntry], optimal: bool = True) -> [ResponseEntry]:
+    """
+    Puts the provided plan in the cache.
+    :param key: the key of the plan
+    :param plan: the plan
+    :param optimal: whether the plan is proven optimal
+    :return: the plan
+    """
+    plan_cache.put(key, plan, optimal)
+    return plan
+
+
+def compute_production_plan(payload: Payload) -> [ResponseEntry]:
+    """
+    Computes the production plan of the provided payload.
     :param payload: the payload
     :return: a list of ResponseEntry
     """
+    return compute_timed_production_plan(payload)[0]
+
 
-    # Parse the fuels dict as Fuel objects
-    fuels = []
-    for fuel_str in payload.fuels:
-        fuels.append(Fuel(fuel_str, payload.fuels[fuel_str]))
+def compute_timed_production_plan(payload: Payload,
+                                  deadline: Optional[float] = None) -> Tuple[List[ResponseEntry], bool]:
+    """
+    Computes the production plan of the provided payload, the search of the cheapest plan stopping at the deadline.
+    :param payload: the payload
+    :param deadline: the deadline (time.monotonic), None for no deadline
+    :return: a list of ResponseEntry and whether it is proven optimal
+    """
+    names, powers, optimal = compute_fleet_plan(Fleet(payload.powerplants), payload.load, payload.fuels, deadline)
+    return [ResponseEntry(name, p) for name, p in zip(names, powers)], optimal
+
+
+def compute_fleet_plan(fleet: Fleet, load: int, fuels: dict,
+                       deadline: Optional[float] = None) -> Tuple[List[str], List[int], bool]:
+    """
+    Computes the production plan of the provided fleet.
+    :param fleet: the fleet
+    :param load: the load
+    :param fuels: the fuels dict
+    :param deadline: the deadline of the dispatch (time.monotonic), None for no deadline
+    :return: the names of the ranked power plants, their dispatched power and whether the plan is proven optimal
+    """
 
-    results = []
-    the_response = []
+    with instrumentation.stage('rank'):
+        # Process the whole fleet at once to discover both costs and order
+        # This is based on a simple implementation of the merit order ranking concept
+        state = orchestrator.process_fleet(fleet, fuels, deadline)
 
-    # Loop on power plants (enriched with parsed fuels) to discover both costs and order
-    # This is based on a simple implementation of the merit order ranking concept
-    for power_plant in payload.powerplants:
-        process_result = orchestrator.process_power_plant(EnrichedPowerPlant(power_plant, fuels))
-        results.append(process_result)
+        # Sort the power plants of each type based on the computed order, in one pass for all the types
+        buckets = orchestrator.rank_fleet(state)
 
-    # Sort the result based on the computed order
-    results.sort(key=lambda r: r.order, reverse=False)
     # Align the remaining load with the expected output unit
-    remaining_load = payload.load * 10
-
-    wind_turbine_results = []
-    gas_fired_results = []
-    turbojet_results = []
-
-    # Distribute the results based on the power plant types
-    for result in results:
-        if GAS_FIRED == result.type:
-            gas_fired_results.append(result)
-        elif WIND_TURBINE == result.type:
-            wind_turbine_results.append(result)
-        elif TURBOJET == result.type:
-            turbojet_results.append(result)
-
-    # Start with the wind turbine for dispatching power load by plant
-    for result in simple_dispatcher.compute(wind_turbine_results, remaining_load):
-        remaining_load -= result.dispatched_power
-        the_response.append(ResponseEntry(result.name, result.dispatched_power))
-
-    # Continue with the gas fired for dispatching power load by plant
-    for result in gas_fired_dispatcher.compute(gas_fired_results, remaining_load):
-        remaining_load -= result.dispatched_power
-        the_response.append(ResponseEntry(result.name, result.dispatched_power))
-
-    # End with the turbojet for dispatching power load by plant
-    for result in simple_dispatcher.compute(turbojet_results, remaining_load):
-        remaining_load -= result.dispatched_power
-        the_response.append(ResponseEntry(result.name, result.dispatched_power))
+    remaining_load = load * 10
+
+    # Dispatch the power load type by type (wind turbines, gas fired, then turbojets), each with its own dispatcher
+    for plant_type, positions in buckets:
+        with instrumentation.stage('dispatch.' + plant_type.name):
+            remaining_load -= plant_type.dispatcher.compute_fleet(state, positions, remaining_load)
+
+    positions = np.concatenate([positions for _, positions in buckets] or [np.empty(0, dtype=np.int64)])
+    names = fleet.name_array[positions].tolist()
+    powers = state.dispatched_power[positions]
 
     # A quick validation verifying that the response load matches the requested one
-    response_load = 0
-    for item in the_response:
-        response_load += item.p
+    response_load = int(powers.sum())
 
-    # With a pretty print in the console
-    print(
-        f'Expected load: {payload.load * 10} | Response load: {response_load} -> {payload.load * 10 == response_load}')
+    # Count (and log) the mismatches
+    if load * 10 != response_load:
+        instrumentation.increment('load_mismatch')
+        log_event(logging.WARNING, 'load_mismatch', expected=load * 10, response=response_load)
+    else:
+        log_event(logging.DEBUG, 'plan', expected=load * 10, response=response_load)
 
     # Job done. Cheerio.
+    return names, powers.tolist(), state.optimal
+
+
+async def validate_payload(body: bytes) -> Payload:
+    """
+    Validates the provided request body with the pydantic models, exactly as done by the '/productionplan' endpoint,
+    so that the errors are the same.
+    :param body: the request body
+    :return: the payload
+    """
+    try:
+        received_body = json.loads(body) if body else None
+    except json.JSONDecodeError as error:
+        raise RequestValidationError([ErrorWrapper(error, ("body", error.pos))], body=error.doc)
+
+    payload_field = next(route.body_field for route in app.routes if route.path == '/productionplan')
+    values, errors = await request_body_to_args([payload_field], received_body)
+    if errors:
+        raise RequestValidationError(errors, body=received_body)
+    return values[payload_field.name]
+
+
+@app.post("/productionplan/fast")
+async def production_plan_fast(request: Request) -> Response:
+    """
+    REST endpoint computing the same production plan as '/productionplan', for large fleets: canonical payloads are
+    decoded straight into the columnar fleet and the plan is encoded straight to bytes, without the pydantic models.
+    Any other payload is validated by the pydantic models, with the same errors.
+    :param request: the request
+    :return: the JSON list of the response entries
+    """
+    body = await request.body()
+    try:
+        with instrumentation.stage('decode'):
+            payload = decode_payload(body)
+        instrumentation.increment('fast_decode')
+    except NonCanonicalPayload:
+        instrumentation.increment('fast_decode_fallback')
+        payload = await validate_payload(body)
+    instrumentation.mark_parsed()
+
+    # Identical bodies are answered from the cache, with the encoded plan
+    key = 'body:' + hashlib.sha256(body).hexdigest()
+    cached = plan_cache.lookup(key)
+    if cached is None:
+        cached = await run_in_threadpool(single_flight.do, key, lambda: cache_fast_plan(key, payload))
+    content, optimal = cached
+    await audit_log.record_async(key, payload.load, payload.fuels, content,
+                                 payload.fleet if isinstance(payload, CompactPayload) else payload.powerplants,
+                                 optimal=optimal)
+
+    instrumentation.mark_handled()
+    return Response(content=content, media_type='application/json')
+
+
+def cache_fast_plan(key: str, payload: Union[CompactPayload, Payload]) -> Tuple[bytes, bool]:
+    """
+    Computes and encodes the production plan of the provided (decoded or validated) payload, then puts it in the cache.
+    :param key: the key of the plan
+    :param payload: the payload
+    :return: the JSON bytes and whether the plan is proven optimal
+    """
+    fleet = payload.fleet if isinstance(payload, CompactPayload) else Fleet(payload.powerplants)
+    names, powers, optimal = compute_fleet_plan(fleet, payload.load, payload.fuels)
+    with instrumentation.stage('encode'):
+        content = encode_plan(names, powers)
+    plan_cache.put(key, content, optimal)
+    return content, optimal
+
+
+@app.post("/productionplan/stream")
+async def production_plan_stream(request: Request) -> LineStreamingResponse:
+    """
+    REST endpoint computing the production plans of consecutive intervals of a fleet. The request body is a stream
+    of JSON lines: the first one is the fleet (the list of power plants), each next one is an interval (load and
+    fuels). The response streams back one plan per interval (as JSON lines too), as soon as it is computed.
+    :param request: the request
+    :return: the stream of plans
+    """
+    lines = iter_lines(request.stream())
+    try:
+        power_plants = parse_obj_as(List[PowerPlant], parse_fleet_line(await lines.__anext__()))
+    except (StopAsyncIteration, ValueError) as error:
+        await lines.aclose()
+        if isinstance(error, StopAsyncIteration):
+            raise HTTPException(status_code=422, detail='Missing fleet')
+        raise HTTPException(status_code=422,
+                            detail=error.errors() if isinstance(error, ValidationError) else str(error))
+
+    planner = TimeSeriesPlanner(Fleet(power_plants))
+
+    async def plans():
+        interval = 0
+        try:
+            async for line in lines:
+                scenario = Scenario.parse_raw(line)
+                plan = await run_in_threadpool(planner.plan, scenario)
+                await audit_log.record_async(plan_key(planner.fleet.fingerprint, scenario.load, scenario.fuels),
+                                             scenario.load, scenario.fuels, plan, planner.fleet)
+                yield encode_plan([entry.name for entry in plan], [entry.p for entry in plan]) + b'\n'
+                interval += 1
+        except ValidationError as error:
+            # The response is already started: the error ends the stream
+            yield json.dumps({'interval': interval, 'detail': error.errors()}).encode() + b'\n'
+        except ValueError as error:
+            yield json.dumps({'interval': interval, 'detail': str(error)}).encode() + b'\n'
+        finally:
+            await lines.aclose()
+
+    return LineStreamingResponse(plans())
+
+
+@app.post("/productionplan/async")
+async def production_plan_async(payload: Payload) -> [ResponseEntry]:
+    """
+    REST endpoint computing the same production plan as '/productionplan', without blocking the web server: the
+    computation is sent to a pool of worker processes.
+    :param payload: the payload
+    :return: a list of ResponseEntry
+    """
+    key = payload_key(payload)
+    the_response = plan_cache.get(key)
+    if the_response is None:
+        async def compute() -> [ResponseEntry]:
+            return cache_plan(key, await plan_pool.plan(payload))
+
+        the_response = await single_flight.do_async(key, compute)
+    await audit_log.record_async(key, payload.load, payload.fuels, the_response, payload.powerplants)
+
     return the_response
 
 
+@app.post("/productionplan/batch")
+def production_plan_batch(payload: Union[List[Payload], BatchPayload]) -> [[ResponseEntry]]:
+    """
+    REST endpoint accepting POST requests where the request body is either a list of payloads or a batch payload
+    (one fleet of power plants with many scenarios).
+    :param payload: the list of payloads or the batch payload
+    :return: a list of ResponseEntry lists, one per payload (or scenario)
+    """
+    if isinstance(payload, BatchPayload):
+        return batch_planner.plan(Fleet(payload.powerplants), payload.scenarios)
+    return batch_planner.plan_payloads(payload)
+
+
+def reserved_fleet_ids() -> set:
+    """
+    Gives the fleet ids which cannot be used, as they are shadowed by other '/productionplan/...' endpoints.
+    :return: the reserved ids
+    """
+    prefix = '/productionplan/'
+    return {route.path[len(prefix):] for route in app.routes if route.path.startswith(prefix) and '{' not in route.path}
+
+
+def get_fleet(fleet_id: str) -> Fleet:
+    """
+    Gives the registered fleet having the provided id, or fails with a 404.
+    :param fleet_id: the fleet id
+    :return: the fleet
+    """
+    fleet = fleet_registry.get(fleet_id)
+    if fleet is None:
+        raise HTTPException(status_code=404, detail=f'Unknown fleet: {fleet_id}')
+    return fleet
+
+
+@app.get("/fleets")
+def list_fleets() -> [str]:
+    """
+    REST endpoint listing the ids of the registered fleets.
+    :return: the fleet ids
+    """
+    return fleet_registry.ids()
+
+
+@app.put("/fleets/{fleet_id}")
+async def register_fleet(fleet_id: str, powerplants: List[PowerPlant]) -> dict:
+    """
+    REST endpoint registering (or replacing) a fleet of power plants under the provided id. The subscribers of a
+    replaced fleet are pushed its new plans.
+    :param fleet_id: the fleet id
+    :param powerplants: the power plants of the fleet
+    :return: the summary of the fleet
+    """
+    if fleet_id in reserved_fleet_ids():
+        raise HTTPException(status_code=422, detail=f'Reserved fleet id: {fleet_id}')
+    fleet = await run_in_threadpool(build_fleet, fleet_id, powerplants)
+    # The subscriptions are only changed on the event loop
+    await plan_subscriptions.replace(fleet_id, fleet)
+    return {'id': fleet_id, 'size': len(fleet), 'types': fleet.summary()}
+
+
+def build_fleet(fleet_id: str, powerplants: List[PowerPlant]) -> Fleet:
+    """
+    Registers the provided fleet, with its feasibility index built once, at registration.
+    :param fleet_id: the fleet id
+    :param powerplants: the power plants of the fleet
+    :return: the registered fleet
+    """
+    fleet = fleet_registry.register(fleet_id, powerplants)
+    feasibility_indexes.get(fleet)
+    return fleet
+
+
+@app.get("/fleets/{fleet_id}")
+def describe_fleet(fleet_id: str) -> dict:
+    """
+    REST endpoint describing the registered fleet having the provided id.
+    :param fleet_id: the fleet id
+    :return: the summary of the fleet
+    """
+    fleet = get_fleet(fleet_id)
+    return {'id': fleet_id, 'size': len(fleet), 'types': fleet.summary()}
+
+
+@app.delete("/fleets/{fleet_id}")
+async def unregister_fleet(fleet_id: str) -> dict:
+    """
+    REST endpoint removing the registered fleet having the provided id, which ends its subscriptions.
+    :param fleet_id: the fleet id
+    :return: the id of the removed fleet
+    """
+    if not await run_in_threadpool(fleet_registry.unregister, fleet_id):
+        raise HTTPException(status_code=404, detail=f'Unknown fleet: {fleet_id}')
+    incremental_planners.discard(fleet_id)
+    plan_subscriptions.close(fleet_id)
+    return {'id': fleet_id}
+
+
+@app.get("/fleets/{fleet_id}/plans")
+async def subscribe_plans(fleet_id: str, load: int) -> EventStreamResponse:
+    """
+    REST endpoint subscribing to the production plans of a registered fleet for the provided load, as server-sent
+    events: the current plan (once the market state of the fleet is known), then a new plan each time a market update
+    changes it. The stream ends when the fleet is removed.
+    :param fleet_id: the fleet id
+    :param load: the load
+    :return: the stream of plans
+    """
+    fleet = get_fleet(fleet_id)
+    subscriber = await plan_subscriptions.subscribe(fleet_id, fleet, load)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await subscriber.next(DEFAULT_SUBSCRIPTION_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # A comment keeps the idle connection open
+                    yield b': heartbeat\n\n'
+                    continue
+                if event is None:
+                    break
+                version, plan = event
+                yield b'id: %d\nevent: plan\ndata: %s\n\n' % (version, plan)
+        finally:
+            plan_subscriptions.unsubscribe(fleet_id, subscriber)
+
+    return EventStreamResponse(events(), headers={'Cache-Control': 'no-cache'})
+
+
+@app.post("/fleets/{fleet_id}/market")
+async def update_market(fleet_id: str, update: MarketUpdate) -> dict:
+    """
+    REST endpoint applying a market update (fuel prices and/or wind) to a registered fleet: the plans of its
+    subscribers are computed again, once per load, and pushed to them only if they changed. The market state is only
+    kept while the fleet has subscribers.
+    :param fleet_id: the fleet id
+    :param update: the changed fuels
+    :return: the version of the market state, the count of computed plans, of changed plans and of notified
+    subscribers
+    """
+    fleet = get_fleet(fleet_id)
+    return {'id': fleet_id, **await plan_subscriptions.update(fleet_id, fleet, update.fuels)}
+
+
+@app.post("/productionplan/{fleet_id}")
+def fleet_production_plan(fleet_id: str, scenario: Scenario, request: Request = None,
+                          response: Response = None) -> [ResponseEntry]:
+    """
+    REST endpoint computing the production plan of a registered fleet, where the request body only carries the load
+    and the fuels. An unreachable load may be rejected or snapped as by '/productionplan'.
+    :param fleet_id: the fleet id
+    :param scenario: the load and the fuels
+    :param request: the request, for its behaviour on an unreachable load
+    :param response: the response, for its headers
+    :return: a list of ResponseEntry
+    """
+    instrumentation.mark_parsed()
+    fleet = get_fleet(fleet_id)
+
+    mode = infeasible_mode(request)
+    if mode != IGNORE:
+        load = feasible_load(fleet, scenario.load, scenario.fuels, mode, response)
+        if load != scenario.load:
+            scenario = scenario.copy(update={'load': load})
+
+    key = plan_key(fleet.fingerprint, scenario.load, scenario.fuels)
+    the_response = plan_cache.get(key)
+    if the_response is None:
+        the_response = single_flight.do(key, lambda: cache_plan(key, batch_planner.plan(fleet, [scenario])[0]))
+    audit_log.record(key, scenario.load, scenario.fuels, the_response, fleet, fleet_id)
+
+    instrumentation.mark_handled()
+    return the_response
+
+
+@app.patch("/productionplan/{fleet_id}")
+def update_fleet_production_plan(fleet_id: str, update: PlanUpdate) -> Response:
+    """
+    REST endpoint updating the last production plan of a registered fleet, where the request body only carries what
+    changed (the load and/or some fuels). The first update must give the load and all the fuels.
+    :param fleet_id: the fleet id
+    :param update: the new load and/or the changed fuels
+    :return: a list of ResponseEntry
+    """
+    planner = incremental_planners.get(fleet_id, get_fleet(fleet_id))
+    try:
+        content = planner.update(update.load, update.fuels)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    return Response(content=content, media_type='application/json')
+
+
+@app.delete("/cache")
+def invalidate_cache() -> dict:
+    """
+    REST endpoint removing every cached production plan.
+    :return: the count of removed plans
+    """
+    return {'invalidated': plan_cache.invalidate()}
+
+
+@app.get("/metrics")
+def metrics() -> dict:
+    """
+    REST endpoint giving the metrics of the application.
+    :return: the metrics
+    """
+    return {'cache': plan_cache.stats(), 'coalescing': single_flight.stats(), 'admission': admission_control.stats(),
+            'profiling': profiler.stats(), 'audit': audit_log.stats(), 'subscriptions': plan_subscriptions.stats(),
+            'fleet_store': fleet_registry.store.stats() if fleet_registry.store is not None else None,
+            **instrumentation.snapshot()}
+
+
+@app.get("/audit/plans")
+def audit_plans(fleet: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+                key: Optional[str] = None, limit: int = 100) -> [dict]:
+    """
+    REST endpoint giving the production plans kept by the audit log, the most recent first.
+    :param fleet: the fingerprint of the fleet, or the id of the registered fleet
+    :param since: the earliest time (seconds since the epoch)
+    :param until: the latest time (seconds since the epoch)
+    :param key: the key of the plan
+    :param limit: the maximum count of plans
+    :return: the plans, with their inputs
+    """
+    try:
+        return audit_log.query(fleet, since, until, key, limit)
+    except ValueError as error:
+        raise HTTPException(status_code=404, detail=str(error))
+
+
+@app.get("/audit/fleets/{fingerprint}")
+def audit_fleet(fingerprint: str) -> [dict]:
+    """
+    REST endpoint giving the power plants of a fleet kept by the audit log.
+    :param fingerprint: the fingerprint of the fleet
+    :return: the power plants
+    """
+    try:
+        power_plants = audit_log.fleet(fingerprint)
+    except ValueError as error:
+        raise HTTPException(status_code=404, detail=str(error))
+    if power_plants is None:
+        raise HTTPException(status_code=404, detail=f'Unknown fleet: {fingerprint}')
+    return power_plants
+
+
+def sweep(fleet: Fleet, load_range: LoadRange) -> [dict]:
+    """
+    Sweeps the supply curve of the provided fleet over the provided range of loads.
+    :param fleet: the fleet
+    :param load_range: the range of loads, with the fuels
+    :return: one entry per load
+    """
+    try:
+        return SupplyCurve(fleet, load_range.fuels).sweep(load_range.start, load_range.stop, load_range.step,
+                                                           load_range.plans)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
+@app.post("/supplycurve")
+def supply_curve(payload: SupplyCurvePayload) -> [dict]:
+    """
+    REST endpoint giving the cost, the marginal cost and optionally the production plan of a range of loads.
+    :param payload: the range of loads, with the fuels and the power plants
+    :return: one entry per load
+    """
+    return sweep(Fleet(payload.powerplants), payload)
+
+
+@app.post("/fleets/{fleet_id}/supplycurve")
+def fleet_supply_curve(fleet_id: str, load_range: LoadRange) -> [dict]:
+    """
+    REST endpoint giving the cost, the marginal cost and optionally the production plan of a range of loads, for a
+    registered fleet.
+    :param fleet_id: the fleet id
+    :param load_range: the range of loads, with the fuels
+    :return: one entry per load
+    """
+    return sweep(get_fleet(fleet_id), load_range)
+
+
+def wind_scenarios(fleet: Fleet, scenarios: WindScenarios) -> dict:
+    """
+    Plans the wind uncertainty scenarios of the provided fleet.
+    :param fleet: the fleet
+    :param scenarios: the wind distribution (or samples), with the load and the fuels
+    :return: the distributions of the cost, of the thermal power and of the dispatch of each power plant
+    """
+    try:
+        return analyze_wind_scenarios(fleet, scenarios, batch_planner)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
+@app.post("/scenarios/wind")
+def wind_scenarios_plan(payload: WindScenariosPayload) -> dict:
+    """
+    REST endpoint planning many wind scenarios drawn around the forecast (or given as samples) at once.
+    :param payload: the wind distribution (or samples), with the load, the fuels and the power plants
+    :return: the distributions of the cost, of the thermal power and of the dispatch of each power plant
+    """
+    return wind_scenarios(Fleet(payload.powerplants), payload)
+
+
+@app.post("/fleets/{fleet_id}/scenarios/wind")
+def fleet_wind_scenarios_plan(fleet_id: str, scenarios: WindScenarios) -> dict:
+    """
+    REST endpoint planning many wind scenarios drawn around the forecast (or given as samples) at once, for a
+    registered fleet.
+    :param fleet_id: the fleet id
+    :param scenarios: the wind distribution (or samples), with the load and the fuels
+    :return: the distributions of the cost, of the thermal power and of the dispatch of each power plant
+    """
+    return wind_scenarios(get_fleet(fleet_id), scenarios)
+
+
+@app.post("/unitcommitment")
+def unit_commitment(payload: UnitCommitmentPayload) -> dict:
+    """
+    REST endpoint committing and dispatching the power plants over a horizon of periods, with the start-up costs, the
+    ramp limits and the minimum up and down times of the thermal power plants.
+    :param payload: the periods, the power plants, their constraints and optionally the outcome of the previous horizon
+    :return: the plans of the periods, their cost, the final states and the multipliers of the horizon
+    """
+    if len(payload.periods) == 0:
+        raise HTTPException(status_code=422, detail='At least one period is expected')
+    try:
+        return plan_unit_commitment(payload, unit_commitment_solver)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
 if __name__ == "__main__":
     """
     Entry point of the application
     """
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
     uvicorn.run(app, host="0.0.0.0", port=8888)
@@ -0,0 +1,162 @@
+"""
+This module contains the columnar input and output of the backtests, read and written by chunks of rows: CSV files
+(standard library), Parquet and Arrow IPC files (pyarrow, optional).
+"""
+import csv
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CSV = 'csv'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+
+# File formats by extension
+FORMATS = {'.csv': CSV, '.parquet': PARQUET, '.pq': PARQUET, '.arrow': ARROW, '.feather': ARROW, '.ipc': ARROW}
+
+
+def file_format(path: str) -> str:
+    """
+    Gives the format of the provided file, from its extension.
+    :param path: the path of the file.
+    :return: the format.
+    :raise ValueError: if the format is not supported, or needs pyarrow which is not installed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f'Unsupported file format: {path} (expected {", ".join(sorted(FORMATS))})')
+    if FORMATS[extension] != CSV and pyarrow is None:
+        raise ValueError(f'pyarrow is required to read or write {path}')
+    return FORMATS[extension]
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[Dict[str, list]]:
+    """
+    Reads the provided file by chunks of rows, without loading it whole.
+    :param path: the path of the file.
+    :param chunk_size: the maximum count of rows of a chunk.
+    :return: the chunks, as lists of values by column (strings for CSV files).
+    """
+    kind = file_format(path)
+    if kind == CSV:
+        with open(path, newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            rows = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) == chunk_size:
+                    yield dict(zip(header, map(list, zip(*rows))))
+                    rows = []
+            if rows:
+                yield dict(zip(header, map(list, zip(*rows))))
+    elif kind == PARQUET:
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pydict()
+    else:
+        with pyarrow.memory_map(path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, chunk_size):
+                    yield batch.slice(offset, chunk_size).to_pydict()
+
+
+def to_floats(values: list) -> np.ndarray:
+    """
+    Converts the values of a column into floats, the missing ones (empty or None) being NaN.
+    :param values: the values.
+    :return: the floats.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except ValueError:
+        return np.array([np.nan if value in ('', None) else float(value) for value in values], dtype=np.float64)
+
+
+class ChunkWriter(ABC):
+    """
+    Abstract class for writing a file by chunks of rows, all the chunks having the same columns.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    @abstractmethod
+    def write(self, columns: Dict[str, list]) -> None:
+        """
+        Appends the provided chunk of rows.
+        :param columns: the values by column.
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'ChunkWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CsvChunkWriter(ChunkWriter):
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._header: Optional[List[str]] = None
+
+    def write(self, columns: Dict[str, list]) -> None:
+        if self._header is None:
+            self._header = list(columns)
+            self._writer.writerow(self._header)
+        self._writer.writerows(zip(*(columns[name] for name in self._header)))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowChunkWriter(ChunkWriter):
+    """
+    Writer of Parquet and Arrow IPC files, each chunk being a row group (or a record batch).
+    """
+
+    def __init__(self, path: str, kind: str) -> None:
+        super().__init__(path)
+        self._kind = kind
+        self._writer = None
+
+    def write(self, columns: Dict[str, list]) -> None:
+        table = pyarrow.table(columns)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self._path, table.schema) if self._kind == PARQUET \
+                else pyarrow.ipc.new_file(self._path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path: str) -> ChunkWriter:
+    """
+    Opens a writer of the provided file, the format being given by its extension.
+    :param path: the path of the file.
+    :return: the writer.
+    """
+    kind = file_format(path)
+    return CsvChunkWriter(path) if kind == CSV else ArrowChunkWriter(path, kind)
@@ -0,0 +1,170 @@
+"""
+This module contains the backtest runner: historical loads and fuel prices are replayed through the strategies and
+the dispatchers of the application, without the web server. The rows are read by chunks, planned across a pool of
+worker processes (each one keeping the fleet and the planner) and the plans are written back in the same order.
+
+The input has a 'load' column and one column per fuel, named as the keys of the fuels dict (e.g. 'gas(euro/MWh)'),
+any other column (e.g. a timestamp) being copied to the output. The output has the copied columns, the load, the cost
+(per hour), the load not served, then one column per power plant with its dispatched power (in tenth of MW, as the
+'p' of the plans).
+
+Usage: python -m backtest.run --fleet fleet.json --input history.parquet --output plans.parquet --workers 8
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import parse_obj_as
+
+from backtest.columnar import open_writer, read_chunks, to_floats
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, PowerPlant, fuel_key_types
+from domain.fleet import Fleet
+from services.batch import BatchPlanner
+
+# Default count of rows of a chunk
+DEFAULT_CHUNK_SIZE = 10000
+
+# Name of the load column
+LOAD_COLUMN = 'load'
+
+# Fleet and planner of the worker process
+worker_fleet: Optional[Fleet] = None
+worker_planner: Optional[BatchPlanner] = None
+
+
+def compact_fleet(power_plants: List[PowerPlant]) -> tuple:
+    """
+    Converts the provided power plants into plain data (lists of the fleet columns), cheap to pickle.
+    :param power_plants: the power plants.
+    :return: the arguments of init_worker.
+    """
+    return ([p.name for p in power_plants], [p.type for p in power_plants], [p.efficiency for p in power_plants],
+            [p.pmin for p in power_plants], [p.pmax for p in power_plants])
+
+
+def init_worker(names: List[str], types: List[str], efficiency: List[float], pmin: List[int],
+                pmax: List[int]) -> None:
+    """
+    Initializer of the worker processes: the fleet and the planner are built once.
+    """
+    global worker_fleet, worker_planner
+    worker_fleet = Fleet.from_columns(names, types, efficiency, pmin, pmax)
+    worker_planner = BatchPlanner()
+
+
+def plan_chunk(load: np.ndarray, prices: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plans a chunk of rows, in a worker process.
+    :param load: the load of each row, in MW.
+    :param prices: the fuel data of each row, by power plant type.
+    :return: the dispatched power (rows x power plants), the cost and the load not served of each row.
+    """
+    return worker_planner.dispatch_fleet(worker_fleet, prices, load * 10)
+
+
+def fuel_columns(columns: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Matches the columns with the power plant types, as the keys of the fuels dict (see FuelIndex).
+    :param columns: the names of the columns.
+    :return: the column of each power plant type, None unless exactly one column matches.
+    """
+    matches: Dict[str, List[str]] = {WIND_TURBINE: [], GAS_FIRED: [], TURBOJET: []}
+    for column in columns:
+        if column == LOAD_COLUMN:
+            continue
+        for power_plant_type in fuel_key_types(column):
+            matches.setdefault(power_plant_type, []).append(column)
+    return {power_plant_type: matched[0] if len(matched) == 1 else None
+            for power_plant_type, matched in matches.items()}
+
+
+def backtest(power_plants: List[PowerPlant], input_path: str, output_path: str, workers: int = os.cpu_count() or 1,
+             chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Replays the rows of the input file and writes their plans to the output file.
+    :param power_plants: the fleet.
+    :param input_path: the input file (CSV, Parquet or Arrow).
+    :param output_path: the output file (CSV, Parquet or Arrow).
+    :param workers: the count of worker processes.
+    :param chunk_size: the count of rows of a chunk.
+    :return: the count of rows and chunks, with the duration.
+    """
+    start = time.perf_counter()
+    names = [p.name for p in power_plants]
+    workers = max(workers, 1)
+    rows = chunks = 0
+    # Chunks being planned, at most two per worker so that the memory doesn't depend on the size of the history
+    pending: Deque[Tuple[Dict[str, list], Future]] = deque()
+
+    def write_next(writer) -> None:
+        passed, future = pending.popleft()
+        dispatched, cost, unserved = future.result()
+        columns = dict(passed)
+        columns['cost'] = cost.tolist()
+        columns['unserved'] = unserved.tolist()
+        columns.update(zip(names, dispatched.T.tolist()))
+        writer.write(columns)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=compact_fleet(power_plants)) as executor, open_writer(output_path) as writer:
+        type_columns = None
+        for chunk in read_chunks(input_path, chunk_size):
+            if type_columns is None:
+                if LOAD_COLUMN not in chunk:
+                    raise ValueError(f'The {LOAD_COLUMN} column is missing')
+                type_columns = fuel_columns(list(chunk))
+            count = len(chunk[LOAD_COLUMN])
+            load = np.rint(to_floats(chunk[LOAD_COLUMN])).astype(np.int64)
+            prices = {power_plant_type: np.full(count, np.nan) if column is None else to_floats(chunk[column])
+                      for power_plant_type, column in type_columns.items()}
+
+            # The columns which are not fuels are copied to the output
+            passed = {name: values for name, values in chunk.items()
+                      if name != LOAD_COLUMN and name not in type_columns.values() and not fuel_key_types(name)}
+            passed[LOAD_COLUMN] = load.tolist()
+            pending.append((passed, executor.submit(plan_chunk, load, prices)))
+            rows += count
+            chunks += 1
+            while len(pending) >= 2 * workers:
+                write_next(writer)
+
+        while pending:
+            write_next(writer)
+
+    return {'rows': rows, 'chunks': chunks, 'workers': workers, 'seconds': time.perf_counter() - start}
+
+
+def load_fleet(path: str) -> List[PowerPlant]:
+    """
+    Loads the fleet of the provided JSON file: a list of power plants, or a payload having them.
+    :param path: the path of the file.
+    :return: the power plants.
+    """
+    with open(path) as file:
+        content = json.load(file)
+    if isinstance(content, dict):
+        content = content.get('powerplants', [])
+    return parse_obj_as(List[PowerPlant], content)
+
+
+def main(arguments: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Backtest of the production plans over historical scenarios.')
+    parser.add_argument('--fleet', required=True, help='JSON file of the power plants (or of a payload)')
+    parser.add_argument('--input', required=True, help='CSV, Parquet or Arrow file of the historical scenarios')
+    parser.add_argument('--output', required=True, help='CSV, Parquet or Arrow file of the plans')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='count of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='count of rows of a chunk')
+    options = parser.parse_args(arguments)
+
+    summary = backtest(load_fleet(options.fleet), options.input, options.output, options.workers,
+                       options.chunk_size)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+This module compares two benchmark reports (or two load test reports) and flags the regressions.
+
+Usage: python -m benchmarks.compare baseline.json candidate.json --threshold 0.1 --metric p50_ms --metric p99_ms
+"""
+import argparse
+import json
+import sys
+from typing import List
+
+# Metrics for which a lower value is a regression
+HIGHER_IS_BETTER = {'throughput_per_s'}
+
+
+def compare(baseline: dict, candidate: dict, threshold: float, metric: str = 'p50_ms') -> List[dict]:
+    """
+    Compares the results of two reports, scenario by scenario and size by size (and concurrency by concurrency for the
+    load test reports).
+    :param baseline: the baseline report.
+    :param candidate: the candidate report.
+    :param threshold: the relative slowdown above which a result is a regression.
+    :param metric: the compared metric.
+    :return: one entry per result present in both reports.
+    """
+    def key(result: dict) -> tuple:
+        return result['scenario'], result['size'], result.get('concurrency')
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    comparison = []
+    for result in candidate['results']:
+        reference = baseline_results.get(key(result))
+        if reference is None or not reference.get(metric) or result.get(metric) is None:
+            continue
+        ratio = result[metric] / reference[metric]
+        comparison.append({
+            'scenario': result['scenario'],
+            'size': result['size'],
+            'concurrency': result.get('concurrency'),
+            'metric': metric,
+            'baseline': reference[metric],
+            'candidate': result[metric],
+            'ratio': ratio,
+            'regression': ratio < 1 - threshold if metric in HIGHER_IS_BETTER else ratio > 1 + threshold
+        })
+    return comparison
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Comparison of two benchmark reports.')
+    parser.add_argument('baseline', help='baseline JSON report')
+    parser.add_argument('candidate', help='candidate JSON report')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged as a regression')
+    parser.add_argument('--metric', action='append', help='compared metric (p50_ms by default), may be repeated')
+    options = parser.parse_args(arguments)
+
+    with open(options.baseline) as baseline_file, open(options.candidate) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+    comparison = [entry for metric in options.metric or ['p50_ms']
+                  for entry in compare(baseline, candidate, options.threshold, metric)]
+
+    for entry in comparison:
+        flag = 'REGRESSION' if entry['regression'] else 'ok'
+        concurrency = '' if entry['concurrency'] is None else f"x{entry['concurrency']}"
+        print(f"{entry['scenario']:<36} {entry['size']:>8} {concurrency:>5} {entry['metric']:<20} "
+              f"{entry['baseline']:>12.3f} {entry['candidate']:>12.3f} {entry['ratio']:>7.2f}x {flag}")
+
+    return 1 if any(entry['regression'] for entry in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+This module contains the seeded generator of synthetic fleets and payloads used by the benchmarks.
+"""
+import random
+from typing import Dict, List
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, Payload, PowerPlant
+
+# Default share of each power plant type in a fleet
+DEFAULT_MIX = {GAS_FIRED: 0.55, WIND_TURBINE: 0.30, TURBOJET: 0.15}
+
+
+def generate_power_plant(rng: random.Random, power_plant_type: str, index: int) -> PowerPlant:
+    """
+    Generates a power plant of the provided type with realistic characteristics.
+    :param rng: the random generator.
+    :param power_plant_type: the power plant type.
+    :param index: the index of the power plant, used in its name.
+    :return: the power plant.
+    """
+    if power_plant_type == GAS_FIRED:
+        pmax = rng.randint(50, 500)
+        # Gas fired power plants have a minimum power of 20% to 40% of their maximum power
+        pmin = int(pmax * rng.uniform(0.2, 0.4))
+        efficiency = round(rng.uniform(0.35, 0.60), 2)
+    elif power_plant_type == TURBOJET:
+        pmax = rng.randint(10, 50)
+        pmin = 0
+        efficiency = round(rng.uniform(0.25, 0.35), 2)
+    else:
+        pmax = rng.randint(10, 200)
+        pmin = 0
+        efficiency = 1
+    return PowerPlant(name=f'{power_plant_type}{index}', type=power_plant_type, efficiency=efficiency, pmin=pmin,
+                      pmax=pmax)
+
+
+def generate_fleet(size: int, seed: int = 0, mix: Dict[str, float] = None) -> List[PowerPlant]:
+    """
+    Generates a fleet of power plants.
+    :param size: the count of power plants.
+    :param seed: the seed of the random generator.
+    :param mix: the share of each power plant type.
+    :return: the power plants.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    types = list(mix)
+    weights = [mix[power_plant_type] for power_plant_type in types]
+    return [generate_power_plant(rng, rng.choices(types, weights)[0], index) for index in range(size)]
+
+
+def generate_fuels(rng: random.Random) -> dict:
+    """
+    Generates the fuels of a payload.
+    :param rng: the random generator.
+    :return: the fuels dict.
+    """
+    return {
+        'gas(euro/MWh)': round(rng.uniform(10, 40), 1),
+        'kerosine(euro/MWh)': round(rng.uniform(40, 80), 1),
+        'co2(euro/ton)': 20,
+        'wind(%)': rng.choice([0, 20, 40, 60, 80, 100])
+    }
+
+
+def generate_payload(size: int, seed: int = 0, mix: Dict[str, float] = None) -> Payload:
+    """
+    Generates a payload whose load is between 30% and 70% of the capacity of the fleet.
+    :param size: the count of power plants.
+    :param seed: the seed of the random generator.
+    :param mix: the share of each power plant type.
+    :return: the payload.
+    """
+    power_plants = generate_fleet(size, seed, mix)
+    rng = random.Random(seed + 1)
+    capacity = sum(power_plant.pmax for power_plant in power_plants)
+    return Payload(load=int(capacity * rng.uniform(0.3, 0.7)), fuels=generate_fuels(rng), powerplants=power_plants)
@@ -0,0 +1,364 @@
+"""
+This module contains the load test harness: recorded or synthetic payloads are replayed against the application over
+HTTP at a configurable concurrency (and rate), and the end-to-end latency percentiles, the throughput, the error rate
+and the CPU time per request are reported as JSON (see benchmarks.compare to compare two runs).
+
+The application is either started locally (uvicorn subprocess, the default), run in process (uvicorn thread) or
+reached at the provided URL (no CPU time then).
+
+Usage: python -m benchmarks.load --sizes 10,1000 --concurrency 1,8,32 --requests 2000 --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmarks.generator import generate_payload
+from benchmarks.run import git_commit
+
+DEFAULT_ENDPOINT = '/productionplan'
+DEFAULT_SIZES = (10, 100)
+
+# Maximum time waited for a started application to answer, in seconds
+STARTUP_TIMEOUT = 30
+
+
+def load_payloads(path: str) -> List[bytes]:
+    """
+    Loads the recorded payloads of the provided file: a JSON payload, a JSON list of payloads, a Postman collection
+    (the raw bodies of its requests) or JSON lines (one payload per line).
+    :param path: the path of the file.
+    :return: the bodies of the requests.
+    """
+    with open(path) as file:
+        if path.endswith('.jsonl'):
+            return [json.dumps(json.loads(line)).encode() for line in file if line.strip()]
+        content = json.load(file)
+
+    if isinstance(content, dict) and 'item' in content:
+        bodies = []
+        items = list(content['item'])
+        while items:
+            item = items.pop(0)
+            # Folders of a collection have their own items
+            items.extend(item.get('item', []))
+            raw = item.get('request', {}).get('body', {}).get('raw')
+            if raw:
+                bodies.append(json.dumps(json.loads(raw)).encode())
+        return bodies
+    if isinstance(content, list):
+        return [json.dumps(payload).encode() for payload in content]
+    return [json.dumps(content).encode()]
+
+
+def synthetic_payloads(sizes: List[int], variants: int, seed: int) -> List[bytes]:
+    """
+    Generates synthetic payloads: distinct ones (seeded) so that the plan cache of the application is not always hit.
+    :param sizes: the fleet sizes.
+    :param variants: the count of payloads of each size.
+    :param seed: the seed of the generator.
+    :return: the bodies of the requests.
+    """
+    return [generate_payload(size, seed + variant).json().encode() for size in sizes for variant in range(variants)]
+
+
+def process_tree_cpu(pid: int) -> Optional[float]:
+    """
+    Gives the CPU time (user and system) of the provided process and of its children, from /proc.
+    :param pid: the id of the process.
+    :return: the CPU time in seconds, None if not available (not Linux).
+    """
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    total = None
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/stat') as stat:
+                # The name of the command may have spaces: the fields are read after it
+                fields = stat.read().rsplit(')', 1)[1].split()
+            tasks = os.listdir(f'/proc/{current}/task')
+        except (OSError, IndexError):
+            # Not Linux, or a child already gone
+            continue
+        total = (total or 0.0) + (int(fields[11]) + int(fields[12])) / ticks
+        for task in tasks:
+            try:
+                with open(f'/proc/{current}/task/{task}/children') as children:
+                    pids.extend(int(child) for child in children.read().split())
+            except OSError:
+                pass
+    return total
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(host: str, port: int, timeout: float = STARTUP_TIMEOUT) -> None:
+    """
+    Waits for the application to answer.
+    :raise TimeoutError: if it does not answer in time.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', '/metrics')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'The application did not answer on {host}:{port}')
+
+
+class LocalServer:
+    """
+    The application started for the load test: a uvicorn subprocess (with its workers) or a uvicorn thread.
+    """
+
+    def __init__(self, in_process: bool = False, workers: int = 1) -> None:
+        self._in_process = in_process
+        self._workers = workers
+        self._port = free_port()
+        self._process: Optional[subprocess.Popen] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._port}'
+
+    def cpu(self) -> Optional[float]:
+        """
+        Gives the CPU time of the application: the whole process (the load generator included) when in process.
+        :return: the CPU time in seconds, None if not available.
+        """
+        if self._in_process:
+            return time.process_time()
+        return process_tree_cpu(self._process.pid)
+
+    def __enter__(self) -> 'LocalServer':
+        if self._in_process:
+            import uvicorn
+            from app.app import app
+            self._server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=self._port, log_level='warning'))
+            self._thread = threading.Thread(target=self._server.run, daemon=True)
+            self._thread.start()
+        else:
+            self._process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.app:app', '--host', '127.0.0.1',
+                                              '--port', str(self._port), '--workers', str(self._workers),
+                                              '--log-level', 'warning'],
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready('127.0.0.1', self._port)
+        except TimeoutError:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(10)
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+def replay(url: str, endpoint: str, bodies: List[bytes], concurrency: int, count: int, rate: Optional[float] = None,
+           cpu: Callable[[], Optional[float]] = lambda: None, timeout: float = 60) -> dict:
+    """
+    Replays the provided bodies (round robin) against the application.
+    :param url: the base URL of the application.
+    :param endpoint: the path of the endpoint.
+    :param bodies: the bodies of the requests.
+    :param concurrency: the count of concurrent clients (each one keeping its connection alive).
+    :param count: the count of requests.
+    :param rate: the rate of the requests per second (open loop: the latency is measured from the scheduled time,
+    so that a slow application is not hidden by the clients waiting for it), None to send as fast as possible.
+    :param cpu: gives the CPU time of the application, in seconds.
+    :param timeout: the timeout of a request, in seconds.
+    :return: the statistics.
+    """
+    target = urlsplit(url)
+    headers = {'Content-Type': 'application/json'}
+    lock = threading.Lock()
+    next_request = [0]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    def client() -> None:
+        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=timeout)
+        client_latencies = []
+        client_statuses: Dict[str, int] = {}
+        while True:
+            with lock:
+                number = next_request[0]
+                next_request[0] += 1
+            if number >= count:
+                break
+            if rate:
+                scheduled = start + number / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+
+            try:
+                connection.request('POST', endpoint, bodies[number % len(bodies)], headers)
+                response = connection.getresponse()
+                response.read()
+                status = str(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port, timeout=timeout)
+            client_latencies.append(time.perf_counter() - scheduled)
+            client_statuses[status] = client_statuses.get(status, 0) + 1
+        connection.close()
+
+        with lock:
+            latencies.extend(client_latencies)
+            for status, status_count in client_statuses.items():
+                statuses[status] = statuses.get(status, 0) + status_count
+
+    cpu_start = cpu()
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu_end = cpu()
+
+    milliseconds = np.array(latencies) * 1000
+    errors = sum(status_count for status, status_count in statuses.items() if not status.startswith('2'))
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies) if latencies else None,
+        'statuses': statuses,
+        'p50_ms': float(np.percentile(milliseconds, 50)) if latencies else None,
+        'p95_ms': float(np.percentile(milliseconds, 95)) if latencies else None,
+        'p99_ms': float(np.percentile(milliseconds, 99)) if latencies else None,
+        'mean_ms': float(milliseconds.mean()) if latencies else None,
+        'max_ms': float(milliseconds.max()) if latencies else None,
+        'throughput_per_s': len(latencies) / elapsed if elapsed > 0 else None,
+        'cpu_ms_per_request': (cpu_end - cpu_start) * 1000 / len(latencies)
+        if latencies and cpu_start is not None and cpu_end is not None else None
+    }
+
+
+def mean_size(bodies: List[bytes]) -> int:
+    """
+    Gives the mean count of power plants of the provided bodies, identifying the results of a report.
+    """
+    sizes = [len(json.loads(body).get('powerplants', [])) for body in bodies]
+    return round(sum(sizes) / len(sizes)) if sizes else 0
+
+
+def run_load(bodies: List[bytes], concurrencies: List[int], count: int, rate: Optional[float] = None,
+             endpoint: str = DEFAULT_ENDPOINT, url: Optional[str] = None, in_process: bool = False,
+             server_workers: int = 1, warmup: int = 10) -> dict:
+    """
+    Runs the load test at each of the provided concurrencies.
+    :param bodies: the bodies of the requests.
+    :param concurrencies: the counts of concurrent clients.
+    :param count: the count of requests at each concurrency.
+    :param rate: the rate of the requests per second, None to send as fast as possible.
+    :param endpoint: the path of the endpoint.
+    :param url: the base URL of a running application, None to start it.
+    :param in_process: True to run the application in this process (uvicorn thread) instead of a subprocess.
+    :param server_workers: the count of uvicorn workers of the started application.
+    :param warmup: the count of requests sent (not measured) before each concurrency.
+    :return: the report.
+    """
+    if not bodies:
+        raise ValueError('No payload to replay')
+
+    def measure(base_url: str, cpu: Callable[[], Optional[float]]) -> List[dict]:
+        results = []
+        for concurrency in concurrencies:
+            if warmup:
+                replay(base_url, endpoint, bodies, concurrency, warmup)
+            result = replay(base_url, endpoint, bodies, concurrency, count, rate, cpu)
+            results.append({'scenario': f'load{endpoint}', 'size': mean_size(bodies), 'concurrency': concurrency,
+                            **result})
+        return results
+
+    if url:
+        results = measure(url, lambda: None)
+    else:
+        with LocalServer(in_process, server_workers) as server:
+            results = measure(server.url, server.cpu)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'endpoint': endpoint,
+            'payloads': len(bodies),
+            'requests': count,
+            'rate': rate,
+            'target': url or ('in process' if in_process else f'uvicorn --workers {server_workers}')
+        },
+        'results': results
+    }
+
+
+def main(arguments: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Load test of the application.')
+    parser.add_argument('--payloads', help='recorded payloads: JSON payload or list, Postman collection, JSON lines')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma separated fleet sizes of the synthetic payloads (without --payloads)')
+    parser.add_argument('--variants', type=int, default=50, help='count of synthetic payloads of each size')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the payload generator')
+    parser.add_argument('--endpoint', default=DEFAULT_ENDPOINT, help='path of the endpoint')
+    parser.add_argument('--concurrency', default='1,8', help='comma separated counts of concurrent clients')
+    parser.add_argument('--requests', type=int, default=1000, help='count of requests at each concurrency')
+    parser.add_argument('--rate', type=float, help='requests per second (as fast as possible by default)')
+    parser.add_argument('--warmup', type=int, default=10, help='count of requests sent before measuring')
+    parser.add_argument('--url', help='base URL of a running application (started locally by default)')
+    parser.add_argument('--in-process', action='store_true', help='run the application in this process')
+    parser.add_argument('--server-workers', type=int, default=1, help='count of uvicorn workers when started')
+    parser.add_argument('--output', help='JSON report file (standard output by default)')
+    options = parser.parse_args(arguments)
+
+    bodies = load_payloads(options.payloads) if options.payloads \
+        else synthetic_payloads([int(size) for size in options.sizes.split(',')], options.variants, options.seed)
+    report = run_load(bodies, [int(concurrency) for concurrency in options.concurrency.split(',')],
+                      options.requests, options.rate, options.endpoint, options.url, options.in_process,
+                      options.server_workers, options.warmup)
+    content = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output:
+            output.write(content)
+    else:
+        print(content)
+
+
+if __name__ == '__main__':
+    main()
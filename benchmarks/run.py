@@ -0,0 +1,233 @@
+"""
+This module contains the benchmark runner: timed scenarios on synthetic fleets, reported as JSON.
+
+Usage: python -m benchmarks.run --sizes 10,100,1000 --repeat 20 --output benchmark.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.app import compute_production_plan
+from benchmarks.generator import generate_payload
+from domain.codec import decode_payload, encode_plan
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, EnrichedPowerPlant, FuelIndex, Payload, \
+    WindScenarios
+from domain.fleet import Fleet
+from services.batch import BatchPlanner
+from services.incremental import IncrementalPlanner
+from services.merit_order import MeritOrderDispatcher
+from services.monte_carlo import analyze_wind_scenarios
+from services.strategy import GasFiredDispatcher, ProcessResult, SimplePowerDispatcher, StrategyOrchestrator
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+
+
+class BenchmarkScenario:
+    """
+    A timed scenario: the setup builds the arguments of each run (not timed), the function is timed.
+    """
+
+    def __init__(self, name: str, setup: Callable[[Payload], tuple], function: Callable, max_size: int = None):
+        self.name = name
+        self.setup = setup
+        self.function = function
+        self.max_size = max_size
+
+
+def process_all(payload: Payload) -> List[ProcessResult]:
+    """
+    Ranks every power plant of the payload, as done by production_plan.
+    """
+    orchestrator = StrategyOrchestrator()
+    fuels = FuelIndex(payload.fuels)
+    results = [orchestrator.process_power_plant(EnrichedPowerPlant(power_plant, fuels))
+               for power_plant in payload.powerplants]
+    results.sort(key=lambda r: r.order)
+    return results
+
+
+def setup_process(payload: Payload) -> tuple:
+    orchestrator = StrategyOrchestrator()
+    fuels = FuelIndex(payload.fuels)
+    return orchestrator, [EnrichedPowerPlant(power_plant, fuels) for power_plant in payload.powerplants]
+
+
+def run_process(orchestrator: StrategyOrchestrator, power_plants: List[EnrichedPowerPlant]) -> None:
+    for power_plant in power_plants:
+        orchestrator.process_power_plant(power_plant)
+
+
+def setup_process_fleet(payload: Payload) -> tuple:
+    return StrategyOrchestrator(), Fleet(payload.powerplants), payload.fuels
+
+
+def run_process_fleet(orchestrator: StrategyOrchestrator, fleet: Fleet, fuels: dict) -> None:
+    orchestrator.rank_fleet(orchestrator.process_fleet(fleet, fuels))
+
+
+def setup_dispatch(power_plant_types: tuple) -> Callable[[Payload], tuple]:
+    def setup(payload: Payload) -> tuple:
+        results = [result for result in process_all(payload) if result.type in power_plant_types]
+        return results, payload.load * 10
+
+    return setup
+
+
+def setup_production_plan(payload: Payload) -> tuple:
+    return payload,
+
+
+def setup_codec(payload: Payload) -> tuple:
+    plan = compute_production_plan(payload)
+    return payload.json().encode(), plan
+
+
+def run_pydantic_codec(body: bytes, plan: List) -> None:
+    # As done by FastAPI for the '/productionplan' endpoint
+    Payload(**json.loads(body))
+    JSONResponse(jsonable_encoder(plan))
+
+
+def run_fast_codec(body: bytes, plan: List) -> None:
+    decode_payload(body)
+    encode_plan([entry.name for entry in plan], [entry.p for entry in plan])
+
+
+def setup_incremental(payload: Payload) -> tuple:
+    planner = IncrementalPlanner(Fleet(payload.powerplants))
+    planner.update(payload.load, payload.fuels)
+    gas_price = payload.fuels['gas(euro/MWh)']
+    return planner, {'gas(euro/MWh)': gas_price * 1.01, 'wind(%)': (payload.fuels['wind(%)'] + 1) % 100}
+
+
+def run_incremental(planner: IncrementalPlanner, delta: dict) -> None:
+    planner.update(fuels=delta)
+
+
+def setup_wind_scenarios(payload: Payload) -> tuple:
+    scenarios = WindScenarios(load=payload.load, fuels=payload.fuels, count=1000, seed=1)
+    return Fleet(payload.powerplants), scenarios, BatchPlanner()
+
+
+SCENARIOS = [
+    BenchmarkScenario('orchestrator.process_power_plant', setup_process, run_process),
+    BenchmarkScenario('orchestrator.process_fleet', setup_process_fleet, run_process_fleet),
+    BenchmarkScenario('GasFiredDispatcher', setup_dispatch((GAS_FIRED,)), GasFiredDispatcher().compute,
+                      max_size=10000),
+    BenchmarkScenario('MeritOrderDispatcher', setup_dispatch((GAS_FIRED,)), MeritOrderDispatcher().compute),
+    BenchmarkScenario('SimplePowerDispatcher', setup_dispatch((WIND_TURBINE, TURBOJET)),
+                      SimplePowerDispatcher().compute),
+    BenchmarkScenario('production_plan', setup_production_plan, compute_production_plan),
+    BenchmarkScenario('IncrementalPlanner.update', setup_incremental, run_incremental),
+    BenchmarkScenario('codec.pydantic', setup_codec, run_pydantic_codec),
+    BenchmarkScenario('codec.fast', setup_codec, run_fast_codec),
+    BenchmarkScenario('analyze_wind_scenarios', setup_wind_scenarios, analyze_wind_scenarios, max_size=10000),
+]
+
+
+def measure(scenario: BenchmarkScenario, payload: Payload, repeat: int) -> dict:
+    """
+    Runs the provided scenario and computes its statistics.
+    :param scenario: the scenario.
+    :param payload: the payload.
+    :param repeat: the count of timed runs.
+    :return: the statistics.
+    """
+    durations = []
+    for _ in range(repeat):
+        arguments = scenario.setup(payload)
+        start = time.perf_counter()
+        scenario.function(*arguments)
+        durations.append(time.perf_counter() - start)
+
+    # One more run, traced, for the peak memory
+    arguments = scenario.setup(payload)
+    tracemalloc.start()
+    scenario.function(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    milliseconds = np.array(durations) * 1000
+    return {
+        'scenario': scenario.name,
+        'size': len(payload.powerplants),
+        'repeat': repeat,
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p95_ms': float(np.percentile(milliseconds, 95)),
+        'p99_ms': float(np.percentile(milliseconds, 99)),
+        'mean_ms': float(milliseconds.mean()),
+        'throughput_per_s': float(repeat / sum(durations)) if sum(durations) > 0 else None,
+        'peak_memory_kb': peak / 1024
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: List[int], repeat: int, seed: int, scenarios: List[str] = None) -> dict:
+    """
+    Runs the benchmark scenarios on fleets of the provided sizes.
+    :param sizes: the fleet sizes.
+    :param repeat: the count of timed runs of each scenario.
+    :param seed: the seed of the generator.
+    :param scenarios: the names of the scenarios to run, all if None.
+    :return: the report.
+    """
+    results = []
+    for size in sizes:
+        payload = generate_payload(size, seed)
+        for scenario in SCENARIOS:
+            if scenarios and scenario.name not in scenarios:
+                continue
+            if scenario.max_size is not None and size > scenario.max_size:
+                continue
+            results.append(measure(scenario, payload, repeat))
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+
+def main(arguments: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks of the production plan pipeline.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma separated fleet sizes')
+    parser.add_argument('--repeat', type=int, default=20, help='count of timed runs of each scenario')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fleet generator')
+    parser.add_argument('--scenario', action='append', help='scenario to run (all by default), may be repeated')
+    parser.add_argument('--output', help='JSON report file (standard output by default)')
+    options = parser.parse_args(arguments)
+
+    report = run([int(size) for size in options.sizes.split(',')], options.repeat, options.seed, options.scenario)
+    content = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output:
+            output.write(content)
+    else:
+        print(content)
+
+
+if __name__ == '__main__':
+    main()
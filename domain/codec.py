@@ -0,0 +1,116 @@
+"""
+This module contains the fast codec of the application: a strict decoder going straight from the request body to the
+columnar fleet, and an encoder writing the production plan straight to bytes. Anything the decoder doesn't accept as
+is (coercions, missing fields, invalid JSON, ...) is left to the pydantic models, so that the errors stay the same.
+"""
+import json
+from typing import Sequence
+
+from domain.fleet import Fleet
+
+# Exact types accepted by the strict decoder (bool is a subclass of int, hence the exact types)
+_INT = {int}
+_NUMBER = {int, float}
+_STR = {str}
+
+# Template of a response entry, when the names don't need to be escaped
+_ENTRY = '{"name":"%s","p":%d}'
+
+
+class NonCanonicalPayload(ValueError):
+    """
+    Raised by the strict decoder when the payload has to go through the pydantic models.
+    """
+
+
+class CompactPayload:
+    """
+    Class defining a decoded payload, the power plants being stored as a columnar fleet.
+    """
+    __slots__ = ('_load', '_fuels', '_fleet')
+
+    def __init__(self, load: int, fuels: dict, fleet: Fleet):
+        self._load = load
+        self._fuels = fuels
+        self._fleet = fleet
+
+    @property
+    def load(self) -> int:
+        return self._load
+
+    @property
+    def fuels(self) -> dict:
+        return self._fuels
+
+    @property
+    def fleet(self) -> Fleet:
+        return self._fleet
+
+
+def _column(power_plants: list, field: str, accepted_types: set) -> list:
+    try:
+        column = [power_plant[field] for power_plant in power_plants]
+    except KeyError:
+        raise NonCanonicalPayload(f'Missing or invalid field: {field}')
+    # Types are checked at once, without a Python loop
+    if not set(map(type, column)) <= accepted_types:
+        raise NonCanonicalPayload(f'Non canonical field: {field}')
+    return column
+
+
+def decode_payload(body: bytes) -> CompactPayload:
+    """
+    Decodes the provided request body, accepting only canonical payloads: exact JSON types, no coercion.
+    :param body: the request body.
+    :return: the decoded payload.
+    :raise NonCanonicalPayload: if the payload has to go through the pydantic models.
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise NonCanonicalPayload('Invalid JSON')
+
+    if type(data) is not dict:
+        raise NonCanonicalPayload('The payload is not an object')
+    load = data.get('load')
+    fuels = data.get('fuels')
+    power_plants = data.get('powerplants')
+    if type(load) is not int or type(fuels) is not dict or type(power_plants) is not list:
+        raise NonCanonicalPayload('Missing or non canonical load, fuels or powerplants')
+
+    # Every power plant must be an object
+    if not set(map(type, power_plants)) <= {dict}:
+        raise NonCanonicalPayload('The power plants are not objects')
+
+    fleet = Fleet.from_columns(_column(power_plants, 'name', _STR),
+                               _column(power_plants, 'type', _STR),
+                               _column(power_plants, 'efficiency', _NUMBER),
+                               _column(power_plants, 'pmin', _INT),
+                               _column(power_plants, 'pmax', _INT))
+    return CompactPayload(load, fuels, fleet)
+
+
+def encode_plan(names: Sequence[str], powers: Sequence[int]) -> bytes:
+    """
+    Encodes a production plan to the same JSON bytes as the FastAPI serialisation of the ResponseEntry list.
+    :param names: the names of the power plants.
+    :param powers: the dispatched power of the power plants.
+    :return: the JSON bytes.
+    """
+    names = list(names)
+    # The names are written as is, unless at least one of them has to be escaped
+    if json.dumps(names, ensure_ascii=False) == ('["' + '", "'.join(names) + '"]' if names else '[]'):
+        content = '[' + ','.join(map(_ENTRY.__mod__, zip(names, powers))) + ']'
+    else:
+        content = json.dumps([{'name': name, 'p': p} for name, p in zip(names, powers)], ensure_ascii=False,
+                             separators=(',', ':'))
+    return content.encode('utf-8')
+
+
+def join_plans(encoded_plans: Sequence[bytes]) -> bytes:
+    """
+    Joins encoded production plans (e.g. one per power plant type) into a single one.
+    :param encoded_plans: the encoded plans, as given by encode_plan.
+    :return: the JSON bytes.
+    """
+    return b'[' + b','.join(encoded_plan[1:-1] for encoded_plan in encoded_plans if len(encoded_plan) > 2) + b']'
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 from pydantic import BaseModel
 
 GAS_FIRED = 'gasfired'
@@ -24,12 +25,103 @@ class RawFuel:
         return self._type
 
 
+# Maximum count of keys of the fuels dict whose matching types are kept by a fuel table
+MAX_FUEL_KEYS = 1024
+
+
+@lru_cache(maxsize=1024)
+def parse_fuel_key(key: str) -> Tuple[str, Optional[str]]:
+    """
+    Parses a key of the fuels dict, such as 'gas(euro/MWh)', into its name and its unit. Parsed keys are cached.
+    :param key: the key.
+    :return: the name and the unit (None if missing).
+    """
+    name, separator, unit = key.partition('(')
+    if separator and unit.endswith(')'):
+        unit = unit[:-1]
+    return name.strip(), unit or None
+
+
+class FuelTable:
+    """
+    Table of the fuels supported by each power plant type, used to match the keys of the fuels dict. The provided list
+    is updated in place, so that it always reflects the table.
+    """
+
+    def __init__(self, fuels: Optional[List[RawFuel]] = None):
+        self._fuels: List[RawFuel] = [] if fuels is None else fuels
+        self._by_type: Dict[str, list] = {fuel.type: fuel.content for fuel in self._fuels}
+        # Matching types of the keys already seen, forgotten on each change of the table
+        self._key_types: Dict[str, Tuple[str, ...]] = {}
+
+    @property
+    def fuels(self) -> List[RawFuel]:
+        return self._fuels
+
+    @property
+    def by_type(self) -> Dict[str, list]:
+        return self._by_type
+
+    def register(self, power_plant_type: str, fuels: List[str]) -> None:
+        """
+        Declares (or replaces) the fuels supported by the provided power plant type.
+        :param power_plant_type: the power plant type.
+        :param fuels: the supported fuels, matched in the keys of the fuels dict.
+        """
+        self._fuels[:] = [fuel for fuel in self._fuels if fuel.type != power_plant_type] + \
+            [RawFuel(power_plant_type, list(fuels))]
+        self._by_type[power_plant_type] = list(fuels)
+        self._key_types = {}
+
+    def unregister(self, power_plant_type: str) -> None:
+        """
+        Removes the fuels supported by the provided power plant type, if any.
+        :param power_plant_type: the power plant type.
+        """
+        self._fuels[:] = [fuel for fuel in self._fuels if fuel.type != power_plant_type]
+        self._by_type.pop(power_plant_type, None)
+        self._key_types = {}
+
+    def key_types(self, key: str) -> Tuple[str, ...]:
+        """
+        Gives the power plant types using the fuel having the provided key: a type matches once for each of its
+        supported fuels found in the name of the key. Matched keys are cached.
+        :param key: the key.
+        :return: the matching power plant types.
+        """
+        key_types = self._key_types
+        types = key_types.get(key)
+        if types is None:
+            name, _ = parse_fuel_key(key)
+            types = tuple(fuel.type for fuel in self._fuels for supported_fuel in fuel.content
+                          if supported_fuel in name)
+            if len(key_types) >= MAX_FUEL_KEYS:
+                key_types.clear()
+            key_types[key] = types
+        return types
+
+
 FUELS = [
     RawFuel(GAS_FIRED, ['gas']),
     RawFuel(TURBOJET, ['kerosine']),
     RawFuel(WIND_TURBINE, ['wind'])
 ]
 
+# Default fuel table, the one of the registered power plant types of the application
+FUEL_TABLE = FuelTable(FUELS)
+
+# Supported fuels by power plant type
+FUELS_BY_TYPE = FUEL_TABLE.by_type
+
+
+def fuel_key_types(key: str) -> Tuple[str, ...]:
+    """
+    Gives the power plant types using the fuel having the provided key, in the default fuel table.
+    :param key: the key.
+    :return: the matching power plant types.
+    """
+    return FUEL_TABLE.key_types(key)
+
 
 class PowerPlant(BaseModel):
     """
@@ -52,10 +144,7 @@ class PowerPlant(BaseModel):
 
     @property
     def raw_fuels(self) -> Optional[list]:
-        for fuel in FUELS:
-            if self.type == fuel.type:
-                return fuel.content
-        return None
+        return FUELS_BY_TYPE.get(self.type)
 
 
 class Fuel:
@@ -76,20 +165,69 @@ class Fuel:
         return self._data
 
 
+class FuelIndex:
+    """
+    Class defining the fuels of a payload indexed by power plant type, matched with the provided fuel table (the
+    default one otherwise). It is built once per request, then the fuels of any power plant are found in constant time.
+    """
+
+    def __init__(self, incoming_fuels: Union[dict, List[Fuel]], fuel_table: Optional[FuelTable] = None):
+        if isinstance(incoming_fuels, dict):
+            incoming_fuels = [Fuel(name, data) for name, data in incoming_fuels.items()]
+        if fuel_table is None:
+            fuel_table = FUEL_TABLE
+
+        self._fuels: Dict[str, List[Fuel]] = {}
+        for fuel in incoming_fuels:
+            for power_plant_type in fuel_table.key_types(fuel.name):
+                self._fuels.setdefault(power_plant_type, []).append(fuel)
+
+    def fuels(self, power_plant_type: str) -> List[Fuel]:
+        """
+        Gives the fuels matching the provided power plant type.
+        :param power_plant_type: the power plant type.
+        :return: the matching fuels.
+        """
+        return self._fuels.get(power_plant_type, [])
+
+    def price(self, power_plant_type: str) -> Optional[float]:
+        """
+        Gives the price (or percentage) of the fuel used by the provided power plant type.
+        :param power_plant_type: the power plant type.
+        :return: the price if exactly one fuel matches, None otherwise.
+        """
+        fuels = self._fuels.get(power_plant_type)
+        if fuels is not None and len(fuels) == 1:
+            return fuels[0].data
+        return None
+
+
+def match_fuel_price(fuels: Union[dict, FuelIndex], power_plant_type: str) -> Optional[float]:
+    """
+    Finds the price (or percentage) of the fuel used by the provided power plant type, with the same matching rules
+    as EnrichedPowerPlant.
+    :param fuels: the fuels dict, as provided in the payload, or its index.
+    :param power_plant_type: the power plant type.
+    :return: the price if exactly one fuel matches, None otherwise.
+    """
+    if not isinstance(fuels, FuelIndex):
+        fuels = FuelIndex(fuels)
+    return fuels.price(power_plant_type)
+
+
 class EnrichedPowerPlant:
     """
     Class defining an enriched power plant. Such item is composed by the main PowerPlant instance and the list of
     matching fuels.
     """
 
-    def __init__(self, base_power_plant: PowerPlant, incoming_fuels: List[Fuel]):
+    def __init__(self, base_power_plant: PowerPlant, incoming_fuels: Union[List[Fuel], FuelIndex]):
         self._base = base_power_plant
-        self._fuels = []
 
-        for fuel in incoming_fuels:
-            for supportedFuel in base_power_plant.raw_fuels:
-                if supportedFuel in fuel.name:
-                    self._fuels.append(fuel)
+        # Index the fuels, unless already done for the whole request
+        if not isinstance(incoming_fuels, FuelIndex):
+            incoming_fuels = FuelIndex(incoming_fuels)
+        self._fuels = incoming_fuels.fuels(base_power_plant.type)
 
     @property
     def base(self) -> PowerPlant:
@@ -109,6 +247,118 @@ class Payload(BaseModel):
     powerplants: List[PowerPlant]
 
 
+class Scenario(BaseModel):
+    """
+    Class defining a scenario: the load and the fuels, without the power plants.
+    """
+    load: int
+    fuels: dict
+
+
+class PlanUpdate(BaseModel):
+    """
+    Class defining the delta applied to the last production plan of a fleet: the new load and/or the changed fuels.
+    """
+    load: Optional[int] = None
+    fuels: dict = {}
+
+
+class MarketUpdate(BaseModel):
+    """
+    Class defining a market update of a registered fleet: the changed fuels (prices and/or wind).
+    """
+    fuels: dict
+
+
+class BatchPayload(BaseModel):
+    """
+    Class defining the expected payload of a batch: one fleet of power plants with many scenarios.
+    """
+    powerplants: List[PowerPlant]
+    scenarios: List[Scenario]
+
+
+class LoadRange(BaseModel):
+    """
+    Class defining a range of loads (bounds included) with the fuels, as expected by the supply curve.
+    """
+    fuels: dict
+    start: int
+    stop: int
+    step: int = 1
+    plans: bool = False
+
+
+class SupplyCurvePayload(LoadRange):
+    """
+    Class defining the expected payload of the supply curve: the range of loads with the power plants.
+    """
+    powerplants: List[PowerPlant]
+
+
+class WindScenarios(BaseModel):
+    """
+    Class defining the wind uncertainty scenarios of a load: the wind percentage of each scenario is drawn from a
+    distribution ('normal' or 'beta', around the mean with the standard deviation, within 0 and 100) or given as
+    explicit samples, the other fuels being the same for all the scenarios. The mean defaults to the wind percentage
+    of the fuels.
+    """
+    load: int
+    fuels: dict
+    distribution: str = 'normal'
+    mean: Optional[float] = None
+    std: float = 10.0
+    samples: Optional[List[float]] = None
+    count: int = 1000
+    seed: Optional[int] = None
+    quantiles: List[float] = [5.0, 50.0, 95.0]
+
+
+class WindScenariosPayload(WindScenarios):
+    """
+    Class defining the expected payload of the wind uncertainty scenarios: the scenarios with the power plants.
+    """
+    powerplants: List[PowerPlant]
+
+
+class UnitConstraints(BaseModel):
+    """
+    Class defining the inter-temporal constraints of a thermal power plant (gas fired or turbojet), for the unit
+    commitment. The ramp limits are expressed in MW per period, None meaning unlimited.
+    """
+    name: str
+    startup_cost: float = 0.0
+    ramp_up: Optional[float] = None
+    ramp_down: Optional[float] = None
+    min_up: int = 1
+    min_down: int = 1
+
+
+class UnitState(BaseModel):
+    """
+    Class defining the state of a thermal power plant at the end of a horizon (e.g. the previous day): running or
+    not, for how many periods, and its power (in tenth of MW, as in the ResponseEntry).
+    """
+    name: str
+    on: bool
+    periods: int = 1
+    p: int = 0
+
+
+class UnitCommitmentPayload(BaseModel):
+    """
+    Class defining the expected payload of the unit commitment: the power plants, the periods of the horizon (load and
+    fuels), the constraints of the thermal power plants and optionally the outcome of the previous horizon (the final
+    states and the multipliers) to start from.
+    """
+    powerplants: List[PowerPlant]
+    periods: List[Scenario]
+    period_hours: float = 1.0
+    constraints: List[UnitConstraints] = []
+    initial: List[UnitState] = []
+    multipliers: Optional[List[float]] = None
+
+
 class ResponseEntry:
     """
     Class defining an entry for the response.
@@ -0,0 +1,175 @@
+"""
+This module contains the columnar representation of a fleet of power plants.
+"""
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, PowerPlant
+
+# Compact codes of the power plant types (-1 for an unknown type)
+TYPE_CODES = {WIND_TURBINE: 0, GAS_FIRED: 1, TURBOJET: 2}
+
+
+def fleet_fingerprint(power_plants: Iterable[tuple]) -> str:
+    """
+    Computes a canonical hash of a fleet, which doesn't depend on the order of the power plants.
+    :param power_plants: the power plants as (name, type, efficiency, pmin, pmax) tuples.
+    :return: the hexadecimal hash.
+    """
+    canonical = sorted((name, type, float(efficiency), int(pmin), int(pmax))
+                       for name, type, efficiency, pmin, pmax in power_plants)
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+
+class Fleet:
+    """
+    Class defining a fleet of power plants stored as columns (one array per attribute) instead of one object per
+    power plant. The power plants keep the order in which they were provided.
+    """
+
+    def __init__(self, power_plants: List[PowerPlant]):
+        self._build([power_plant.name for power_plant in power_plants],
+                    [power_plant.type for power_plant in power_plants],
+                    [power_plant.efficiency for power_plant in power_plants],
+                    [power_plant.pmin for power_plant in power_plants],
+                    [power_plant.pmax for power_plant in power_plants])
+
+    @classmethod
+    def from_columns(cls, names: List[str], types: List[str], efficiency: Iterable[float], pmin: Iterable[int],
+                     pmax: Iterable[int]) -> 'Fleet':
+        """
+        Builds a fleet directly from its columns, without PowerPlant objects.
+        :param names: the names of the power plants.
+        :param types: the types of the power plants.
+        :param efficiency: the efficiency of the power plants.
+        :param pmin: the minimum power of the power plants.
+        :param pmax: the maximum power of the power plants.
+        :return: the fleet.
+        """
+        fleet = cls.__new__(cls)
+        fleet._build(list(names), list(types), efficiency, pmin, pmax)
+        return fleet
+
+    @classmethod
+    def from_arrays(cls, names: List[str], types: List[str], efficiency: np.ndarray, pmin: np.ndarray,
+                    pmax: np.ndarray, type_codes: np.ndarray, indexes: Dict[str, np.ndarray],
+                    columns: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                    fingerprint: Optional[str] = None) -> 'Fleet':
+        """
+        Builds a fleet from its columns and its fields by type computed beforehand. The arrays are kept as they are,
+        not copied (they may be mapped from a file shared by several processes).
+        :param names: the names of the power plants.
+        :param types: the types of the power plants.
+        :param efficiency: the efficiency of the power plants (float64).
+        :param pmin: the minimum power of the power plants (int64).
+        :param pmax: the maximum power of the power plants (int64).
+        :param type_codes: the type codes of the power plants (int8, see TYPE_CODES).
+        :param indexes: the positions of the power plants by type.
+        :param columns: the efficiency, the minimum and the maximum power of the power plants by type.
+        :param fingerprint: the fingerprint of the fleet, if known.
+        :return: the fleet.
+        """
+        fleet = cls.__new__(cls)
+        fleet._names = names
+        fleet._types = types
+        fleet._name_array = np.array(names, dtype=object)
+        fleet._efficiency = efficiency
+        fleet._pmin = pmin
+        fleet._pmax = pmax
+        fleet._indexes = indexes
+        fleet._type_codes = type_codes
+        fleet._columns = columns
+        fleet._fingerprint = fingerprint
+        return fleet
+
+    def _build(self, names: List[str], types: List[str], efficiency: Iterable[float], pmin: Iterable[int],
+               pmax: Iterable[int]) -> None:
+        self._names = names
+        self._types = types
+        self._name_array = np.array(self._names, dtype=object)
+        self._efficiency = np.asarray(efficiency, dtype=np.float64)
+        self._pmin = np.asarray(pmin, dtype=np.int64)
+        self._pmax = np.asarray(pmax, dtype=np.int64)
+
+        # Positions of the power plants by type, the types being numbered in order of appearance
+        distinct_types = {power_plant_type: number for number, power_plant_type in enumerate(dict.fromkeys(types))}
+        numbers = np.fromiter(map(distinct_types.__getitem__, types), dtype=np.int64, count=len(types))
+        self._indexes = {power_plant_type: np.flatnonzero(numbers == number)
+                         for power_plant_type, number in distinct_types.items()}
+        self._type_codes = np.array([TYPE_CODES.get(power_plant_type, -1) for power_plant_type in distinct_types],
+                                    dtype=np.int8)[numbers] if types else np.zeros(0, dtype=np.int8)
+
+        # Static fields of the power plants by type, computed once
+        self._columns = {key: (self._efficiency[index], self._pmin[index], self._pmax[index])
+                         for key, index in self._indexes.items()}
+        self._fingerprint: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def names(self) -> List[str]:
+        return self._names
+
+    @property
+    def name_array(self) -> np.ndarray:
+        return self._name_array
+
+    @property
+    def types(self) -> List[str]:
+        return self._types
+
+    @property
+    def type_codes(self) -> np.ndarray:
+        return self._type_codes
+
+    @property
+    def efficiency(self) -> np.ndarray:
+        return self._efficiency
+
+    @property
+    def pmin(self) -> np.ndarray:
+        return self._pmin
+
+    @property
+    def pmax(self) -> np.ndarray:
+        return self._pmax
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        The canonical hash of the fleet (see fleet_fingerprint), computed on first use.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fleet_fingerprint(zip(self._names, self._types, self._efficiency.tolist(),
+                                                      self._pmin.tolist(), self._pmax.tolist()))
+        return self._fingerprint
+
+    def summary(self) -> Dict[str, int]:
+        """
+        Gives the count of power plants by type.
+        :return: the counts.
+        """
+        return {key: len(index) for key, index in self._indexes.items()}
+
+    def index(self, power_plant_type: str) -> np.ndarray:
+        """
+        Gives the positions of the power plants having the provided type.
+        :param power_plant_type: the power plant type.
+        :return: the positions, in the fleet order.
+        """
+        return self._indexes.get(power_plant_type, np.empty(0, dtype=np.int64))
+
+    def columns(self, power_plant_type: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Gives the efficiency, the minimum and the maximum power of the power plants having the provided type.
+        :param power_plant_type: the power plant type.
+        :return: the three arrays, in the fleet order.
+        """
+        columns = self._columns.get(power_plant_type)
+        if columns is None:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return columns
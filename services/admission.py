@@ -0,0 +1,177 @@
+"""
+This module contains the admission control of the application: a bounded count of requests are computed at once, a
+bounded count of requests wait for their turn, and the other ones are rejected right away instead of letting the
+latency grow without limit.
+
+The requests of the event loop wait for their turn with admit_async, without holding a thread: the bound of the queue
+then applies to them, not to the work queue of the thread pool. The threads and the coroutines share the same queue,
+and are admitted in their arrival order.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Iterator, Optional
+
+# Default count of requests computed at once
+DEFAULT_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', os.cpu_count() or 1))
+# Default count of requests waiting for their turn (0 rejects any request arriving when all the slots are taken)
+DEFAULT_MAX_WAITING = int(os.environ.get('ADMISSION_MAX_WAITING', 64))
+# Default maximum waiting time, in seconds
+DEFAULT_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 5))
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    """
+    A request waiting for a slot: a thread, woken by its event, or a coroutine, woken by its future.
+    """
+    __slots__ = ('_event', '_loop', '_future')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self._event = threading.Event() if loop is None else None
+        self._loop = loop
+        self._future = None if loop is None else loop.create_future()
+
+    @property
+    def future(self) -> Optional[asyncio.Future]:
+        return self._future
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+    def grant(self) -> None:
+        if self._future is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(_grant, self._future)
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted: the queue is full, or its turn would come too late.
+    """
+    pass
+
+
+class AdmissionControl:
+    """
+    Bounded admission queue. A request waits at most until its deadline (or the maximum waiting time): there is no
+    point in starting a computation whose answer would come after the deadline anyway.
+    """
+
+    def __init__(self, max_active: int = DEFAULT_MAX_ACTIVE, max_waiting: int = DEFAULT_MAX_WAITING,
+                 max_wait: float = DEFAULT_MAX_WAIT) -> None:
+        self._max_active = max(max_active, 1)
+        self._max_waiting = max(max_waiting, 0)
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        # Threads and coroutines waiting for a slot, in arrival order: a released slot is handed over to the first one
+        self._waiters: Deque[_Waiter] = deque()
+        self._active = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """
+        Takes a free slot, unless other requests are already waiting for one, or queues the request.
+        :param loop: the event loop of the request, None for a thread.
+        :return: None if admitted, the waiter otherwise.
+        :raise Overloaded: if the queue is full.
+        """
+        with self._lock:
+            if self._active < self._max_active and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return None
+            if len(self._waiters) >= self._max_waiting:
+                self._rejected += 1
+                raise Overloaded('The admission queue is full')
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _timeout(self, deadline: Optional[float]) -> float:
+        return max(self._max_wait if deadline is None else min(self._max_wait, deadline - time.monotonic()), 0)
+
+    @contextmanager
+    def admit(self, deadline: Optional[float] = None) -> Iterator[None]:
+        """
+        Context manager holding a slot while the request is computed.
+        :param deadline: the deadline of the request (time.monotonic), None to wait the maximum waiting time.
+        :raise Overloaded: if the request is rejected.
+        """
+        waiter = self._enter(None)
+        if waiter is not None:
+            waiter.wait(self._timeout(deadline))
+            if self._withdraw(waiter):
+                raise Overloaded('No slot before the deadline')
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def admit_async(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Coroutine counterpart of admit, for the callers running in the event loop: a waiting request holds no thread.
+        :param deadline: the deadline of the request (time.monotonic), None to wait the maximum waiting time.
+        :raise Overloaded: if the request is rejected.
+        """
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._timeout(deadline))
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                # Cancelled (e.g. the client is gone): a slot handed over in the meantime is given back
+                if not self._withdraw(waiter, False):
+                    self._release()
+                raise
+            if self._withdraw(waiter):
+                raise Overloaded('No slot before the deadline')
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _withdraw(self, waiter: _Waiter, rejected: bool = True) -> bool:
+        """
+        Removes the provided waiter from the queue.
+        :param rejected: whether a waiter still waiting counts as rejected.
+        :return: True if it was still waiting, False if it was handed over a slot.
+        """
+        with self._lock:
+            if waiter not in self._waiters:
+                return False
+            self._waiters.remove(waiter)
+            if rejected:
+                self._rejected += 1
+            return True
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                # The slot is handed over to the first waiting request: the count of active requests is unchanged
+                self._waiters.popleft().grant()
+                self._admitted += 1
+            else:
+                self._active -= 1
+
+    def stats(self) -> dict:
+        """
+        Gives the counters of the admission control.
+        :return: the counters.
+        """
+        with self._lock:
+            return {'active': self._active, 'waiting': len(self._waiters), 'max_active': self._max_active,
+                    'max_waiting': self._max_waiting, 'admitted': self._admitted, 'rejected': self._rejected}
@@ -0,0 +1,426 @@
+"""
+This module contains the audit log of the application: every production plan served is kept, with its inputs, in a
+SQLite database. The requests only push the plans onto a bounded queue; a background writer hashes, encodes and writes
+them by batches (WAL journal, synced periodically), so that the disk latency stays out of the requests.
+
+When the writer falls behind and its queue is full, the plans are dropped (counted and logged as errors) unless asked
+otherwise: the request may wait a little for some room, or spill the plan to an append only file, written to the
+database once the writer caught up. The event loop never waits nor writes: it hands these plans over to the thread
+pool.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Collection, List, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from domain.engie_objects import PowerPlant, ResponseEntry
+from domain.fleet import Fleet, fleet_fingerprint
+from services.instrumentation import Instrumentation, log_event
+
+# Path of the audit database (empty to disable the audit log)
+DEFAULT_AUDIT_DATABASE = os.environ.get('AUDIT_DATABASE', '')
+# Maximum count of plans waiting to be written (see AUDIT_OVERFLOW for the next ones)
+DEFAULT_AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+# Maximum count of plans written in one transaction
+DEFAULT_AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+# Interval between two syncs of the database to the disk, in seconds
+DEFAULT_AUDIT_SYNC_INTERVAL = float(os.environ.get('AUDIT_SYNC_INTERVAL', 1))
+
+# Behaviours on a full queue: the plan is dropped, waited for (at most AUDIT_BLOCK_TIMEOUT, then dropped), or spilled
+DROP = 'drop'
+BLOCK = 'block'
+SPILL = 'spill'
+OVERFLOWS = (DROP, BLOCK, SPILL)
+DEFAULT_AUDIT_OVERFLOW = os.environ.get('AUDIT_OVERFLOW', DROP)
+# Maximum time a request waits for some room in the queue, in seconds
+DEFAULT_AUDIT_BLOCK_TIMEOUT = float(os.environ.get('AUDIT_BLOCK_TIMEOUT', 0.1))
+
+# Suffixes of the spill file (next to the database) and of the spilled plans being written
+SPILL_SUFFIX = '.spill'
+REPLAY_SUFFIX = '.replay'
+
+# Maximum count of plans given by a query
+MAX_QUERY_LIMIT = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fleets (
+    fingerprint TEXT PRIMARY KEY,
+    powerplants TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    key TEXT NOT NULL,
+    fleet TEXT NOT NULL,
+    fleet_id TEXT,
+    load INTEGER NOT NULL,
+    fuels TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    optimal INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plans_created ON plans (created);
+CREATE INDEX IF NOT EXISTS plans_fleet ON plans (fleet, created);
+CREATE INDEX IF NOT EXISTS plans_fleet_id ON plans (fleet_id, created);
+CREATE INDEX IF NOT EXISTS plans_key ON plans (key);
+CREATE TABLE IF NOT EXISTS replays (
+    file TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+'''
+
+# Marker asking the writer to stop
+STOP = object()
+
+
+def encode_item(item: tuple, known: Collection[str] = ()) -> Tuple[Tuple[str, Optional[str]], tuple]:
+    """
+    Encodes a queued plan into the rows of the database.
+    :param item: the queued plan.
+    :param known: the fingerprints of the fleets already written, whose power plants aren't encoded again.
+    :return: the row of its fleet (fingerprint and power plants, None if known) and its own row.
+    """
+    created, key, load, fuels, plan, fleet, fleet_id, optimal = item
+    if isinstance(fleet, Fleet):
+        fingerprint = fleet.fingerprint
+        columns = zip(fleet.names, fleet.types, fleet.efficiency.tolist(), fleet.pmin.tolist(), fleet.pmax.tolist())
+    else:
+        columns = [(p.name, p.type, p.efficiency, p.pmin, p.pmax) for p in fleet]
+        fingerprint = fleet_fingerprint(columns)
+    power_plants = None if fingerprint in known else \
+        json.dumps([dict(zip(('name', 'type', 'efficiency', 'pmin', 'pmax'), power_plant)) for power_plant in columns])
+    if isinstance(plan, bytes):
+        plan = plan.decode()
+    else:
+        plan = json.dumps([{'name': entry.name, 'p': entry.p} for entry in plan])
+    return (fingerprint, power_plants), (created, key, fingerprint, fleet_id, load, json.dumps(fuels), plan,
+                                         int(optimal))
+
+
+class AuditLog:
+    """
+    Append only audit log of the production plans.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_AUDIT_DATABASE, max_queue: int = DEFAULT_AUDIT_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_AUDIT_BATCH_SIZE, sync_interval: float = DEFAULT_AUDIT_SYNC_INTERVAL,
+                 overflow: str = DEFAULT_AUDIT_OVERFLOW, block_timeout: float = DEFAULT_AUDIT_BLOCK_TIMEOUT,
+                 instrumentation: Optional[Instrumentation] = None) -> None:
+        if overflow not in OVERFLOWS:
+            raise ValueError(f'Invalid audit overflow: {overflow} (expected one of {", ".join(OVERFLOWS)})')
+        self._path = path or None
+        self._queue: queue.Queue = queue.Queue(max(max_queue, 1))
+        self._batch_size = max(batch_size, 1)
+        self._sync_interval = sync_interval
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        # The dropped plans are counted as errors of the application too
+        self._instrumentation = instrumentation
+        self._lock = threading.Lock()
+        # Serializes the appends to the spill file and its hand over to the writer
+        self._spill_lock = threading.Lock()
+        self._counters = {'recorded': 0, 'written': 0, 'dropped': 0, 'spilled': 0, 'batches': 0, 'failed': 0}
+        self._thread: Optional[threading.Thread] = None
+        if self._path is not None:
+            with self._connect() as connection:
+                connection.executescript(SCHEMA)
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def overflow(self) -> str:
+        return self._overflow
+
+    @property
+    def spill_path(self) -> Optional[str]:
+        return None if self._path is None else self._path + SPILL_SUFFIX
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # The commits don't wait for the disk, the periodic checkpoints do
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def record(self, key: str, load: int, fuels: dict, plan: Union[List[ResponseEntry], bytes],
+               fleet: Union[Fleet, List[PowerPlant]], fleet_id: Optional[str] = None, optimal: bool = True) -> bool:
+        """
+        Pushes the provided plan onto the queue of the writer. On a full queue, the plan is dropped, waited for or
+        spilled, depending on the overflow behaviour: the caller may wait, it must not be the event loop (see
+        record_async).
+        :param key: the key of the plan (hash of the payload).
+        :param load: the load.
+        :param fuels: the fuels dict.
+        :param plan: the plan, or the encoded plan (JSON bytes).
+        :param fleet: the fleet, or the power plants of the payload.
+        :param fleet_id: the id of the registered fleet, if any.
+        :param optimal: whether the plan is proven optimal.
+        :return: True if queued (or spilled), False if the audit log is disabled or the plan is dropped.
+        """
+        if self._thread is None:
+            return False
+        item = (time.time(), key, load, fuels, plan, fleet, fleet_id, optimal)
+        return self._offer(item) or self._overflow_item(item)
+
+    async def record_async(self, key: str, load: int, fuels: dict, plan: Union[List[ResponseEntry], bytes],
+                           fleet: Union[Fleet, List[PowerPlant]], fleet_id: Optional[str] = None,
+                           optimal: bool = True) -> bool:
+        """
+        Coroutine counterpart of record, for the event loop: the plan is pushed without waiting, the wait for some
+        room in the queue or the spill of the plan being done in the thread pool.
+        :return: True if queued (or spilled), False if the audit log is disabled or the plan is dropped.
+        """
+        if self._thread is None:
+            return False
+        item = (time.time(), key, load, fuels, plan, fleet, fleet_id, optimal)
+        if self._offer(item):
+            return True
+        if self._overflow == DROP:
+            return self._drop(item)
+        return await run_in_threadpool(self._overflow_item, item)
+
+    def _offer(self, item: tuple) -> bool:
+        """
+        Pushes the provided plan onto the queue, without waiting.
+        :return: True if queued, False if the queue is full.
+        """
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return False
+        with self._lock:
+            self._counters['recorded'] += 1
+        return True
+
+    def _overflow_item(self, item: tuple) -> bool:
+        """
+        Handles the provided plan, which didn't fit in the queue, with the overflow behaviour. May wait, or write to
+        the disk.
+        :return: True if queued (or spilled), False if dropped.
+        """
+        if self._overflow == BLOCK:
+            try:
+                self._queue.put(item, timeout=self._block_timeout)
+            except queue.Full:
+                return self._drop(item)
+            with self._lock:
+                self._counters['recorded'] += 1
+            return True
+        if self._overflow == SPILL and self._spill(item):
+            return True
+        return self._drop(item)
+
+    def _drop(self, item: tuple) -> bool:
+        """
+        Drops the provided plan, counted and logged as an error.
+        :return: False.
+        """
+        with self._lock:
+            self._counters['dropped'] += 1
+        if self._instrumentation is not None:
+            self._instrumentation.increment('audit_dropped')
+        log_event(logging.ERROR, 'audit_dropped', key=item[1])
+        return False
+
+    def _spill(self, item: tuple) -> bool:
+        """
+        Appends the provided plan to the spill file, as a JSON line.
+        :return: True if written.
+        """
+        fleet, row = encode_item(item)
+        line = json.dumps({'fleet': fleet, 'plan': row}) + '\n'
+        try:
+            with self._spill_lock, open(self.spill_path, 'a') as file:
+                file.write(line)
+        except OSError as error:
+            log_event(logging.ERROR, 'audit_spill_failed', error=str(error))
+            return False
+        with self._lock:
+            self._counters['spilled'] += 1
+        return True
+
+    def _run(self) -> None:
+        connection = self._connect()
+        fingerprints = set()
+        synced = time.monotonic()
+        running = True
+        # The plans spilled before a restart are written first
+        self._replay(connection, fingerprints)
+        while running:
+            try:
+                items = [self._queue.get(timeout=self._sync_interval)]
+            except queue.Empty:
+                items = []
+            # Everything already waiting joins the batch
+            while items and len(items) < self._batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [item for item in items if item is not STOP]
+            running = len(batch) == len(items)
+            if batch:
+                self._write(connection, [encode_item(item, fingerprints) for item in batch], fingerprints)
+            # Caught up: the plans spilled meanwhile are written too
+            if self._overflow == SPILL and self._queue.empty():
+                self._replay(connection, fingerprints)
+            if time.monotonic() - synced >= self._sync_interval or not running:
+                connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                synced = time.monotonic()
+            for _ in items:
+                self._queue.task_done()
+        connection.close()
+
+    def _replay(self, connection: sqlite3.Connection, fingerprints: set) -> None:
+        """
+        Writes the spilled plans, by batches. The spill file is handed over first, so that the requests spill into a
+        new one meanwhile. The file is streamed, the offset of the next line being written with each batch: a hand
+        over which couldn't be written is written again next time from there, without writing any plan twice.
+        """
+        replay_path = self.spill_path + REPLAY_SUFFIX
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        # The hand over is never written to again: it is identified by its inode, its size and its modification time
+        status = os.stat(replay_path)
+        replay = f'{status.st_ino}:{status.st_size}:{status.st_mtime_ns}'
+        row = connection.execute('SELECT offset FROM replays WHERE file = ?', (replay,)).fetchone()
+        with open(replay_path, 'rb') as file:
+            file.seek(0 if row is None else row[0])
+            encoded = []
+            for line in file:
+                # A line cut short by a crash is skipped
+                try:
+                    spilled = json.loads(line)
+                except ValueError:
+                    continue
+                encoded.append((tuple(spilled['fleet']), tuple(spilled['plan'])))
+                if len(encoded) == self._batch_size:
+                    if not self._write(connection, encoded, fingerprints, (replay, file.tell())):
+                        return
+                    encoded = []
+            if encoded and not self._write(connection, encoded, fingerprints, (replay, file.tell())):
+                return
+        os.remove(replay_path)
+        with connection:
+            connection.execute('DELETE FROM replays')
+
+    def _write(self, connection: sqlite3.Connection, batch: List[Tuple[Tuple[str, Optional[str]], tuple]],
+               fingerprints: set, replay: Optional[Tuple[str, int]] = None) -> bool:
+        """
+        Writes the provided encoded plans in one transaction, with the fleets not written yet.
+        :param replay: the spill file hand over the plans come from, and the offset of its next plan.
+        :return: True if written.
+        """
+        fleets = []
+        rows = []
+        for fleet, row in batch:
+            if fleet[1] is not None and fleet[0] not in fingerprints:
+                fingerprints.add(fleet[0])
+                fleets.append(fleet)
+            rows.append(row)
+        try:
+            with connection:
+                connection.executemany('INSERT OR IGNORE INTO fleets VALUES (?, ?)', fleets)
+                connection.executemany('INSERT INTO plans (created, key, fleet, fleet_id, load, fuels, plan, optimal) '
+                                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                if replay is not None:
+                    connection.execute('INSERT OR REPLACE INTO replays VALUES (?, ?)', replay)
+        except sqlite3.Error as error:
+            fingerprints.difference_update(fingerprint for fingerprint, _ in fleets)
+            with self._lock:
+                self._counters['failed'] += len(rows)
+            log_event(logging.ERROR, 'audit_failed', error=str(error), count=len(rows))
+            return False
+        with self._lock:
+            self._counters['written'] += len(rows)
+            self._counters['batches'] += 1
+        return True
+
+    def flush(self) -> None:
+        """
+        Waits until every queued plan is written.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        Writes the queued plans, then stops the writer.
+        """
+        if self._thread is not None:
+            self._queue.put(STOP)
+            self._thread.join()
+            self._thread = None
+
+    def query(self, fleet: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              key: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """
+        Gives the written plans, the most recent first.
+        :param fleet: the fingerprint of the fleet, or the id of the registered fleet.
+        :param since: the earliest time (seconds since the epoch).
+        :param until: the latest time (seconds since the epoch).
+        :param key: the key of the plan.
+        :param limit: the maximum count of plans (at most MAX_QUERY_LIMIT).
+        :return: the plans, with their inputs.
+        :raise ValueError: if the audit log is disabled.
+        """
+        if self._path is None:
+            raise ValueError('The audit log is disabled')
+        conditions, parameters = [], []
+        if fleet is not None:
+            conditions.append('(fleet = ? OR fleet_id = ?)')
+            parameters += [fleet, fleet]
+        if since is not None:
+            conditions.append('created >= ?')
+            parameters.append(since)
+        if until is not None:
+            conditions.append('created <= ?')
+            parameters.append(until)
+        if key is not None:
+            conditions.append('key = ?')
+            parameters.append(key)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        parameters.append(min(max(limit, 0), MAX_QUERY_LIMIT))
+
+        connection = sqlite3.connect(self._path)
+        try:
+            rows = connection.execute('SELECT created, key, fleet, fleet_id, load, fuels, plan, optimal FROM plans'
+                                      f'{where} ORDER BY created DESC, id DESC LIMIT ?', parameters).fetchall()
+        finally:
+            connection.close()
+        return [{'created': created, 'key': plan_key, 'fleet': fingerprint, 'fleet_id': fleet_id, 'load': load,
+                 'fuels': json.loads(fuels), 'plan': json.loads(plan), 'optimal': bool(optimal)}
+                for created, plan_key, fingerprint, fleet_id, load, fuels, plan, optimal in rows]
+
+    def fleet(self, fingerprint: str) -> Optional[List[dict]]:
+        """
+        Gives the power plants of the fleet having the provided fingerprint.
+        :param fingerprint: the fingerprint.
+        :return: the power plants, None if unknown.
+        """
+        if self._path is None:
+            raise ValueError('The audit log is disabled')
+        connection = sqlite3.connect(self._path)
+        try:
+            row = connection.execute('SELECT powerplants FROM fleets WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        finally:
+            connection.close()
+        return None if row is None else json.loads(row[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'enabled': self.enabled, 'queued': self._queue.qsize(), **self._counters}
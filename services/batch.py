@@ -0,0 +1,161 @@
+"""
+This module contains the batch services of the application: many scenarios are planned at once, costs and available
+power being computed as arrays across all the scenarios.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import FuelIndex, Payload, ResponseEntry, Scenario
+from domain.fleet import Fleet
+from services.plant_types import PLANT_TYPES, PlantTypeRegistry
+from services.strategy import BatchProcessResult
+
+
+def rank(result: BatchProcessResult) -> np.ndarray:
+    """
+    Ranks the power plants of each scenario based on the computed order (ties keep the fleet order).
+    :param result: the columnar process result.
+    :return: the ranked positions (scenarios x power plants).
+    """
+    return np.argsort(result.order, axis=1, kind='stable')
+
+
+class TypeDispatch:
+    """
+    Class defining the dispatch of the power plants of one type, for many scenarios: their positions in the fleet,
+    their process result, their ranks (scenarios x power plants, indexes in the positions) and their dispatched power
+    (scenarios x power plants, in ranked order).
+    """
+    __slots__ = ('positions', 'result', 'ranks', 'dispatched')
+
+    def __init__(self, positions: np.ndarray, result: BatchProcessResult, ranks: np.ndarray, dispatched: np.ndarray):
+        self.positions = positions
+        self.result = result
+        self.ranks = ranks
+        self.dispatched = dispatched
+
+    def fleet_order(self) -> np.ndarray:
+        """
+        Gives the dispatched power in the fleet order of the power plants of the type.
+        :return: the dispatched power (scenarios x power plants).
+        """
+        dispatched = np.zeros(self.dispatched.shape, dtype=np.int64)
+        np.put_along_axis(dispatched, self.ranks, self.dispatched, 1)
+        return dispatched
+
+
+class BatchPlanner:
+    """
+    Planner computing the production plans of many scenarios sharing the same fleet, driven by the registry of the
+    power plant types. It gives the same plans as the '/productionplan' endpoint, one scenario at a time.
+    """
+
+    def __init__(self, plant_types: Optional[PlantTypeRegistry] = None) -> None:
+        self._plant_types = PLANT_TYPES if plant_types is None else plant_types
+
+    @property
+    def plant_types(self) -> PlantTypeRegistry:
+        return self._plant_types
+
+    @staticmethod
+    def _prices(fuels: List[FuelIndex], power_plant_type: str) -> np.ndarray:
+        prices = [fuel_index.price(power_plant_type) for fuel_index in fuels]
+        return np.array([np.nan if price is None else price for price in prices], dtype=np.float64)
+
+    def dispatch(self, fleet: Fleet, prices: Dict[str, np.ndarray],
+                 load: np.ndarray) -> Tuple[List[TypeDispatch], np.ndarray]:
+        """
+        Dispatches the load of many scenarios at once.
+        :param fleet: the fleet of power plants.
+        :param prices: the fuel data (price or wind percentage) of each scenario, by power plant type (NaN when no
+        single fuel matches, or when the type is missing).
+        :param load: the load of each scenario, in tenth of MW.
+        :return: the dispatch of each registered power plant type (in dispatch order: wind turbines, gas fired, then
+        turbojets by default) and the load not served of each scenario.
+        """
+        missing = np.full(len(load), np.nan)
+        remaining_load = load.astype(np.int64)
+        type_dispatches = []
+        # Dispatch the load type by type, each with its own strategy and dispatcher
+        for plant_type in self._plant_types.types:
+            type_prices = prices.get(plant_type.name, missing)
+            efficiency, pmin, pmax = fleet.columns(plant_type.name)
+            result = plant_type.strategy.compute_batch(efficiency, pmin, pmax, type_prices)
+            ranks = rank(result)
+            dispatched = plant_type.dispatcher.dispatch_batch(result, ranks, type_prices, remaining_load)
+            remaining_load = remaining_load - dispatched.sum(axis=1)
+            type_dispatches.append(TypeDispatch(fleet.index(plant_type.name), result, ranks, dispatched))
+
+        return type_dispatches, remaining_load
+
+    def dispatch_fleet(self, fleet: Fleet, prices: Dict[str, np.ndarray],
+                       load: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Same as dispatch, with the outcome in the fleet order.
+        :param fleet: the fleet of power plants.
+        :param prices: the fuel data of each scenario, by power plant type (see dispatch).
+        :param load: the load of each scenario, in tenth of MW.
+        :return: the dispatched power (scenarios x power plants, in the fleet order), the cost (per hour) and the load
+        not served of each scenario.
+        """
+        type_dispatches, remaining_load = self.dispatch(fleet, prices, load)
+        dispatched = np.zeros((len(load), len(fleet)), dtype=np.int64)
+        cost = np.zeros(len(load))
+        for type_dispatch in type_dispatches:
+            type_dispatched = type_dispatch.fleet_order()
+            dispatched[:, type_dispatch.positions] = type_dispatched
+            cost += (type_dispatch.result.cost * type_dispatched).sum(axis=1)
+        # The power is expressed in tenth of MW
+        return dispatched, cost / 10, remaining_load
+
+    def plan(self, fleet: Fleet, scenarios: List[Scenario]) -> List[List[ResponseEntry]]:
+        """
+        Computes the production plans of the provided scenarios.
+        :param fleet: the fleet of power plants.
+        :param scenarios: the scenarios (load and fuels).
+        :return: one list of ResponseEntry per scenario.
+        """
+        if not scenarios:
+            return []
+
+        # Resolve the fuels of each scenario once for all the power plant types
+        fuels = [FuelIndex(scenario.fuels, self._plant_types.fuel_table) for scenario in scenarios]
+        prices = {plant_type.name: self._prices(fuels, plant_type.name) for plant_type in self._plant_types.types}
+        # Align the remaining load with the expected output unit
+        load = np.array([scenario.load for scenario in scenarios], dtype=np.int64) * 10
+        type_dispatches, _ = self.dispatch(fleet, prices, load)
+
+        # Build the responses, with the names of the ranked power plants
+        ranked_names = [(fleet.name_array[type_dispatch.positions][type_dispatch.ranks],
+                         type_dispatch.dispatched.tolist()) for type_dispatch in type_dispatches]
+        responses = []
+        for s in range(len(scenarios)):
+            response = []
+            for type_names, type_dispatched in ranked_names:
+                for name, p in zip(type_names[s], type_dispatched[s]):
+                    response.append(ResponseEntry(name, p))
+            responses.append(response)
+
+        return responses
+
+    def plan_payloads(self, payloads: List[Payload]) -> List[List[ResponseEntry]]:
+        """
+        Computes the production plans of the provided payloads. The payloads sharing the same fleet are planned
+        together.
+        :param payloads: the payloads.
+        :return: one list of ResponseEntry per payload, in the same order.
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for i, payload in enumerate(payloads):
+            key = tuple((p.name, p.type, p.efficiency, p.pmin, p.pmax) for p in payload.powerplants)
+            groups.setdefault(key, []).append(i)
+
+        responses: List[Optional[List[ResponseEntry]]] = [None] * len(payloads)
+        for indexes in groups.values():
+            fleet = Fleet(payloads[indexes[0]].powerplants)
+            scenarios = [Scenario.construct(load=payloads[i].load, fuels=payloads[i].fuels) for i in indexes]
+            for i, response in zip(indexes, self.plan(fleet, scenarios)):
+                responses[i] = response
+
+        return responses
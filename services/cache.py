@@ -0,0 +1,136 @@
+"""
+This module contains the cache of production plans of the application.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple, Union
+
+from domain.engie_objects import Payload, ResponseEntry
+from domain.fleet import fleet_fingerprint
+
+# Default maximum count of cached plans (0 disables the cache)
+DEFAULT_CACHE_SIZE = int(os.environ.get('PLAN_CACHE_SIZE', 1024))
+# Default time to live of the cached plans, in seconds
+DEFAULT_CACHE_TTL = float(os.environ.get('PLAN_CACHE_TTL', 300))
+
+
+def plan_key(fingerprint: str, load: int, fuels: dict) -> str:
+    """
+    Computes the canonical key of a production plan request.
+    :param fingerprint: the fingerprint of the fleet.
+    :param load: the load.
+    :param fuels: the fuels dict.
+    :return: the hexadecimal key.
+    """
+    canonical_fuels = sorted((name, float(value) if isinstance(value, (int, float)) else value)
+                             for name, value in fuels.items())
+    canonical = json.dumps([fingerprint, int(load), canonical_fuels])
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def payload_key(payload: Payload) -> str:
+    """
+    Computes the canonical key of a payload: two payloads only differing by the order of their power plants or
+    fuels share the same key.
+    :param payload: the payload.
+    :return: the hexadecimal key.
+    """
+    fingerprint = fleet_fingerprint((p.name, p.type, p.efficiency, p.pmin, p.pmax) for p in payload.powerplants)
+    return plan_key(fingerprint, payload.load, payload.fuels)
+
+
+def _copy(plan: Union[List[ResponseEntry], bytes]) -> Union[List[ResponseEntry], bytes]:
+    # The lists are copied, so that the callers can't change the cached plans; the encoded plans are immutable
+    return plan if isinstance(plan, bytes) else list(plan)
+
+
+class PlanCache:
+    """
+    Bounded cache of production plans, with least recently used eviction and a time to live.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def get(self, key: str) -> Optional[Union[List[ResponseEntry], bytes]]:
+        """
+        Gives the cached plan having the provided key.
+        :param key: the key.
+        :return: the plan, None if not cached or expired.
+        """
+        entry = self.lookup(key)
+        return None if entry is None else entry[0]
+
+    def lookup(self, key: str) -> Optional[Tuple[Union[List[ResponseEntry], bytes], bool]]:
+        """
+        Gives the cached plan having the provided key, with its optimality.
+        :param key: the key.
+        :return: the plan and whether it was proven optimal, None if not cached or expired.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, plan, optimal = entry
+                if expiry > self._clock():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return _copy(plan), optimal
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, key: str, plan: Union[List[ResponseEntry], bytes], optimal: bool = True) -> None:
+        """
+        Caches the provided plan, evicting the least recently used one if the cache is full.
+        :param key: the key.
+        :param plan: the plan, or the encoded plan.
+        :param optimal: whether the plan was proven optimal.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl, _copy(plan), optimal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """
+        Removes the cached plan having the provided key, or every cached plan.
+        :param key: the key, None for every plan.
+        :return: the count of removed plans.
+        """
+        with self._lock:
+            if key is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> dict:
+        """
+        Gives the counters of the cache.
+        :return: the counters.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self._max_size, 'ttl': self._ttl, 'hits': self._hits,
+                    'misses': self._misses, 'evictions': self._evictions}
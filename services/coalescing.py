@@ -0,0 +1,127 @@
+"""
+This module contains the coalescing of concurrent identical requests of the application.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class InFlightCall:
+    """
+    Internal object representing a computation in progress, awaited by the coalesced callers.
+    """
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class AsyncInFlightCall:
+    """
+    Internal object representing a computation in progress in the event loop: its own task, and the count of the
+    coalesced callers still awaiting it.
+    """
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing the same key: the first caller runs the computation while the next ones wait
+    for it and receive the same result (or the same error).
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, InFlightCall] = {}
+        self._async_calls: Dict[str, AsyncInFlightCall] = {}
+        self._lock = threading.Lock()
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: str, function: Callable[[], Any]) -> Any:
+        """
+        Runs the provided function, unless a call having the same key is already in progress.
+        :param key: the key.
+        :param function: the computation.
+        :return: the result of the computation.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = InFlightCall()
+                self._calls[key] = call
+                self._executions += 1
+            else:
+                self._coalesced += 1
+
+        # Someone else is already on it, just wait
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Coroutine counterpart of do, for callers running in the event loop. The computation runs in its own task: a
+        cancelled caller (e.g. its client disconnected) stops waiting without cancelling the others, and the
+        computation is cancelled only once no caller awaits it anymore.
+        :param key: the key.
+        :param function: the coroutine function of the computation.
+        :return: the result of the computation.
+        """
+        call = self._async_calls.get(key)
+        if call is None:
+            call = AsyncInFlightCall(asyncio.get_running_loop().create_task(function()))
+            self._async_calls[key] = call
+            call.task.add_done_callback(lambda task: self._async_done(key, call))
+            with self._lock:
+                self._executions += 1
+        else:
+            with self._lock:
+                self._coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            # The last caller left before the end: nobody needs the computation anymore
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _async_done(self, key: str, call: AsyncInFlightCall) -> None:
+        self._forget(key, call)
+        # Retrieve the exception, so that it isn't reported as never retrieved when nobody waits
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def _forget(self, key: str, call: AsyncInFlightCall) -> None:
+        # A later call may already run under the same key
+        if self._async_calls.get(key) is call:
+            del self._async_calls[key]
+
+    def stats(self) -> dict:
+        """
+        Gives the counters of the coalescing.
+        :return: the counters.
+        """
+        with self._lock:
+            return {'executions': self._executions, 'coalesced': self._coalesced,
+                    'in_flight': len(self._calls) + len(self._async_calls)}
@@ -0,0 +1,375 @@
+"""
+This module contains the feasibility index of a fleet: the loads its power plants can deliver exactly, given their
+minimum power, as sorted disjoint intervals (in tenth of MW). An unreachable load is then detected, and rejected or
+snapped to the nearest reachable one, before any dispatch.
+
+The index follows the stages of the dispatch of the application: the wind turbines are dispatched first (any power up
+to the wind available, which depends on the fuels), then the gas fired power plants by their merit order stack, and the
+turbojets only fill what the gas fired power plants left. The reachable thermal power (gas fired and turbojets) and the
+reachable gas fired power only depend on the fleet and are computed once: most loads are checked against them in
+microseconds, the others by dispatching the stages themselves.
+"""
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, FuelIndex
+from domain.fleet import Fleet
+from services.plant_types import PLANT_TYPES
+from services.supply_curve import SimpleStack, gas_fired_stack, type_stack
+
+# Maximum count of intervals of a reachable set: beyond it, the smallest gaps are filled (the set is then no longer
+# exact, only a superset of the reachable values)
+MAX_INTERVALS = 1024
+
+# Maximum count of loads tried when looking for the nearest reachable load on each side of an unreachable one
+MAX_SEARCH_STEPS = 4096
+
+# Default count of cached indexes (by fleet fingerprint)
+DEFAULT_FEASIBILITY_CACHE_SIZE = int(os.environ.get('FEASIBILITY_CACHE_SIZE', 256))
+
+# Behaviours on an unreachable load
+IGNORE = 'ignore'
+REJECT = 'reject'
+SNAP = 'snap'
+ON_INFEASIBLE = (IGNORE, REJECT, SNAP)
+
+
+class IntervalSet:
+    """
+    Set of integers stored as sorted, disjoint and non adjacent closed intervals. A set whose smallest gaps were filled
+    (see MAX_INTERVALS) is not exact.
+    """
+    __slots__ = ('_starts', '_ends', '_exact')
+
+    def __init__(self, intervals: List[Tuple[int, int]], exact: bool = True) -> None:
+        merged: List[List[int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+
+        # Too many intervals: the smallest gaps are filled
+        self._exact = exact and len(merged) <= MAX_INTERVALS
+        if len(merged) > MAX_INTERVALS:
+            gaps = sorted(range(1, len(merged)), key=lambda i: merged[i][0] - merged[i - 1][1])
+            kept = sorted(gaps[len(merged) - MAX_INTERVALS:])
+            bounds = [0] + kept + [len(merged)]
+            merged = [[merged[bounds[i]][0], merged[bounds[i + 1] - 1][1]] for i in range(len(bounds) - 1)]
+
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+
+    @property
+    def intervals(self) -> List[Tuple[int, int]]:
+        return list(zip(self._starts, self._ends))
+
+    @property
+    def maximum(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    @property
+    def exact(self) -> bool:
+        return self._exact
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __contains__(self, value: int) -> bool:
+        i = bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def add(self, low: int, high: int) -> 'IntervalSet':
+        """
+        Gives the values reachable by adding zero or any value within the provided bounds to a value of the set.
+        :param low: the lower bound.
+        :param high: the upper bound.
+        :return: the new set.
+        """
+        return IntervalSet(self.intervals + [(start + low, end + high) for start, end in self.intervals], self._exact)
+
+    def below(self, value: int, step: int = 1) -> Optional[int]:
+        """
+        Gives the greatest multiple of the step in the set lower than or equal to the provided value.
+        :param value: the value.
+        :param step: the step.
+        :return: the multiple, None if none.
+        """
+        i = bisect_right(self._starts, value) - 1
+        while i >= 0:
+            candidate = min(value, self._ends[i]) // step * step
+            if candidate >= self._starts[i]:
+                return candidate
+            i -= 1
+        return None
+
+    def above(self, value: int, step: int = 1) -> Optional[int]:
+        """
+        Gives the least multiple of the step in the set greater than or equal to the provided value.
+        :param value: the value.
+        :param step: the step.
+        :return: the multiple, None if none.
+        """
+        i = max(bisect_right(self._starts, value) - 1, 0)
+        while i < len(self._starts):
+            candidate = -(-max(value, self._starts[i]) // step) * step
+            if candidate <= self._ends[i]:
+                return candidate
+            i += 1
+        return None
+
+
+def reachable(pmin: np.ndarray, pmax: np.ndarray) -> IntervalSet:
+    """
+    Gives the sums reachable by the provided power plants, each one being off or between its minimum and its maximum
+    power.
+    :param pmin: the minimum power of each power plant.
+    :param pmax: the maximum power of each power plant.
+    :return: the reachable sums.
+    """
+    valid = pmax > 0
+    pmin, pmax = np.maximum(pmin[valid], 0), pmax[valid]
+    # The power plants without minimum power give a continuous range, added first so that the gaps close sooner
+    continuous = pmin == 0
+    result = IntervalSet([(0, int(pmax[continuous].sum()))])
+    for low, high in sorted(zip(pmin[~continuous].tolist(), pmax[~continuous].tolist())):
+        result = result.add(low, max(low, high))
+    return result
+
+
+class Feasibility:
+    """
+    Outcome of the feasibility check of a load (in MW): the reachable loads next to it, and the maximum load.
+    """
+    __slots__ = ('load', 'feasible', 'below', 'above', 'maximum')
+
+    def __init__(self, load: int, feasible: bool, below: Optional[int], above: Optional[int], maximum: int) -> None:
+        self.load = load
+        self.feasible = feasible
+        self.below = below
+        self.above = above
+        self.maximum = maximum
+
+    @property
+    def nearest(self) -> int:
+        """
+        The nearest reachable load, the greater one on a tie (better to produce a bit more than not enough).
+        """
+        if self.feasible:
+            return self.load
+        if self.above is None:
+            return self.below
+        if self.below is None or self.above - self.load <= self.load - self.below:
+            return self.above
+        return self.below
+
+    def to_dict(self) -> dict:
+        return {'load': self.load, 'feasible': self.feasible, 'below': self.below, 'above': self.above,
+                'maximum': self.maximum}
+
+
+class FeasibilityIndex:
+    """
+    Feasibility index of a fleet, following the stages of the dispatch:
+    - beyond the wind power available, the wind turbines all run at full power and the remaining load must be reached
+      by the thermal power plants,
+    - a remaining load reachable by the gas fired power plants alone is matched by their merit order stack,
+    - otherwise the gas fired power plants run at full power (remaining load beyond their total power) or fall back to
+      the best effort of their stack, and the turbojets must deliver exactly what is left with the rules of the
+      SimplePowerDispatcher.
+    A load out of the reachable thermal power is rejected, and a load left to the gas fired power plants alone accepted,
+    from the reachable sets. The other loads are checked by dispatching the stages with the stacks of the supply curve,
+    built for the fuels and the fleet of the check (whose order breaks the ties of the rankings). The index is exact,
+    except for a load reachable by the gas fired power plants which their stack doesn't match within its node budget.
+    """
+
+    def __init__(self, fleet: Fleet, thermal: Optional[IntervalSet] = None,
+                 gas_fired: Optional[IntervalSet] = None) -> None:
+        # The reachable power may be given when already known (e.g. stored with a shared fleet)
+        if thermal is None:
+            _, gas_fired_pmin, gas_fired_pmax = fleet.columns(GAS_FIRED)
+            _, turbojet_pmin, turbojet_pmax = fleet.columns(TURBOJET)
+            # A turbojet whose minimum power exceeds its maximum power still runs at full power
+            pmin = np.concatenate((gas_fired_pmin, np.minimum(turbojet_pmin, turbojet_pmax)))
+            pmax = np.concatenate((gas_fired_pmax, turbojet_pmax))
+            # Reachable thermal power, in tenth of MW as the dispatched power
+            thermal = reachable(pmin * 10, pmax * 10)
+        if gas_fired is None:
+            # Only the usable gas fired power plants are in their merit order stack
+            _, pmin, pmax = fleet.columns(GAS_FIRED)
+            usable = pmin <= pmax
+            gas_fired = reachable(pmin[usable] * 10, pmax[usable] * 10)
+        self._thermal = thermal
+        self._gas_fired = gas_fired
+        self._fleet = fleet
+        self._wind_pmax = fleet.pmax[fleet.index(WIND_TURBINE)]
+        # Last stack of each type, with the fleet and the fuel price it was built for
+        self._stacks: Dict[str, Tuple[Fleet, Optional[float], object]] = {}
+
+    @property
+    def thermal(self) -> IntervalSet:
+        return self._thermal
+
+    @property
+    def gas_fired(self) -> IntervalSet:
+        return self._gas_fired
+
+    @property
+    def supported(self) -> bool:
+        """
+        Tells whether the loads of the fleet are checked: the power plants of another registered type are dispatched by
+        other rules, the loads of their fleets are all accepted.
+        """
+        return not PLANT_TYPES.unstaged_types(self._fleet)
+
+    def wind(self, fuels: dict) -> int:
+        """
+        Gives the wind power available with the provided fuels, as computed by the wind turbine strategy.
+        :param fuels: the fuels dict.
+        :return: the power, in tenth of MW.
+        """
+        wind = FuelIndex(fuels).price(WIND_TURBINE)
+        if wind is None or not len(self._wind_pmax):
+            return 0
+        return int(np.trunc(self._wind_pmax / 100 * wind * 10).sum())
+
+    def _stack(self, fleet: Fleet, power_plant_type: str, price: Optional[float]):
+        cached = self._stacks.get(power_plant_type)
+        if cached is not None and cached[0] is fleet and cached[1] == price:
+            return cached[2]
+
+        # The stacks are never modified: concurrent checks may at worst build the same stack twice
+        if power_plant_type == GAS_FIRED:
+            stack = gas_fired_stack(fleet, price)[1]
+        else:
+            stack = SimpleStack(*type_stack(fleet, power_plant_type, price))
+        self._stacks[power_plant_type] = (fleet, price, stack)
+        return stack
+
+    def _delivers(self, target: int, wind: int, fleet: Fleet, fuels: FuelIndex) -> bool:
+        """
+        Tells whether the dispatch delivers exactly the provided load, stage by stage.
+        :param target: the load, in tenth of MW.
+        :param wind: the wind power available, in tenth of MW.
+        :param fleet: the fleet.
+        :param fuels: the fuels.
+        :return: True if the load is delivered.
+        """
+        if target < 0:
+            return False
+        if target > wind:
+            # All the wind turbines run at full power, the thermal power plants must reach the remaining load
+            remaining_load = target - wind
+            if remaining_load not in self._thermal:
+                return False
+        else:
+            # The wind turbines skip a power plant whose available power equals the remaining load
+            _, _, remaining_load = self._stack(fleet, WIND_TURBINE, fuels.price(WIND_TURBINE)).dispatch(target)
+            if remaining_load == 0:
+                return True
+
+        # Left to the gas fired power plants alone, which match it
+        if self._gas_fired.exact and remaining_load in self._gas_fired:
+            return True
+        gas_fired = self._stack(fleet, GAS_FIRED, fuels.price(GAS_FIRED))
+        if remaining_load >= gas_fired.total_available_power or remaining_load in self._gas_fired:
+            remaining_load -= gas_fired.solve(remaining_load).load
+        else:
+            # Out of reach of the gas fired power plants: no need to search for a match
+            remaining_load -= gas_fired.best_effort_load(remaining_load)
+
+        # Then the turbojets must deliver exactly what is left
+        _, _, remaining_load = self._stack(fleet, TURBOJET, fuels.price(TURBOJET)).dispatch(remaining_load)
+        return remaining_load == 0
+
+    def _nearest(self, target: int, wind: int, fleet: Fleet, fuels: FuelIndex, upward: bool) -> Optional[int]:
+        """
+        Gives the nearest load delivered by the dispatch on one side of the provided one, trying the multiples of 10
+        reachable by the power plants (any power up to the wind power, or the wind power plus a reachable thermal
+        power) one after the other.
+        :param target: the load, in tenth of MW.
+        :param wind: the wind power available, in tenth of MW.
+        :param fleet: the fleet.
+        :param fuels: the fuels.
+        :param upward: if the load is searched above the provided one, otherwise below.
+        :return: the nearest load, in tenth of MW, None if none.
+        """
+        reachable_loads = IntervalSet([(0, wind)] + [(start + wind, end + wind)
+                                                     for start, end in self._thermal.intervals])
+        candidate = target
+        for _ in range(MAX_SEARCH_STEPS):
+            candidate = reachable_loads.above(candidate + 10, 10) if upward else \
+                reachable_loads.below(candidate - 10, 10)
+            if candidate is None or self._delivers(candidate, wind, fleet, fuels):
+                return candidate
+        # Searched for too long: nothing is dispatched at all
+        return None if upward else 0
+
+    def check(self, load: int, fuels: dict, fleet: Optional[Fleet] = None) -> Feasibility:
+        """
+        Checks whether the provided load can be delivered exactly.
+        :param load: the load, in MW.
+        :param fuels: the fuels dict.
+        :param fleet: the fleet of the load, whose order breaks the ties of the rankings (by default, the fleet the
+        index was built from).
+        :return: the outcome of the check, with the nearest reachable loads (in MW).
+        """
+        wind = self.wind(fuels)
+        target = load * 10
+        maximum = (wind + self._thermal.maximum) // 10
+        fleet = self._fleet if fleet is None else fleet
+        fuel_index = FuelIndex(fuels)
+        if not self.supported or self._delivers(target, wind, fleet, fuel_index):
+            return Feasibility(load, True, load, load, maximum)
+
+        below = self._nearest(target, wind, fleet, fuel_index, False)
+        above = self._nearest(target, wind, fleet, fuel_index, True)
+        return Feasibility(load, False, None if below is None else below // 10, None if above is None else above // 10,
+                           maximum)
+
+
+class FeasibilityIndexes:
+    """
+    Bounded cache of feasibility indexes, by fleet fingerprint, with least recently used eviction.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_FEASIBILITY_CACHE_SIZE) -> None:
+        self._max_size = max_size
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fleet: Fleet) -> FeasibilityIndex:
+        """
+        Gives the feasibility index of the provided fleet, built on first use.
+        :param fleet: the fleet.
+        :return: the index.
+        """
+        key = fleet.fingerprint
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = FeasibilityIndex(fleet)
+        self.put(fleet, index)
+        return index
+
+    def put(self, fleet: Fleet, index: FeasibilityIndex) -> None:
+        """
+        Caches the provided feasibility index, built elsewhere, of the provided fleet.
+        :param fleet: the fleet.
+        :param index: the index.
+        """
+        if self._max_size > 0:
+            with self._lock:
+                self._indexes[fleet.fingerprint] = index
+                self._indexes.move_to_end(fleet.fingerprint)
+                while len(self._indexes) > self._max_size:
+                    self._indexes.popitem(last=False)
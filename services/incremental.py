@@ -0,0 +1,167 @@
+"""
+This module contains the incremental planner of the application: the last production plan of a fleet is kept, then
+updated from a delta (load, wind percentage or single fuel price) without starting again from scratch.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain.codec import encode_plan, join_plans
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, FuelIndex, Scenario
+from domain.fleet import Fleet
+from services.batch import rank
+from services.merit_order import MeritOrderStack
+from services.supply_curve import STRATEGIES
+from services.time_series import TimeSeriesPlanner
+
+
+class IncrementalPlanner(TimeSeriesPlanner):
+    """
+    Planner keeping the last load, fuels and stacks of a fleet, updated by deltas:
+    - a new wind percentage only ranks the wind turbines again,
+    - a new positive gas or kerosine price keeps the ranking of its power plants (the costs are scaled by the same
+      factor), so the stack is kept with its solutions, once checked that the ranking is indeed the same,
+    - a new load only dispatches again, by binary search in the stacks (the gas fired solutions being memoized),
+    and only the power plant types whose dispatch changed are encoded again.
+    The plans are the same as the ones of the '/productionplan' endpoint, except that a kept gas fired solution may
+    be another plan of the same cost, when several plans are the cheapest. A fleet having other registered types is
+    planned again from scratch on each update.
+    """
+
+    def __init__(self, fleet: Fleet):
+        super().__init__(fleet)
+        self._load: Optional[int] = None
+        self._fuels: dict = {}
+        self._rankings: Dict[str, Tuple[np.ndarray, ...]] = {}
+        # Encoded plan of each power plant type, with the stack and the dispatch it comes from
+        self._segments: Dict[str, Tuple[object, object, bytes]] = {}
+        self._reuses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def reuses(self) -> int:
+        """
+        Count of stacks kept despite a price change so far.
+        """
+        return self._reuses
+
+    def _ranking(self, power_plant_type: str, price: Optional[float]) -> Tuple[np.ndarray, ...]:
+        """
+        Gives what the stack of the provided type depends on, besides the costs: the ranking of the power plants and,
+        for the gas fired ones, the merit order and the cost ties.
+        """
+        efficiency, pmin, pmax = self._fleet.columns(power_plant_type)
+        result = STRATEGIES[power_plant_type].compute_batch(efficiency, pmin, pmax,
+                                                            np.array([np.nan if price is None else price],
+                                                                     dtype=np.float64))
+        ranks = rank(result)[0]
+        if power_plant_type != GAS_FIRED:
+            return ranks,
+
+        costs = result.cost[0, ranks]
+        order = MeritOrderStack.sort_units(costs, result.minimum_power[ranks], result.available_power[0, ranks])
+        ordered_costs = costs[order]
+        return ranks, order, ordered_costs[1:] == ordered_costs[:-1]
+
+    def _reusable(self, power_plant_type: str, cached_price: Optional[float], price: Optional[float]) -> bool:
+        if super()._reusable(power_plant_type, cached_price, price):
+            return True
+        if power_plant_type not in (GAS_FIRED, TURBOJET) or cached_price is None or price is None \
+                or cached_price <= 0 or price <= 0:
+            return False
+
+        # Vectorized check, much cheaper than solving again
+        ranking = self._ranking(power_plant_type, price)
+        if all(np.array_equal(cached, new) for cached, new in zip(self._rankings[power_plant_type], ranking)):
+            self._reuses += 1
+            return True
+        return False
+
+    def _build(self, power_plant_type: str, price: Optional[float]):
+        if power_plant_type in (GAS_FIRED, TURBOJET):
+            self._rankings[power_plant_type] = self._ranking(power_plant_type, price)
+        return super()._build(power_plant_type, price)
+
+    def _segment(self, power_plant_type: str, stack, dispatch, names: List[str], dispatched) -> bytes:
+        cached = self._segments.get(power_plant_type)
+        if cached is not None and cached[0] is stack and cached[1] == dispatch:
+            return cached[2]
+
+        segment = encode_plan(names, dispatched())
+        self._segments[power_plant_type] = (stack, dispatch, segment)
+        return segment
+
+    def update(self, load: Optional[int] = None, fuels: Optional[dict] = None) -> bytes:
+        """
+        Applies the provided delta to the last load and fuels, then computes the production plan.
+        :param load: the new load, None to keep the last one.
+        :param fuels: the changed fuels, merged into the last ones.
+        :return: the encoded plan (same JSON as the list of ResponseEntry).
+        :raise ValueError: if there is no load yet.
+        """
+        with self._lock:
+            new_load = self._load if load is None else load
+            if new_load is None:
+                raise ValueError('The load is missing, no plan was computed yet')
+            new_fuels = {**self._fuels, **(fuels or {})}
+            if self._batch_planner is not None:
+                # The other types have no stack: the plan is computed again from scratch
+                plan = self.plan(Scenario.construct(load=new_load, fuels=new_fuels))
+                self._load = new_load
+                self._fuels = new_fuels
+                return encode_plan([entry.name for entry in plan], [entry.p for entry in plan])
+            fuel_index = FuelIndex(new_fuels)
+
+            # Same dispatch as SupplyCurve.plan
+            wind_turbines = self._stack(WIND_TURBINE, fuel_index.price(WIND_TURBINE))
+            wind_full, wind_tail, remaining_load = wind_turbines.dispatch(new_load * 10)
+            gas_fired_names, gas_fired = self._stack(GAS_FIRED, fuel_index.price(GAS_FIRED))
+            gas_solution = gas_fired.solve(remaining_load)
+            remaining_load -= gas_solution.load
+            turbojets = self._stack(TURBOJET, fuel_index.price(TURBOJET))
+            turbojet_full, turbojet_tail, _ = turbojets.dispatch(remaining_load)
+
+            content = join_plans([
+                self._segment(WIND_TURBINE, wind_turbines, (wind_full, wind_tail), wind_turbines.names,
+                              lambda: wind_turbines.dispatched(wind_full, wind_tail)),
+                self._segment(GAS_FIRED, gas_fired, gas_solution.dispatched, gas_fired_names,
+                              lambda: gas_solution.dispatched),
+                self._segment(TURBOJET, turbojets, (turbojet_full, turbojet_tail), turbojets.names,
+                              lambda: turbojets.dispatched(turbojet_full, turbojet_tail))
+            ])
+            self._load = new_load
+            self._fuels = new_fuels
+            return content
+
+
+class IncrementalPlanners:
+    """
+    The incremental planners of the registered fleets, by fleet id. A planner is replaced when its fleet is.
+    """
+
+    def __init__(self) -> None:
+        self._planners: Dict[str, IncrementalPlanner] = {}
+        self._lock = threading.Lock()
+
+    def get(self, fleet_id: str, fleet: Fleet) -> IncrementalPlanner:
+        """
+        Gives the planner of the provided fleet, created if needed.
+        :param fleet_id: the fleet id.
+        :param fleet: the registered fleet.
+        :return: the planner.
+        """
+        with self._lock:
+            planner = self._planners.get(fleet_id)
+            if planner is None or planner.fleet is not fleet:
+                planner = IncrementalPlanner(fleet)
+                self._planners[fleet_id] = planner
+            return planner
+
+    def discard(self, fleet_id: str) -> None:
+        """
+        Removes the planner of the provided fleet, if any.
+        :param fleet_id: the fleet id.
+        """
+        with self._lock:
+            self._planners.pop(fleet_id, None)
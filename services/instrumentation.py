@@ -0,0 +1,271 @@
+"""
+This module contains the instrumentation of the application: a structured logger, sampled debug traces, latency
+histograms, counters and the hooks of the on demand profiling (see services.profiling).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from services.profiling import Profiler, RequestProfile, requested_mode
+
+logger = logging.getLogger('powerplant')
+
+# Share of the debug traces actually written (when the debug level is enabled)
+DEBUG_SAMPLE_RATE = float(os.environ.get('DEBUG_SAMPLE_RATE', 0.01))
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+def log_event(level: int, event: str, **fields) -> None:
+    """
+    Writes a structured (JSON) log record, only formatted if the level is enabled.
+    :param level: the logging level.
+    :param event: the event name.
+    :param fields: the fields of the record.
+    """
+    if logger.isEnabledFor(level):
+        fields['event'] = event
+        logger.log(level, json.dumps(fields, default=str))
+
+
+def tracing() -> bool:
+    """
+    Tells if a debug trace has to be written: the debug level must be enabled, then only a sample of the traces is
+    kept. Cheap enough to be called in the hot loops.
+    :return: True if the trace has to be written.
+    """
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < DEBUG_SAMPLE_RATE
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets.
+    """
+
+    def __init__(self) -> None:
+        self._counts = [0] * len(LATENCY_BUCKETS)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        bucket = bisect_left(LATENCY_BUCKETS, milliseconds)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._sum += milliseconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        count = sum(counts)
+        return {
+            'count': count,
+            'sum_ms': total,
+            'mean_ms': total / count if count else 0.0,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): value
+                        for bound, value in zip(LATENCY_BUCKETS, counts)}
+        }
+
+
+class StageTimer:
+    """
+    Context manager measuring the duration of a stage into a histogram (and into the profile of the request, if any).
+    """
+    __slots__ = ('_histogram', '_start', '_stage', '_profile')
+
+    def __init__(self, histogram: Histogram, stage: str = None, profile: Optional[RequestProfile] = None) -> None:
+        self._histogram = histogram
+        self._start = 0.0
+        self._stage = stage
+        self._profile = profile
+
+    def __enter__(self) -> 'StageTimer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        end = time.perf_counter()
+        self._histogram.observe(end - self._start)
+        if self._profile is not None:
+            self._profile.span(self._stage, self._start, end)
+
+
+class RequestTimer:
+    """
+    Timestamps of the request in progress, shared between the middleware and the endpoint, with its profile.
+    """
+    __slots__ = ('start', 'parsed', 'handled', 'profile')
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.parsed: Optional[float] = None
+        self.handled: Optional[float] = None
+        self.profile: Optional[RequestProfile] = None
+
+
+current_request: ContextVar[Optional[RequestTimer]] = ContextVar('current_request', default=None)
+
+
+def request_deadline(budget: Optional[float]) -> Optional[float]:
+    """
+    Gives the deadline of the request in progress, counted from its arrival in the middleware: the time spent waiting
+    (for the event loop, a thread or a slot) is part of its budget.
+    :param budget: the time budget, in seconds, None for no deadline.
+    :return: the deadline (time.monotonic), None for no deadline.
+    """
+    if budget is None:
+        return None
+    timer = current_request.get()
+    elapsed = 0.0 if timer is None else time.perf_counter() - timer.start
+    return time.monotonic() - elapsed + budget
+
+
+class Instrumentation:
+    """
+    Registry of the latency histograms (by stage) and of the counters.
+    """
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def stage(self, stage: str) -> StageTimer:
+        """
+        Gives a context manager measuring the duration of the provided stage.
+        :param stage: the stage name.
+        :return: the context manager.
+        """
+        timer = current_request.get()
+        return StageTimer(self.histogram(stage), stage, timer.profile if timer is not None else None)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).observe(seconds)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def mark_parsed(self) -> None:
+        """
+        Called by the endpoint once the payload is parsed: the time spent since the request started (reading and
+        validating the body) is the parse stage.
+        """
+        timer = current_request.get()
+        if timer is not None:
+            timer.parsed = time.perf_counter()
+            self.observe('parse', timer.parsed - timer.start)
+            if timer.profile is not None:
+                timer.profile.span('parse', timer.start, timer.parsed)
+                # The call stacks of the thread computing the request are sampled from now on
+                timer.profile.enter()
+
+    def mark_handled(self) -> None:
+        """
+        Called by the endpoint once the response is built: the time spent until the response starts is the serialize
+        stage.
+        """
+        timer = current_request.get()
+        if timer is not None:
+            timer.handled = time.perf_counter()
+            if timer.profile is not None:
+                timer.profile.leave()
+                if timer.parsed is not None:
+                    timer.profile.span('handle', timer.parsed, timer.handled)
+
+    def run_sampled(self, function: Callable, *args) -> Any:
+        """
+        Runs the provided function in the current thread (of the thread pool), whose call stack is sampled while the
+        request is profiled.
+        :param function: the function.
+        :param args: its arguments.
+        :return: its result.
+        """
+        timer = current_request.get()
+        profile = timer.profile if timer is not None else None
+        if profile is not None:
+            profile.enter()
+        try:
+            return function(*args)
+        finally:
+            if profile is not None:
+                profile.leave()
+
+    def snapshot(self) -> dict:
+        """
+        Gives the histograms and the counters.
+        :return: the metrics.
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        return {'stages': {stage: histogram.snapshot() for stage, histogram in sorted(histograms.items())},
+                'counters': counters}
+
+
+class StageTimingMiddleware:
+    """
+    ASGI middleware timing the requests whose path starts with the provided prefix: the whole request, and (with the
+    help of the endpoint, see mark_parsed and mark_handled) the parse and serialize stages. The requests asking for a
+    profile are profiled by the provided profiler, the name of the trace being given in the X-Profile response header.
+    """
+
+    def __init__(self, app, instrumentation: Instrumentation, prefix: str = '/productionplan',
+                 profiler: Optional[Profiler] = None) -> None:
+        self._app = app
+        self._instrumentation = instrumentation
+        self._prefix = prefix
+        self._profiler = profiler
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not scope['path'].startswith(self._prefix):
+            await self._app(scope, receive, send)
+            return
+
+        timer = RequestTimer(time.perf_counter())
+        mode = requested_mode(scope) if self._profiler is not None else None
+        if mode is not None:
+            timer.profile = self._profiler.begin(mode, scope['path'])
+        token = current_request.set(timer)
+
+        async def timed_send(message) -> None:
+            if message['type'] == 'http.response.start':
+                now = time.perf_counter()
+                if timer.handled is not None:
+                    self._instrumentation.observe('serialize', now - timer.handled)
+                if mode is not None:
+                    if timer.profile is not None and timer.handled is not None:
+                        timer.profile.span('serialize', timer.handled, now)
+                    # Name of the trace, in the profile directory
+                    name = timer.profile.name if timer.profile is not None else 'rate-limited'
+                    message = dict(message, headers=list(message.get('headers', [])) + [(b'x-profile',
+                                                                                         name.encode())])
+            await send(message)
+
+        try:
+            await self._app(scope, receive, timed_send)
+        finally:
+            current_request.reset(token)
+            end = time.perf_counter()
+            self._instrumentation.observe('request', end - timer.start)
+            if timer.profile is not None:
+                timer.profile.span('request', timer.start, end)
+                # The trace is written out of the event loop
+                await run_in_threadpool(self._profiler.finish, timer.profile)
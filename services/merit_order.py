@@ -0,0 +1,405 @@
+"""
+This module contains the merit order dispatch engine of the application.
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.strategy import BatchProcessResult, FleetState, PowerDispatcher, ProcessResult
+
+# Maximum count of explored nodes before the search gives up proving optimality
+DEFAULT_NODE_BUDGET = 20000
+
+# Count of explored nodes between two checks of the deadline (a power of two minus one, used as a mask)
+DEADLINE_CHECK_MASK = 255
+
+# Tolerance used when comparing costs
+EPSILON = 1e-9
+
+
+class DispatchSolution:
+    """
+    Class defining the outcome of a merit order solve. The dispatched powers are given in the order of the units
+    provided to the stack.
+    """
+
+    def __init__(self, dispatched: List[int], cost: float, optimal: bool):
+        self._dispatched = dispatched
+        self._cost = cost
+        self._optimal = optimal
+
+    @property
+    def dispatched(self) -> List[int]:
+        return self._dispatched
+
+    @property
+    def cost(self) -> float:
+        return self._cost
+
+    @property
+    def optimal(self) -> bool:
+        return self._optimal
+
+    @property
+    def load(self) -> int:
+        return sum(self._dispatched)
+
+
+class MeritOrderStack:
+    """
+    The merit order stack of a set of dispatchable units. The units are sorted by cost once, so that any load can be
+    solved without sorting again.
+
+    The solve is a depth first branch and bound over the on/off state of the units, visited in merit order:
+    - a unit without minimum power is always committed (it cannot hurt),
+    - a lower bound is given by the merit order fill ignoring the minimum power of the undecided units,
+    - identical consecutive units are committed in order (symmetry breaking).
+    The first leaf reached is the greedy merit order commitment, so a good solution is known right away: the search
+    can then be stopped at any time (node budget or deadline), the best solution so far being returned.
+    """
+
+    def __init__(self, costs: Sequence[float], minimum_powers: Sequence[int], available_powers: Sequence[int]):
+        costs = np.asarray(costs, dtype=np.float64)
+        minimum_powers = np.asarray(minimum_powers, dtype=np.int64)
+        available_powers = np.asarray(available_powers, dtype=np.int64)
+        self._size = len(costs)
+
+        # Units which cannot produce anything are left out of the stack, the others are sorted by cost (then by
+        # decreasing available power, ties keeping the provided order)
+        order = self.sort_units(costs, minimum_powers, available_powers)
+        self._order = order.tolist()
+
+        cost = costs[order]
+        pmin = np.maximum(minimum_powers[order], 0)
+        pmax = available_powers[order]
+        headroom = pmax - pmin
+        self._cost = cost.tolist()
+        self._pmin = pmin.tolist()
+        self._pmax = pmax.tolist()
+        self._headroom = headroom.tolist()
+
+        # Prefix sums of the full capacity and of the headroom (above the minimum power), with their costs
+        self._cum_pmax = [0] + np.cumsum(pmax).tolist()
+        self._cum_cost_pmax = [0.0] + np.cumsum(cost * pmax).tolist()
+        self._cum_headroom = [0] + np.cumsum(headroom).tolist()
+        self._cum_cost_headroom = [0.0] + np.cumsum(cost * headroom).tolist()
+
+        # A unit is 'twin' of the previous one when both are identical
+        twin = np.zeros(len(order), dtype=bool)
+        twin[1:] = (cost[1:] == cost[:-1]) & (pmin[1:] == pmin[:-1]) & (pmax[1:] == pmax[:-1])
+        self._twin = twin.tolist()
+
+    @staticmethod
+    def sort_units(costs: np.ndarray, minimum_powers: np.ndarray, available_powers: np.ndarray) -> np.ndarray:
+        """
+        Sorts the usable units by cost (then by decreasing available power, ties keeping the provided order).
+        :param costs: the costs of the units.
+        :param minimum_powers: the minimum power of the units.
+        :param available_powers: the available power of the units.
+        :return: the indexes of the usable units, in merit order.
+        """
+        usable = np.flatnonzero((available_powers > 0) & (minimum_powers <= available_powers))
+        return usable[np.lexsort((-available_powers[usable], costs[usable]))]
+
+    @property
+    def order(self) -> List[int]:
+        """
+        The indexes of the usable units, in merit order.
+        """
+        return self._order
+
+    @property
+    def total_available_power(self) -> int:
+        return self._cum_pmax[-1]
+
+    @property
+    def costs(self) -> List[float]:
+        """
+        The costs of the usable units, in merit order.
+        """
+        return self._cost
+
+    def split(self, load: int) -> Optional[Tuple[int, int]]:
+        """
+        Binary search of the load in the merit order stack: the units before the returned position run at full power
+        and the unit at the returned position gets the returned remaining power. Such a split ignores the minimum power
+        of the units, so it is only given when it respects the minimum power of the partial unit. It is then optimal.
+        :param load: the load, strictly between 0 and the total available power.
+        :return: the position of the partial unit and its power, None if the split is not feasible.
+        """
+        j = bisect_left(self._cum_pmax, load, 1)
+        power = load - self._cum_pmax[j - 1]
+        if power < self._pmin[j - 1]:
+            return None
+        return j - 1, power
+
+    def split_cost(self, position: int, power: int) -> float:
+        """
+        Cost of a split: the units before the position at full power, the unit at the position with the power.
+        :param position: the position of the partial unit.
+        :param power: the power of the partial unit.
+        :return: the cost.
+        """
+        return self._cum_cost_pmax[position] + self._cost[position] * power
+
+    def _fill_cost(self, start: int, power: int) -> float:
+        """
+        Cost of producing the provided power with the units following 'start' (included) in merit order, ignoring
+        their minimum power.
+        """
+        if power <= 0:
+            return 0.0
+        target = self._cum_pmax[start] + power
+        j = bisect_left(self._cum_pmax, target, start + 1)
+        return (self._cum_cost_pmax[j - 1] - self._cum_cost_pmax[start]
+                + self._cost[j - 1] * (target - self._cum_pmax[j - 1]))
+
+    def _leaf_cost(self, depth: int, pmin_cost: float, power: int, off: List[int], off_headroom: List[int],
+                   off_cost_headroom: List[float]) -> float:
+        """
+        Cost of a complete commitment: every committed unit (before 'depth', except the 'off' ones) runs at its
+        minimum power, then the remaining power is filled through the headroom of the committed units in merit order.
+        """
+        if power <= 0:
+            return pmin_cost
+
+        def committed_headroom(k: int) -> int:
+            # Headroom of the committed units before k
+            return self._cum_headroom[k] - off_headroom[bisect_left(off, k)]
+
+        # Find the smallest k so that the committed headroom before k covers the power
+        low, high = 1, depth
+        while low < high:
+            middle = (low + high) // 2
+            if committed_headroom(middle) >= power:
+                high = middle
+            else:
+                low = middle + 1
+        k = low - 1
+        position = bisect_left(off, k)
+        full_cost = self._cum_cost_headroom[k] - off_cost_headroom[position]
+        return pmin_cost + full_cost + self._cost[k] * (power - committed_headroom(k))
+
+    def _commitment_to_solution(self, committed: List[bool], load: int, optimal: bool) -> DispatchSolution:
+        """
+        Converts a commitment (in merit order) into the dispatched power of every unit (in the initial order).
+        """
+        dispatched = [0] * self._size
+        remaining = load
+        cost = 0.0
+
+        # Every committed unit starts at its minimum power
+        for position, is_committed in enumerate(committed):
+            if is_committed:
+                dispatched[self._order[position]] = self._pmin[position]
+                remaining -= self._pmin[position]
+                cost += self._cost[position] * self._pmin[position]
+
+        # Then the remaining power goes to the cheapest headroom first
+        for position, is_committed in enumerate(committed):
+            if remaining <= 0:
+                break
+            if is_committed:
+                extra = min(self._headroom[position], remaining)
+                dispatched[self._order[position]] += extra
+                remaining -= extra
+                cost += self._cost[position] * extra
+
+        return DispatchSolution(dispatched, cost, optimal)
+
+    def _best_effort(self, load: int) -> DispatchSolution:
+        """
+        Fallback used when the load cannot be matched: walks the merit order, committing every unit whose minimum
+        power still fits in the load, and never dispatches more than the load.
+        """
+        committed = [False] * len(self._order)
+        minimum_power = 0
+        for position, pmin in enumerate(self._pmin):
+            if minimum_power + pmin <= load:
+                committed[position] = True
+                minimum_power += pmin
+        return self._commitment_to_solution(committed, load, False)
+
+    def best_effort_load(self, load: int) -> int:
+        """
+        Gives the power dispatched by solve for a load (strictly between 0 and the total available power) which no
+        commitment matches, without searching for a match first.
+        :param load: the load.
+        :return: the dispatched power, lower than the load.
+        """
+        return self._best_effort(load).load
+
+    def solve(self, load: int, node_budget: int = DEFAULT_NODE_BUDGET,
+              deadline: Optional[float] = None) -> DispatchSolution:
+        """
+        Finds the cheapest dispatch matching exactly the provided load.
+        :param load: the load to dispatch.
+        :param node_budget: the maximum count of explored nodes.
+        :param deadline: the time (time.monotonic) after which the search stops once a solution is known, None for no
+        deadline.
+        :return: the solution, flagged as optimal if the search space was exhausted. If the load cannot be matched,
+        a best effort solution (lower than the load) is returned.
+        """
+        size = len(self._order)
+
+        if load <= 0:
+            return DispatchSolution([0] * self._size, 0.0, True)
+        # Not enough power available: use everything
+        if load >= self._cum_pmax[-1]:
+            return self._commitment_to_solution([True] * size, load, load == self._cum_pmax[-1])
+
+        # Fast path: the merit order split respects the minimum powers
+        split = self.split(load)
+        if split is not None:
+            position, power = split
+            dispatched = [0] * self._size
+            for i in range(position):
+                dispatched[self._order[i]] = self._pmax[i]
+            dispatched[self._order[position]] = power
+            return DispatchSolution(dispatched, self.split_cost(position, power), True)
+
+        best_cost = float('inf')
+        best_commitment: Optional[List[bool]] = None
+
+        committed = [False] * size
+        # Units switched off so far (in merit order) with the prefix sums of their headroom and its cost
+        off: List[int] = []
+        off_headroom = [0]
+        off_cost_headroom = [0.0]
+
+        # Explicit stack of (depth, minimum power, available power, cost at minimum, cost at maximum, choice)
+        # where choice is the next branch to explore: 0 (on), 1 (off) or 2 (done)
+        stack = [(0, 0, 0, 0.0, 0.0, 0)]
+        nodes = 0
+        exhausted = True
+
+        while stack:
+            depth, pmin_sum, pmax_sum, pmin_cost, pmax_cost, choice = stack.pop()
+
+            # Backtracking: undo the decision of the node at this depth
+            if choice > 0 and off and off[-1] == depth:
+                off.pop()
+                off_headroom.pop()
+                off_cost_headroom.pop()
+
+            if choice == 0:
+                nodes += 1
+                # The first dive (the greedy commitment) is always allowed
+                if nodes > node_budget + size:
+                    exhausted = False
+                    break
+                # The deadline is only checked from time to time, and once a solution is known
+                if deadline is not None and not nodes & DEADLINE_CHECK_MASK and best_commitment is not None \
+                        and time.monotonic() >= deadline:
+                    exhausted = False
+                    break
+
+                # Leaf: the committed units can match the load, more expensive units cannot help anymore
+                if pmax_sum >= load:
+                    cost = self._leaf_cost(depth, pmin_cost, load - pmin_sum, off, off_headroom, off_cost_headroom)
+                    if cost < best_cost - EPSILON:
+                        best_cost = cost
+                        best_commitment = committed[:depth] + [False] * (size - depth)
+                    continue
+
+                # Infeasible: not enough power left
+                if pmax_sum + self._cum_pmax[size] - self._cum_pmax[depth] < load:
+                    continue
+
+                # Bound: committed units at full power, then the merit order fill
+                if pmax_cost + self._fill_cost(depth, load - pmax_sum) >= best_cost - EPSILON:
+                    continue
+
+            if choice >= 2:
+                continue
+
+            pmin = self._pmin[depth]
+            pmax = self._pmax[depth]
+            cost = self._cost[depth]
+            twin_off = self._twin[depth] and not committed[depth - 1]
+
+            if choice == 0:
+                stack.append((depth, pmin_sum, pmax_sum, pmin_cost, pmax_cost, 1))
+                # Branch 'on', unless the minimum power does not fit or the identical previous unit is off
+                if pmin_sum + pmin <= load and not twin_off:
+                    committed[depth] = True
+                    stack.append((depth + 1, pmin_sum + pmin, pmax_sum + pmax, pmin_cost + cost * pmin,
+                                  pmax_cost + cost * pmax, 0))
+                    continue
+                choice = 1
+                stack.pop()
+
+            # Branch 'off', useless for a unit without minimum power
+            if choice == 1 and pmin > 0:
+                committed[depth] = False
+                off.append(depth)
+                off_headroom.append(off_headroom[-1] + self._headroom[depth])
+                off_cost_headroom.append(off_cost_headroom[-1] + cost * self._headroom[depth])
+                stack.append((depth, pmin_sum, pmax_sum, pmin_cost, pmax_cost, 2))
+                stack.append((depth + 1, pmin_sum, pmax_sum, pmin_cost, pmax_cost, 0))
+
+        if best_commitment is None:
+            return self._best_effort(load)
+
+        return self._commitment_to_solution(best_commitment, load, exhausted)
+
+
+class MeritOrderDispatcher(PowerDispatcher):
+    """
+    Power dispatcher handling the whole fleet in one pass, using a merit order stack which takes the minimum power of
+    the power plants into account.
+    """
+
+    def __init__(self, node_budget: int = DEFAULT_NODE_BUDGET) -> None:
+        self._node_budget = node_budget
+
+    def compute(self, results: [ProcessResult], load: int) -> [ProcessResult]:
+        if not results:
+            return results
+
+        stack = MeritOrderStack([result.cost or 0.0 for result in results],
+                                [result.minimum_power for result in results],
+                                [result.available_power for result in results])
+        solution = stack.solve(load, self._node_budget)
+
+        # Report the dispatched power on the process results, keeping the provided order
+        for result, dispatched_power in zip(results, solution.dispatched):
+            result.dispatched_power = dispatched_power
+
+        return results
+
+    def compute_fleet(self, state: FleetState, positions: np.ndarray, load: int) -> int:
+        stack = MeritOrderStack(state.cost[positions], state.minimum_power[positions],
+                                state.available_power[positions])
+        solution = stack.solve(load, self._node_budget, state.deadline)
+        state.dispatched_power[positions] = solution.dispatched
+        state.optimal = state.optimal and solution.optimal
+        return solution.load
+
+    def dispatch_batch(self, result: BatchProcessResult, ranks: np.ndarray, prices: np.ndarray,
+                       load: np.ndarray) -> np.ndarray:
+        """
+        Dispatches the power plants of each scenario with a merit order stack. Scenarios sharing the same price share
+        the same stack, and scenarios sharing the same load too share the same solution.
+        """
+        dispatched = np.zeros(ranks.shape, dtype=np.int64)
+        stacks: Dict[Optional[float], MeritOrderStack] = {}
+        solutions: Dict[Tuple[Optional[float], int], List[int]] = {}
+
+        for s in range(ranks.shape[0]):
+            price = None if np.isnan(prices[s]) else float(prices[s])
+            stack = stacks.get(price)
+            if stack is None:
+                stack = MeritOrderStack(result.cost[s, ranks[s]], result.minimum_power[ranks[s]],
+                                        result.available_power[s, ranks[s]])
+                stacks[price] = stack
+            key = (price, int(load[s]))
+            if key not in solutions:
+                solutions[key] = stack.solve(int(load[s]), self._node_budget).dispatched
+            dispatched[s] = solutions[key]
+
+        return dispatched
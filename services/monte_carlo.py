@@ -0,0 +1,141 @@
+"""
+This module contains the wind uncertainty analysis of the application: many wind scenarios are drawn around the
+forecast, then ranked and dispatched by chunks (see BatchPlanner.dispatch) to give the distribution of the cost and of
+the dispatch of each power plant.
+"""
+from typing import Dict, List
+
+import numpy as np
+
+from domain.engie_objects import WIND_TURBINE, FuelIndex, WindScenarios
+from domain.fleet import Fleet
+from services.batch import BatchPlanner
+
+# Maximum count of scenarios of a request
+MAX_SCENARIOS = 100000
+
+# Maximum count of dispatched powers of a request (scenarios times power plants), as the dispatch of every power plant
+# in every scenario is kept for its quantiles: 8 bytes each, 80 MB at most, plus the intermediates of a chunk (about
+# 110 MB peak for 100 power plants and 100k scenarios, measured with tracemalloc)
+MAX_DISPATCHED_POWERS = 10000000
+
+# Count of dispatched powers of a chunk: the scenarios are dispatched, and the quantiles of the power plants computed,
+# by chunks of this size, as the intermediates cost several times the dispatched powers they give
+CHUNK_POWERS = 250000
+
+# Supported distributions of the wind percentage
+DISTRIBUTIONS = ('normal', 'beta')
+
+
+def draw_wind(scenarios: WindScenarios, mean: float) -> np.ndarray:
+    """
+    Draws the wind percentage of each scenario, or takes the explicit samples.
+    :param scenarios: the scenarios.
+    :param mean: the mean wind percentage.
+    :return: the wind percentages, within 0 and 100.
+    :raise ValueError: if the distribution or its parameters are not supported.
+    """
+    if scenarios.samples is not None:
+        if not 0 < len(scenarios.samples) <= MAX_SCENARIOS:
+            raise ValueError(f'Between 1 and {MAX_SCENARIOS} samples are expected')
+        return np.clip(np.asarray(scenarios.samples, dtype=np.float64), 0, 100)
+
+    if not 0 < scenarios.count <= MAX_SCENARIOS:
+        raise ValueError(f'Between 1 and {MAX_SCENARIOS} scenarios are expected')
+    if scenarios.std < 0:
+        raise ValueError('The standard deviation cannot be negative')
+    if scenarios.distribution not in DISTRIBUTIONS:
+        raise ValueError(f'Unknown distribution: {scenarios.distribution}')
+
+    random = np.random.default_rng(scenarios.seed)
+    mean = min(max(mean, 0.0), 100.0)
+    if scenarios.distribution == 'normal':
+        return np.clip(random.normal(mean, scenarios.std, scenarios.count), 0, 100)
+
+    # Beta distribution matching the mean and the variance (capped to the largest variance of such a mean)
+    share = mean / 100
+    variance = min((scenarios.std / 100) ** 2, share * (1 - share) * 0.99)
+    if variance <= 0:
+        return np.full(scenarios.count, mean)
+    concentration = share * (1 - share) / variance - 1
+    return random.beta(share * concentration, (1 - share) * concentration, scenarios.count) * 100
+
+
+def summarize(values: np.ndarray, quantiles: List[float]) -> dict:
+    """
+    Gives the mean, the standard deviation, the bounds and the quantiles of the provided values.
+    :param values: the values, one per scenario.
+    :param quantiles: the quantiles, in percent.
+    :return: the summary.
+    """
+    return {'mean': float(values.mean()), 'std': float(values.std()), 'min': float(values.min()),
+            'max': float(values.max()),
+            'quantiles': dict(zip(quantile_keys(quantiles), np.percentile(values, quantiles).tolist()))}
+
+
+def quantile_keys(quantiles: List[float]) -> List[str]:
+    return ['%g' % quantile for quantile in quantiles]
+
+
+def analyze_wind_scenarios(fleet: Fleet, scenarios: WindScenarios, planner: BatchPlanner) -> dict:
+    """
+    Plans the wind uncertainty scenarios of the provided fleet, by chunks of scenarios.
+    :param fleet: the fleet.
+    :param scenarios: the scenarios.
+    :param planner: the batch planner.
+    :return: the count of scenarios, the summaries of the wind percentage, of the cost (per hour), of the thermal
+    power (every type but the wind turbines) and of the load not served (in tenth of MW, as the dispatched power of
+    the plans), then the mean and the quantiles of the dispatched power of each power plant (in the fleet order).
+    :raise ValueError: if the scenarios are not valid, or too many for the size of the fleet.
+    """
+    if any(not 0 <= quantile <= 100 for quantile in scenarios.quantiles):
+        raise ValueError('The quantiles are expected within 0 and 100')
+    fuel_index = FuelIndex(scenarios.fuels, planner.plant_types.fuel_table)
+    mean = scenarios.mean if scenarios.mean is not None else fuel_index.price(WIND_TURBINE)
+    if mean is None and scenarios.samples is None:
+        raise ValueError('The mean wind percentage is missing')
+    # The summaries do not depend on the order of the scenarios: sorting them by wind keeps the scenarios sharing the
+    # same remaining load (and merit order solution) within the same chunk
+    wind = np.sort(draw_wind(scenarios, mean))
+    count = len(wind)
+    # The dispatched matrix holds a power per scenario and power plant: it is bounded before being allocated
+    if count * len(fleet) > MAX_DISPATCHED_POWERS:
+        raise ValueError(f'At most {MAX_DISPATCHED_POWERS // max(len(fleet), 1)} scenarios are expected for a fleet '
+                         f'of {len(fleet)} power plants')
+
+    def constant(power_plant_type: str) -> np.ndarray:
+        price = fuel_index.price(power_plant_type)
+        return np.full(count, np.nan if price is None else price)
+
+    # Only the wind varies, the prices of the other registered types are the same in every scenario
+    prices: Dict[str, np.ndarray] = {plant_type.name: constant(plant_type.name)
+                                     for plant_type in planner.plant_types.types}
+    prices[WIND_TURBINE] = wind
+    load = np.full(count, scenarios.load * 10, dtype=np.int64)
+    dispatched = np.empty((count, len(fleet)), dtype=np.int64)
+    cost, unserved = np.empty(count), np.empty(count, dtype=np.int64)
+    # Dispatch the scenarios by chunks of rows, so that the intermediates of the dispatch stay small
+    rows = max(CHUNK_POWERS // max(len(fleet), 1), 1)
+    for start in range(0, count, rows):
+        chunk = slice(start, start + rows)
+        dispatched[chunk], cost[chunk], unserved[chunk] = planner.dispatch_fleet(
+            fleet, {name: type_prices[chunk] for name, type_prices in prices.items()}, load[chunk])
+    # Everything but the wind turbines
+    thermal = dispatched.sum(axis=1) - dispatched[:, fleet.index(WIND_TURBINE)].sum(axis=1)
+
+    means = dispatched.mean(axis=0).tolist()
+    # The percentiles copy and partition their input: they are computed by chunks of columns (power plants)
+    columns = max(CHUNK_POWERS // count, 1)
+    plant_quantiles = [values for start in range(0, len(fleet), columns)
+                       for values in np.percentile(dispatched[:, start:start + columns], scenarios.quantiles,
+                                                   axis=0).T.tolist()]
+    keys = quantile_keys(scenarios.quantiles)
+    return {
+        'scenarios': count,
+        'wind': summarize(wind, scenarios.quantiles),
+        'cost': summarize(cost, scenarios.quantiles),
+        'thermal': summarize(thermal, scenarios.quantiles),
+        'unserved': {**summarize(unserved, scenarios.quantiles), 'probability': float((unserved > 0).mean())},
+        'plants': [{'name': name, 'mean': plant_mean, 'quantiles': dict(zip(keys, values))}
+                   for name, plant_mean, values in zip(fleet.names, means, plant_quantiles)]
+    }
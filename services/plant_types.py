@@ -0,0 +1,148 @@
+"""
+This module contains the registry of the power plant types supported by the application. Each type declares the fuels
+it burns, the strategy computing the cost and the available power of its power plants, the dispatcher sharing the load
+among them and its stage in the dispatch: adding a type (biomass, storage, nuclear...) only means registering it.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import FUEL_TABLE, GAS_FIRED, TURBOJET, WIND_TURBINE, FuelTable
+from domain.fleet import Fleet
+from services.merit_order import MeritOrderDispatcher
+from services.strategy import GasFiredStrategy, PowerDispatcher, SimplePowerDispatcher, Strategy, \
+    TurbojetStrategy, WindTurbineStrategy
+
+# Power plant types whose stages are modelled explicitly, besides the registry
+STAGED_TYPES = (WIND_TURBINE, GAS_FIRED, TURBOJET)
+
+
+class PlantType:
+    """
+    Class defining a power plant type: its fuels (matched in the keys of the fuels dict), its strategy (cost and
+    available power), its dispatcher and its stage (the types are dispatched by increasing stage).
+    """
+
+    def __init__(self, name: str, fuels: List[str], strategy: Strategy, dispatcher: PowerDispatcher, stage: int):
+        self._name = name
+        self._fuels = fuels
+        self._strategy = strategy
+        self._dispatcher = dispatcher
+        self._stage = stage
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def fuels(self) -> List[str]:
+        return self._fuels
+
+    @property
+    def strategy(self) -> Strategy:
+        return self._strategy
+
+    @property
+    def dispatcher(self) -> PowerDispatcher:
+        return self._dispatcher
+
+    @property
+    def stage(self) -> int:
+        return self._stage
+
+
+class PlantTypeRegistry:
+    """
+    The registered power plant types, by name, with the fuel table matching their fuels (a table of its own unless
+    provided). The power plants of an unknown type are ignored.
+    """
+
+    def __init__(self, plant_types: List[PlantType] = (), fuel_table: Optional[FuelTable] = None) -> None:
+        self._fuel_table = FuelTable() if fuel_table is None else fuel_table
+        self._types: Dict[str, PlantType] = {}
+        # Types sorted by stage (then by registration), rebuilt on each change
+        self._ordered: Tuple[PlantType, ...] = ()
+        # Count of changes of the registry
+        self._version = 0
+        self._lock = threading.Lock()
+        for plant_type in plant_types:
+            self.register(plant_type)
+
+    @property
+    def types(self) -> Tuple[PlantType, ...]:
+        """
+        The registered types, in dispatch order.
+        """
+        return self._ordered
+
+    @property
+    def fuel_table(self) -> FuelTable:
+        return self._fuel_table
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def register(self, plant_type: PlantType) -> None:
+        """
+        Registers (or replaces) the provided power plant type, with its fuels.
+        :param plant_type: the power plant type.
+        """
+        with self._lock:
+            self._types[plant_type.name] = plant_type
+            self._fuel_table.register(plant_type.name, plant_type.fuels)
+            self._ordered = tuple(sorted(self._types.values(), key=lambda registered: registered.stage))
+            self._version += 1
+
+    def unregister(self, name: str) -> bool:
+        """
+        Removes the power plant type having the provided name, with its fuels.
+        :param name: the name of the type.
+        :return: True if the type was registered.
+        """
+        with self._lock:
+            if self._types.pop(name, None) is None:
+                return False
+            self._fuel_table.unregister(name)
+            self._ordered = tuple(sorted(self._types.values(), key=lambda registered: registered.stage))
+            self._version += 1
+            return True
+
+    def get(self, name: str) -> Optional[PlantType]:
+        return self._types.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._types
+
+    def unstaged_types(self, fleet: Fleet) -> List[str]:
+        """
+        Gives the registered types of the provided fleet other than the ones of the challenge (wind turbines, gas fired
+        and turbojets), whose stages are modelled explicitly by the supply curve, the time series, the feasibility
+        index and the unit commitment.
+        :param fleet: the fleet.
+        :return: the other types, empty if none.
+        """
+        return [power_plant_type for power_plant_type in fleet.summary()
+                if power_plant_type not in STAGED_TYPES and power_plant_type in self._types]
+
+    def stages(self, fleet: Fleet, plant_types: Tuple[PlantType, ...]) -> np.ndarray:
+        """
+        Gives the position in the provided types (dispatch order) of each power plant of the fleet.
+        :param fleet: the fleet.
+        :param plant_types: the types, as given by the types property.
+        :return: the positions, -1 for an unknown type.
+        """
+        stages = np.full(len(fleet), -1, dtype=np.int64)
+        for number, plant_type in enumerate(plant_types):
+            stages[fleet.index(plant_type.name)] = number
+        return stages
+
+
+# Power plant types of the challenge: the wind first, then the gas fired power plants (minimum power aware merit
+# order), then the turbojets. Their fuels are the ones of the default fuel table
+PLANT_TYPES = PlantTypeRegistry([
+    PlantType(WIND_TURBINE, ['wind'], WindTurbineStrategy(), SimplePowerDispatcher(), 0),
+    PlantType(GAS_FIRED, ['gas'], GasFiredStrategy(), MeritOrderDispatcher(), 1),
+    PlantType(TURBOJET, ['kerosine'], TurbojetStrategy(), SimplePowerDispatcher(), 2)
+], FUEL_TABLE)
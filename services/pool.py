@@ -0,0 +1,147 @@
+"""
+This module contains the process pool of the application, used to compute production plans out of the web server
+process (and out of its GIL).
+"""
+import asyncio
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from domain.engie_objects import Payload, ResponseEntry, Scenario
+from domain.fleet import Fleet
+from services.batch import BatchPlanner
+from services.plant_types import PLANT_TYPES, PlantTypeRegistry
+
+# Count of web server processes sharing the machine (as read by uvicorn for its default count of workers)
+WEB_CONCURRENCY = max(int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+
+# Default count of worker processes, of each web server process: the CPUs are shared by the web server processes
+DEFAULT_POOL_WORKERS = int(os.environ.get('PLAN_POOL_WORKERS', max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1)))
+
+# Whether the worker processes are started with the application, rather than on first use
+DEFAULT_POOL_EAGER = os.environ.get('PLAN_POOL_EAGER', '').lower() in ('1', 'true', 'yes')
+
+# Maximum count of registries of power plant types whose planner is kept by a worker process
+MAX_WORKER_PLANNERS = 16
+
+# Planners of the worker process, by pickled power plant types of the web server
+worker_planners: Dict[bytes, BatchPlanner] = {}
+
+# Pickled power plant types of the web server, with the version of the registry they were pickled at
+pickled_types: Tuple[int, bytes] = (-1, b'')
+
+
+def warm_up() -> None:
+    """
+    Initializer of the worker processes: the code is imported and run once before the first request.
+    """
+    BatchPlanner().plan(Fleet([]), [Scenario.construct(load=0, fuels={})])
+
+
+def ping() -> int:
+    """
+    Does nothing, except forcing the start of a worker process.
+    """
+    return os.getpid()
+
+
+def registered_types() -> bytes:
+    """
+    Gives the power plant types registered in the web server, pickled once per change of the registry: the worker
+    processes don't see the types registered after their start.
+    :return: the pickled types.
+    """
+    global pickled_types
+    # The version is read first: a type registered meanwhile is pickled again on the next call
+    version = PLANT_TYPES.version
+    if pickled_types[0] != version:
+        pickled_types = (version, pickle.dumps(PLANT_TYPES.types))
+    return pickled_types[1]
+
+
+def compact(payload: Payload) -> tuple:
+    """
+    Converts the provided payload into plain data (lists of the fleet columns), cheap to pickle, with the registered
+    power plant types.
+    :param payload: the payload.
+    :return: the arguments of solve.
+    """
+    power_plants = payload.powerplants
+    return (payload.load, payload.fuels,
+            [p.name for p in power_plants], [p.type for p in power_plants], [p.efficiency for p in power_plants],
+            [p.pmin for p in power_plants], [p.pmax for p in power_plants], registered_types())
+
+
+def solve(load: int, fuels: dict, names: List[str], types: List[str], efficiency: List[float], pmin: List[int],
+          pmax: List[int], plant_types: bytes) -> List[Tuple[str, int]]:
+    """
+    Computes a production plan from plain data, in a worker process, with the power plant types of the web server.
+    :return: the plan as (name, p) tuples.
+    """
+    planner = worker_planners.get(plant_types)
+    if planner is None:
+        planner = BatchPlanner(PlantTypeRegistry(pickle.loads(plant_types)))
+        if len(worker_planners) >= MAX_WORKER_PLANNERS:
+            worker_planners.clear()
+        worker_planners[plant_types] = planner
+    fleet = Fleet.from_columns(names, types, efficiency, pmin, pmax)
+    plan = planner.plan(fleet, [Scenario.construct(load=load, fuels=fuels)])[0]
+    return [(entry.name, entry.p) for entry in plan]
+
+
+class PlanPool:
+    """
+    Pool of warm worker processes computing production plans. The pool is started on first use, out of the event
+    loop, or by start with the application when eager.
+    """
+
+    def __init__(self, workers: int = DEFAULT_POOL_WORKERS, eager: bool = DEFAULT_POOL_EAGER) -> None:
+        self._workers = max(workers, 1)
+        self._eager = eager
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def eager(self) -> bool:
+        return self._eager
+
+    def start(self) -> ProcessPoolExecutor:
+        """
+        Starts the worker processes, if not started yet, and waits for them to be ready.
+        :return: the executor.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, initializer=warm_up)
+                for future in [self._executor.submit(ping) for _ in range(self._workers)]:
+                    future.result()
+            return self._executor
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    async def plan(self, payload: Payload) -> List[ResponseEntry]:
+        """
+        Computes the production plan of the provided payload in a worker process.
+        :param payload: the payload.
+        :return: a list of ResponseEntry.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        if executor is None:
+            # Starting the worker processes waits for them: never on the event loop
+            executor = await loop.run_in_executor(None, self.start)
+        rows = await loop.run_in_executor(executor, solve, *compact(payload))
+        return [ResponseEntry(name, p) for name, p in rows]
@@ -0,0 +1,220 @@
+"""
+This module contains the on demand profiling of the application: a request asking for it (profile query parameter or
+X-Profile header) gets its stage timings recorded and, optionally, its call stacks sampled, then written as a Chrome
+trace (chrome://tracing, Perfetto) to a local directory. The profiles are rate limited, so that the feature can stay
+enabled in production; the requests not asking for it only pay for a context variable lookup per stage.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+# Directory of the traces
+DEFAULT_PROFILE_DIRECTORY = os.environ.get('PROFILE_DIRECTORY',
+                                           os.path.join(tempfile.gettempdir(), 'powerplant-profiles'))
+# Maximum count of profiles per minute (0 disables the profiling)
+DEFAULT_PROFILES_PER_MINUTE = float(os.environ.get('PROFILES_PER_MINUTE', 6))
+# Interval between two samples of the call stack, in milliseconds
+DEFAULT_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1))
+
+# Stage timings only
+STAGES = 'stages'
+# Stage timings and sampled call stacks
+SAMPLE = 'sample'
+# Values of the query parameter or of the header, by mode
+MODES = {'1': STAGES, 'true': STAGES, STAGES: STAGES, SAMPLE: SAMPLE}
+
+# Deepest sampled call stack
+MAX_STACK_DEPTH = 64
+
+
+def requested_mode(scope: dict) -> Optional[str]:
+    """
+    Gives the profiling mode asked by the provided request: the profile query parameter, else the X-Profile header.
+    :param scope: the ASGI scope of the request.
+    :return: the mode, None if the request does not ask for a profile (or for an unknown mode).
+    """
+    value = None
+    if b'profile' in scope.get('query_string', b''):
+        values = parse_qs(scope['query_string'].decode('latin-1')).get('profile')
+        value = values[0] if values else None
+    if value is None:
+        for name, header in scope.get('headers', ()):
+            if name == b'x-profile':
+                value = header.decode('latin-1')
+                break
+    return None if value is None else MODES.get(value.lower())
+
+
+class StackSampler:
+    """
+    Thread sampling the call stack of another thread at a fixed interval.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        # Sampled thread, None while there is nothing to sample
+        self.target: Optional[int] = None
+        self.samples: List[Tuple[float, Tuple[str, ...]]] = []
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            target = self.target
+            frame = sys._current_frames().get(target) if target is not None else None
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            # The outermost frame first
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+
+class RequestProfile:
+    """
+    Profile of a request: its timed spans (stage, start, end, thread) and its sampled call stacks.
+    """
+    __slots__ = ('name', 'mode', 'path', 'spans', 'sampler')
+
+    def __init__(self, name: str, mode: str, path: str, sample_interval: float) -> None:
+        self.name = name
+        self.mode = mode
+        self.path = path
+        self.spans: List[Tuple[str, float, float, int]] = []
+        self.sampler = StackSampler(sample_interval) if mode == SAMPLE else None
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def span(self, stage: str, start: float, end: float) -> None:
+        self.spans.append((stage, start, end, threading.get_ident()))
+
+    def enter(self) -> None:
+        """
+        Called by the thread computing the request once it starts: its call stack is sampled until leave is called.
+        """
+        if self.sampler is not None:
+            self.sampler.target = threading.get_ident()
+
+    def leave(self) -> None:
+        if self.sampler is not None:
+            self.sampler.target = None
+
+    def stop(self) -> None:
+        if self.sampler is not None:
+            self.sampler.target = None
+            self.sampler.stop()
+
+    def trace(self) -> dict:
+        """
+        Gives the Chrome trace of the profile: one complete event per span, and nested complete events for the frames
+        of the sampled call stacks (consecutive samples sharing a frame are merged).
+        :return: the trace, as the JSON object format of the trace events.
+        """
+        pid = os.getpid()
+        origin = min((start for _, start, _, _ in self.spans), default=0.0)
+
+        def microseconds(moment: float) -> float:
+            return round((moment - origin) * 1e6, 3)
+
+        events = [{'name': stage, 'cat': 'stage', 'ph': 'X', 'ts': microseconds(start),
+                   'dur': microseconds(end) - microseconds(start), 'pid': pid, 'tid': thread}
+                  for stage, start, end, thread in self.spans]
+
+        if self.sampler is not None and self.sampler.samples:
+            # Frames of the last sample still open, with the time they were first seen
+            opened: List[Tuple[str, float]] = []
+            samples = self.sampler.samples
+
+            def close(depth: int, end: float) -> None:
+                while len(opened) > depth:
+                    frame, start = opened.pop()
+                    events.append({'name': frame, 'cat': 'sample', 'ph': 'X', 'ts': microseconds(start),
+                                   'dur': microseconds(end) - microseconds(start), 'pid': pid, 'tid': 'samples'})
+
+            for moment, stack in samples:
+                common = 0
+                while common < len(opened) and common < len(stack) and opened[common][0] == stack[common]:
+                    common += 1
+                close(common, moment)
+                opened.extend((frame, moment) for frame in stack[common:])
+            close(0, samples[-1][0])
+
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'powerplant'}})
+        samples = len(self.sampler.samples) if self.sampler is not None else 0
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'path': self.path, 'mode': self.mode, 'samples': samples}}
+
+
+class Profiler:
+    """
+    Rate limited (token bucket) profiler of the requests asking for it.
+    """
+
+    def __init__(self, directory: str = DEFAULT_PROFILE_DIRECTORY, per_minute: float = DEFAULT_PROFILES_PER_MINUTE,
+                 sample_interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS) -> None:
+        self._directory = directory
+        self._rate = per_minute / 60
+        self._capacity = max(per_minute, 1.0) if per_minute > 0 else 0.0
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+        self._sample_interval = sample_interval_ms / 1000
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._counters: Dict[str, int] = {'captured': 0, 'rate_limited': 0}
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def begin(self, mode: str, path: str) -> Optional[RequestProfile]:
+        """
+        Starts the profile of a request, if the rate limit allows it.
+        :param mode: the profiling mode.
+        :param path: the path of the request.
+        :return: the profile, None if rate limited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self._rate)
+            self._refilled = now
+            if self._tokens < 1:
+                self._counters['rate_limited'] += 1
+                return None
+            self._tokens -= 1
+            self._sequence += 1
+            name = f'profile-{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{self._sequence}.json'
+        return RequestProfile(name, mode, path, self._sample_interval)
+
+    def finish(self, profile: RequestProfile) -> str:
+        """
+        Stops the provided profile and writes its trace.
+        :param profile: the profile.
+        :return: the path of the trace.
+        """
+        profile.stop()
+        os.makedirs(self._directory, exist_ok=True)
+        path = os.path.join(self._directory, profile.name)
+        with open(path, 'w') as file:
+            json.dump(profile.trace(), file)
+        with self._lock:
+            self._counters['captured'] += 1
+        return path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
@@ -0,0 +1,70 @@
+"""
+This module contains the fleet registry of the application.
+"""
+import threading
+from typing import Dict, List, Optional
+
+from domain.engie_objects import PowerPlant
+from domain.fleet import Fleet
+from services.shared_fleets import SharedFleetStore
+
+
+class FleetRegistry:
+    """
+    Registry keeping the fleets of power plants by id, so that requests only have to carry the load and the fuels.
+    The fleets are converted once, at registration time. With a shared fleet store, they are kept there instead, so
+    that every worker process sees (and maps) the fleets registered by any of them.
+    """
+
+    def __init__(self, store: Optional[SharedFleetStore] = None) -> None:
+        self._fleets: Dict[str, Fleet] = {}
+        self._store = store
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> Optional[SharedFleetStore]:
+        return self._store
+
+    def register(self, fleet_id: str, power_plants: List[PowerPlant]) -> Fleet:
+        """
+        Registers (or replaces) the fleet having the provided id.
+        :param fleet_id: the fleet id.
+        :param power_plants: the power plants of the fleet.
+        :return: the registered fleet.
+        """
+        fleet = Fleet(power_plants)
+        if self._store is not None:
+            return self._store.publish(fleet_id, fleet)
+        with self._lock:
+            self._fleets[fleet_id] = fleet
+        return fleet
+
+    def get(self, fleet_id: str) -> Optional[Fleet]:
+        """
+        Gives the fleet having the provided id.
+        :param fleet_id: the fleet id.
+        :return: the fleet, None if unknown.
+        """
+        if self._store is not None:
+            return self._store.get(fleet_id)
+        return self._fleets.get(fleet_id)
+
+    def unregister(self, fleet_id: str) -> bool:
+        """
+        Removes the fleet having the provided id.
+        :param fleet_id: the fleet id.
+        :return: True if the fleet was registered.
+        """
+        if self._store is not None:
+            return self._store.remove(fleet_id)
+        with self._lock:
+            return self._fleets.pop(fleet_id, None) is not None
+
+    def ids(self) -> List[str]:
+        """
+        Gives the ids of the registered fleets.
+        :return: the fleet ids.
+        """
+        if self._store is not None:
+            return self._store.ids()
+        return list(self._fleets)
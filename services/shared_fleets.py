@@ -0,0 +1,258 @@
+"""
+This module contains the shared fleet store: the registered fleets are written once in a directory (/dev/shm keeps it
+in memory), as files which every worker process maps read only, so that their columns (efficiency, minimum and maximum
+power, type codes, positions and fields by type) and their feasibility index are neither rebuilt nor copied by each
+worker.
+
+Each registration writes a new version of the fleet, then swaps the current version of its id atomically (os.replace):
+a worker never sees a half written fleet, and the requests in flight keep the version they started with (a removed
+file stays mapped until released).
+"""
+import json
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from domain.fleet import Fleet
+from services.feasibility import FeasibilityIndex, FeasibilityIndexes, IntervalSet
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directory of the shared fleet store (empty to keep the fleets in each worker)
+DEFAULT_FLEET_STORE = os.environ.get('FLEET_STORE', '')
+
+# Header of the fleet files: magic, then the length of the JSON description
+MAGIC = b'PPFLEET2'
+PREFIX = struct.Struct('<8sQ')
+# Alignment of the arrays in the fleet files, in bytes
+ALIGNMENT = 64
+
+FLEET_SUFFIX = '.fleet'
+CURRENT_SUFFIX = '.current'
+# Store wide version counter, also locked by the writers
+VERSION_FILE = '.version'
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_fleet(path: str, fleet: Fleet, index: FeasibilityIndex) -> None:
+    """
+    Writes the provided fleet, with the reachable power of its feasibility index, into a fleet file.
+    :param path: the path of the file.
+    :param fleet: the fleet.
+    :param index: the feasibility index of the fleet.
+    """
+    types = list(fleet.summary())
+    arrays = [('efficiency', fleet.efficiency.astype(np.float64, copy=False)),
+              ('pmin', fleet.pmin.astype(np.int64, copy=False)),
+              ('pmax', fleet.pmax.astype(np.int64, copy=False)),
+              ('type_codes', fleet.type_codes.astype(np.int8, copy=False))]
+    for number, power_plant_type in enumerate(types):
+        efficiency, pmin, pmax = fleet.columns(power_plant_type)
+        arrays += [(f'index.{number}', fleet.index(power_plant_type).astype(np.int64, copy=False)),
+                   (f'efficiency.{number}', efficiency), (f'pmin.{number}', pmin), (f'pmax.{number}', pmax)]
+
+    # The offsets are relative to the (aligned) end of the description
+    layout = {}
+    offset = 0
+    for key, array in arrays:
+        layout[key] = [offset, array.dtype.str, len(array)]
+        offset = _aligned(offset + array.nbytes)
+    description = json.dumps({'fingerprint': fleet.fingerprint, 'names': fleet.names, 'types': types,
+                              'numbers': [types.index(power_plant_type) for power_plant_type in fleet.types],
+                              'thermal': index.thermal.intervals, 'gas_fired': index.gas_fired.intervals,
+                              'exact': [index.thermal.exact, index.gas_fired.exact], 'arrays': layout}).encode()
+    start = _aligned(PREFIX.size + len(description))
+
+    with open(path, 'wb') as file:
+        file.write(PREFIX.pack(MAGIC, len(description)))
+        file.write(description)
+        for key, array in arrays:
+            file.seek(start + layout[key][0])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(max(start + offset, file.tell()))
+
+
+def read_fleet(path: str) -> Tuple[Fleet, FeasibilityIndex]:
+    """
+    Maps the fleet file having the provided path: the arrays of the fleet are read only views of the file.
+    :param path: the path of the file.
+    :return: the fleet, and its feasibility index built from the stored reachable power.
+    :raise ValueError: if the file is not a fleet file.
+    """
+    with open(path, 'rb') as file:
+        magic, length = PREFIX.unpack(file.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f'Not a fleet file: {path}')
+        description = json.loads(file.read(length))
+    start = _aligned(PREFIX.size + length)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def array(key: str) -> np.ndarray:
+        offset, dtype, size = description['arrays'][key]
+        dtype = np.dtype(dtype)
+        return buffer[start + offset:start + offset + size * dtype.itemsize].view(dtype)
+
+    types = description['types']
+    indexes = {power_plant_type: array(f'index.{number}') for number, power_plant_type in enumerate(types)}
+    columns = {power_plant_type: (array(f'efficiency.{number}'), array(f'pmin.{number}'), array(f'pmax.{number}'))
+               for number, power_plant_type in enumerate(types)}
+    # The names and the types are Python objects, which can't be shared: only them are decoded by each worker
+    fleet = Fleet.from_arrays(description['names'], [types[number] for number in description['numbers']],
+                              array('efficiency'), array('pmin'), array('pmax'), array('type_codes'), indexes,
+                              columns, description['fingerprint'])
+    thermal, gas_fired = [IntervalSet([tuple(interval) for interval in description[key]], exact)
+                          for key, exact in zip(('thermal', 'gas_fired'), description['exact'])]
+    return fleet, FeasibilityIndex(fleet, thermal, gas_fired)
+
+
+class SharedFleetStore:
+    """
+    Store of fleets by id, shared by the processes using the same directory. Each process keeps the mapped current
+    version of the fleets it used.
+    """
+
+    def __init__(self, directory: str = DEFAULT_FLEET_STORE,
+                 feasibility_indexes: Optional[FeasibilityIndexes] = None) -> None:
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # The feasibility indexes of the attached fleets are put there, built from the stored reachable power
+        self._feasibility_indexes = feasibility_indexes
+        self._attached: Dict[str, Tuple[int, Fleet]] = {}
+        self._lock = threading.Lock()
+        self._counters = {'published': 0, 'attached': 0}
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _path(self, fleet_id: str, suffix: str) -> str:
+        return os.path.join(self._directory, quote(fleet_id, safe='') + suffix)
+
+    def _version_path(self, fleet_id: str, version: int) -> str:
+        return self._path(fleet_id, f'.{version}{FLEET_SUFFIX}')
+
+    def _exclusive(self):
+        """
+        Gives an open file whose lock serializes the writers of every process (the thread lock being held).
+        """
+        file = open(os.path.join(self._directory, VERSION_FILE), 'a+')
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        return file
+
+    def _swap(self, path: str, content: str) -> None:
+        # Written aside then renamed: the readers see the previous or the new content, never a partial one
+        descriptor, temporary = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(content)
+        os.replace(temporary, path)
+
+    def _remove_versions(self, fleet_id: str, keep: Optional[int] = None) -> None:
+        prefix = quote(fleet_id, safe='') + '.'
+        for name in os.listdir(self._directory):
+            if name.startswith(prefix) and name.endswith(FLEET_SUFFIX):
+                version = name[len(prefix):-len(FLEET_SUFFIX)]
+                if version.isdigit() and int(version) != keep:
+                    try:
+                        os.remove(os.path.join(self._directory, name))
+                    except OSError:
+                        # Still mapped on a platform forbidding it: removed with the next version
+                        pass
+
+    def publish(self, fleet_id: str, fleet: Fleet) -> Fleet:
+        """
+        Writes a new version of the fleet having the provided id, then makes it the current one.
+        :param fleet_id: the fleet id.
+        :param fleet: the fleet.
+        :return: the fleet mapped from the store.
+        """
+        index = FeasibilityIndex(fleet)
+        with self._lock, self._exclusive() as lock:
+            lock.seek(0)
+            content = lock.read().strip()
+            version = int(content) + 1 if content.isdigit() else 1
+            lock.seek(0)
+            lock.truncate()
+            lock.write(str(version))
+            lock.flush()
+
+            descriptor, temporary = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            os.close(descriptor)
+            write_fleet(temporary, fleet, index)
+            os.replace(temporary, self._version_path(fleet_id, version))
+            self._swap(self._path(fleet_id, CURRENT_SUFFIX), str(version))
+            # The previous versions stay mapped by the workers using them
+            self._remove_versions(fleet_id, keep=version)
+            self._counters['published'] += 1
+        return self.get(fleet_id)
+
+    def _current(self, fleet_id: str) -> Optional[int]:
+        try:
+            with open(self._path(fleet_id, CURRENT_SUFFIX)) as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, fleet_id: str) -> Optional[Fleet]:
+        """
+        Gives the current version of the fleet having the provided id, mapped on first use.
+        :param fleet_id: the fleet id.
+        :return: the fleet, None if unknown.
+        """
+        while True:
+            version = self._current(fleet_id)
+            if version is None:
+                self._attached.pop(fleet_id, None)
+                return None
+            attached = self._attached.get(fleet_id)
+            if attached is not None and attached[0] == version:
+                return attached[1]
+            try:
+                fleet, index = read_fleet(self._version_path(fleet_id, version))
+            except FileNotFoundError:
+                # Replaced in the meantime: the current version is read again
+                continue
+            with self._lock:
+                self._attached[fleet_id] = (version, fleet)
+                self._counters['attached'] += 1
+            if self._feasibility_indexes is not None:
+                self._feasibility_indexes.put(fleet, index)
+            return fleet
+
+    def remove(self, fleet_id: str) -> bool:
+        """
+        Removes the fleet having the provided id.
+        :param fleet_id: the fleet id.
+        :return: True if the fleet was stored.
+        """
+        with self._lock, self._exclusive():
+            self._attached.pop(fleet_id, None)
+            try:
+                os.remove(self._path(fleet_id, CURRENT_SUFFIX))
+            except FileNotFoundError:
+                return False
+            self._remove_versions(fleet_id)
+        return True
+
+    def ids(self) -> List[str]:
+        """
+        Gives the ids of the stored fleets.
+        :return: the fleet ids.
+        """
+        return sorted(unquote(name[:-len(CURRENT_SUFFIX)]) for name in os.listdir(self._directory)
+                      if name.endswith(CURRENT_SUFFIX))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'directory': self._directory, 'fleets': len(self._attached), **self._counters}
@@ -1,7 +1,17 @@
 from __future__ import annotations
+import logging
 from abc import ABC, abstractmethod
 
-from domain.engie_objects import EnrichedPowerPlant
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+import numpy as np
+
+from domain.engie_objects import EnrichedPowerPlant, FuelIndex
+from domain.fleet import Fleet
+from services.instrumentation import log_event, tracing
+
+if TYPE_CHECKING:
+    from services.plant_types import PlantType, PlantTypeRegistry
 
 
 class ProcessResult:
@@ -65,28 +75,135 @@ class ProcessResult:
         self._dispatched_power = dispatched_power
 
 
+class BatchProcessResult:
+    """
+    This class is the columnar counterpart of ProcessResult, computed for many scenarios at once: each array has one
+    row per scenario and one column per power plant. The minimum power doesn't depend on the scenario, so it only has
+    one value per power plant.
+    """
+
+    def __init__(self, available_power: np.ndarray, minimum_power: np.ndarray, cost: np.ndarray, order: np.ndarray):
+        self._available_power = available_power
+        self._minimum_power = minimum_power
+        self._cost = cost
+        self._order = order
+
+    @property
+    def available_power(self) -> np.ndarray:
+        return self._available_power
+
+    @property
+    def minimum_power(self) -> np.ndarray:
+        return self._minimum_power
+
+    @property
+    def cost(self) -> np.ndarray:
+        return self._cost
+
+    @property
+    def order(self) -> np.ndarray:
+        return self._order
+
+
+class FleetState:
+    """
+    This class is the struct of arrays counterpart of a list of ProcessResult, for a whole fleet and one scenario: each
+    attribute is a contiguous array with one value per power plant, in the fleet order. The deadline (time.monotonic,
+    None for no deadline) bounds the time spent by the dispatchers, which clear the optimal flag when they could not
+    prove the optimality of their dispatch.
+    """
+    __slots__ = ('fleet', 'available_power', 'minimum_power', 'cost', 'order', 'dispatched_power', 'deadline',
+                 'optimal')
+
+    def __init__(self, fleet: Fleet, deadline: Optional[float] = None) -> None:
+        self.fleet = fleet
+        self.available_power = np.zeros(len(fleet), dtype=np.int64)
+        self.minimum_power = fleet.pmin * 10
+        self.cost = np.zeros(len(fleet), dtype=np.float64)
+        self.order = np.zeros(len(fleet), dtype=np.float64)
+        self.dispatched_power = np.zeros(len(fleet), dtype=np.int64)
+        self.deadline = deadline
+        self.optimal = True
+
+    def ranked(self, power_plant_type: str) -> np.ndarray:
+        """
+        Gives the positions of the power plants having the provided type, sorted by order (ties keep the fleet order).
+        :param power_plant_type: the power plant type.
+        :return: the ranked positions.
+        """
+        positions = self.fleet.index(power_plant_type)
+        return positions[np.argsort(self.order[positions], kind='stable')]
+
+
 class StrategyOrchestrator:
     """
-    Orchestrator for the ranking strategy.
+    Orchestrator for the ranking strategy, driven by the registry of the power plant types.
     """
 
-    def __init__(self) -> None:
-        self._wind_turbine_strategy = WindTurbineStrategy()
-        self._gas_fired_strategy = GasFiredStrategy()
-        self._turbojet_strategy = TurbojetStrategy()
+    def __init__(self, plant_types: Optional[PlantTypeRegistry] = None) -> None:
+        if plant_types is None:
+            # Imported here: the registry itself depends on the strategies and the dispatchers
+            from services.plant_types import PLANT_TYPES
+            plant_types = PLANT_TYPES
+        self._plant_types = plant_types
 
-    def process_power_plant(self, power_plant: EnrichedPowerPlant) -> ProcessResult:
+    @property
+    def plant_types(self) -> PlantTypeRegistry:
+        return self._plant_types
+
+    def process_power_plant(self, power_plant: EnrichedPowerPlant) -> Optional[ProcessResult]:
         """
-        Processes the provided enriched power plant by calling the right strategy (based on the power plant type).
+        Processes the provided enriched power plant by calling the strategy of its type.
         :param power_plant: the enriched power plant.
-        :return: the intermediate process result containing cost and order.
+        :return: the intermediate process result containing cost and order, None for an unknown type.
+        """
+        plant_type = self._plant_types.get(power_plant.base.type)
+        if plant_type is None:
+            return None
+        return plant_type.strategy.compute(power_plant)
+
+    def process_fleet(self, fleet: Fleet, fuels: Union[dict, FuelIndex],
+                      deadline: Optional[float] = None) -> FleetState:
         """
-        if power_plant.base.is_gas_fired():
-            return self._gas_fired_strategy.compute(power_plant)
-        if power_plant.base.is_turbojet():
-            return self._turbojet_strategy.compute(power_plant)
-        if power_plant.base.is_wind_turbine():
-            return self._wind_turbine_strategy.compute(power_plant)
+        Processes the whole provided fleet at once, each strategy handling all the power plants of its type.
+        :param fleet: the fleet.
+        :param fuels: the fuels dict, as provided in the payload, or its index.
+        :param deadline: the deadline of the dispatch (time.monotonic), None for no deadline.
+        :return: the fleet state containing costs and orders.
+        """
+        state = FleetState(fleet, deadline)
+        # Resolve the fuels once for the whole fleet, with the fuels of the registered types
+        if not isinstance(fuels, FuelIndex):
+            fuels = FuelIndex(fuels, self._plant_types.fuel_table)
+
+        for plant_type in self._plant_types.types:
+            positions = fleet.index(plant_type.name)
+            if len(positions) == 0:
+                continue
+            price = fuels.price(plant_type.name)
+            efficiency, pmin, pmax = fleet.columns(plant_type.name)
+            result = plant_type.strategy.compute_batch(efficiency, pmin, pmax,
+                                                       np.array([np.nan if price is None else price],
+                                                                dtype=np.float64))
+            state.available_power[positions] = result.available_power[0]
+            state.cost[positions] = result.cost[0]
+            state.order[positions] = result.order[0]
+
+        return state
+
+    def rank_fleet(self, state: FleetState) -> List[Tuple[PlantType, np.ndarray]]:
+        """
+        Ranks and buckets the whole processed fleet in one pass: a single sort by stage of the type, then by order
+        (ties keep the fleet order).
+        :param state: the processed fleet state.
+        :return: the (PlantType, ranked positions) pairs, in dispatch order. The unknown types are left out.
+        """
+        plant_types = self._plant_types.types
+        stages = self._plant_types.stages(state.fleet, plant_types)
+        ranked = np.lexsort((state.order, stages))
+        bounds = np.searchsorted(stages[ranked], np.arange(len(plant_types) + 1))
+        return [(plant_type, ranked[bounds[number]:bounds[number + 1]])
+                for number, plant_type in enumerate(plant_types)]
 
 
 class Strategy(ABC):
@@ -103,6 +220,19 @@ class Strategy(ABC):
         """
         pass
 
+    @abstractmethod
+    def compute_batch(self, efficiency: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                      prices: np.ndarray) -> BatchProcessResult:
+        """
+        The vectorized counterpart of compute, for many power plants of the same type and many scenarios at once.
+        :param efficiency: the efficiency of each power plant.
+        :param pmin: the minimum power of each power plant.
+        :param pmax: the maximum power of each power plant.
+        :param prices: the matching fuel data of each scenario (NaN when no single fuel matches).
+        :return: the columnar process result.
+        """
+        pass
+
     @staticmethod
     def pre_process(power_plant: EnrichedPowerPlant) -> ProcessResult:
         """
@@ -127,6 +257,29 @@ class Strategy(ABC):
 
         return result
 
+    @staticmethod
+    def pre_process_batch(efficiency: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                          prices: np.ndarray) -> BatchProcessResult:
+        """
+        Vectorized counterpart of pre_process.
+        :param efficiency: the efficiency of each power plant.
+        :param pmin: the minimum power of each power plant.
+        :param pmax: the maximum power of each power plant.
+        :param prices: the matching fuel price of each scenario (NaN when no single fuel matches).
+        :return: the pre-intermediate columnar process result.
+        """
+        # Calculate the cost based on the fuel price and the power plant efficiency
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cost = prices[:, None] / efficiency[None, :]
+        cost[np.isnan(cost)] = 0.0
+
+        available_power = np.broadcast_to(pmax * 10, cost.shape)
+
+        return BatchProcessResult(available_power=available_power,
+                                  minimum_power=pmin * 10,
+                                  cost=cost,
+                                  order=np.zeros(cost.shape))
+
 
 class WindTurbineStrategy(Strategy):
     """
@@ -153,6 +306,18 @@ class WindTurbineStrategy(Strategy):
 
         return result
 
+    def compute_batch(self, efficiency: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                      prices: np.ndarray) -> BatchProcessResult:
+        # Calculate the available power based on the wind forecast (none when the forecast is missing)
+        available_power = np.trunc((pmax[None, :] / 100 * prices[:, None]) * 10)
+        available_power[np.isnan(available_power)] = 0
+        available_power = available_power.astype(np.int64)
+
+        return BatchProcessResult(available_power=available_power,
+                                  minimum_power=pmin * 10,
+                                  cost=np.zeros(available_power.shape),
+                                  order=1 - available_power)
+
 
 class TurbojetStrategy(Strategy):
     """
@@ -167,6 +332,12 @@ class TurbojetStrategy(Strategy):
 
         return result
 
+    def compute_batch(self, efficiency: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                      prices: np.ndarray) -> BatchProcessResult:
+        result = super(TurbojetStrategy, self).pre_process_batch(efficiency, pmin, pmax, prices)
+
+        return BatchProcessResult(result.available_power, result.minimum_power, result.cost, 100 + result.cost)
+
 
 class GasFiredStrategy(Strategy):
     """
@@ -181,6 +352,12 @@ class GasFiredStrategy(Strategy):
 
         return result
 
+    def compute_batch(self, efficiency: np.ndarray, pmin: np.ndarray, pmax: np.ndarray,
+                      prices: np.ndarray) -> BatchProcessResult:
+        result = super(GasFiredStrategy, self).pre_process_batch(efficiency, pmin, pmax, prices)
+
+        return BatchProcessResult(result.available_power, result.minimum_power, result.cost, 10 + result.cost)
+
 
 def average(left: int, right: int) -> int:
     """
@@ -235,9 +412,11 @@ def compute_power_plant_duet(left_result: ProcessResult, right_result: ProcessRe
     # Find the minimum power
     minimum_power = min(left_result.minimum_power, right_result.minimum_power)
 
-    print(
-        f'[start] Left dispatched: {left_result.dispatched_power} | Right dispatched: {right_result.dispatched_power} |'
-        f' Total dispatched: {left_result.dispatched_power + right_result.dispatched_power}')
+    # Sampled debug trace, only when the debug level is enabled
+    trace = tracing()
+    if trace:
+        log_event(logging.DEBUG, 'duet.start', left=left_result.name, right=right_result.name,
+                  left_dispatched=left_result.dispatched_power, right_dispatched=right_result.dispatched_power)
 
     # Check if the load is greater than the minimum power and if there's already some power dispatched
     if dispatched_power == 0 and load >= minimum_power:
@@ -273,9 +452,9 @@ def compute_power_plant_duet(left_result: ProcessResult, right_result: ProcessRe
         if right_result.dispatched_power == 0 and right_result.available_power > load > right_result.minimum_power:
             right_result.dispatched_power = load
 
-    print(
-        f'[end] Left dispatched: {left_result.dispatched_power} | Right dispatched: {right_result.dispatched_power} | '
-        f'Total dispatched: {left_result.dispatched_power + right_result.dispatched_power}')
+    if trace:
+        log_event(logging.DEBUG, 'duet.end', left=left_result.name, right=right_result.name,
+                  left_dispatched=left_result.dispatched_power, right_dispatched=right_result.dispatched_power)
 
     # Put the process results in the list. Obviously.
     to_return.append(left_result)
@@ -285,6 +464,72 @@ def compute_power_plant_duet(left_result: ProcessResult, right_result: ProcessRe
     return to_return
 
 
+def dispatch_simple_row(available_power: np.ndarray, minimum_power: np.ndarray, load: int,
+                        dispatched: np.ndarray) -> int:
+    """
+    Counterpart of SimplePowerDispatcher.compute for a single scenario: the leading power plants strictly covered by
+    the load (found on the cumulative available power) run at full power, then the next ones are handled one by one.
+    :param available_power: the available power of each power plant, already ranked.
+    :param minimum_power: the minimum power of each power plant, already ranked.
+    :param load: the load to dispatch.
+    :param dispatched: the array receiving the dispatched power.
+    :return: the remaining load.
+    """
+    full = 0
+    if load > 0 and len(available_power) and available_power.min() >= 0:
+        cumulative = np.cumsum(available_power)
+        full = int(np.searchsorted(cumulative, load, side='left'))
+        if full:
+            dispatched[:full] = available_power[:full]
+            load -= int(cumulative[full - 1])
+
+    for j in range(full, len(available_power)):
+        if load <= 0:
+            break
+        available = int(available_power[j])
+        if load > available:
+            dispatched[j] = available
+            load -= available
+        elif available > load > minimum_power[j]:
+            dispatched[j] = load
+            load = 0
+
+    return load
+
+
+def dispatch_simple_batch(available_power: np.ndarray, minimum_power: np.ndarray,
+                          load: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized counterpart of SimplePowerDispatcher.compute, for many scenarios at once.
+    :param available_power: the available power (scenarios x power plants), already ranked.
+    :param minimum_power: the minimum power (scenarios x power plants), already ranked.
+    :param load: the load to dispatch for each scenario.
+    :return: the dispatched power (scenarios x power plants) and the remaining load of each scenario.
+    """
+    dispatched = np.zeros(available_power.shape, dtype=np.int64)
+    remaining_load = load.astype(np.int64)
+
+    # Few scenarios with many power plants: handle the scenarios one by one
+    if available_power.shape[0] * 8 < available_power.shape[1]:
+        for s in range(available_power.shape[0]):
+            remaining_load[s] = dispatch_simple_row(available_power[s], minimum_power[s], int(remaining_load[s]),
+                                                    dispatched[s])
+        return dispatched, remaining_load
+
+    # Loop on the power plants, each step handling all the scenarios
+    for j in range(available_power.shape[1]):
+        available = available_power[:, j]
+        minimum = minimum_power[:, j]
+        active = remaining_load > 0
+        # Use the whole power if the load is greater, otherwise the load if greater than the minimum power
+        full = active & (remaining_load > available)
+        partial = active & ~full & (available > remaining_load) & (remaining_load > minimum)
+        dispatched[:, j] = np.where(full, available, np.where(partial, remaining_load, 0))
+        remaining_load = remaining_load - dispatched[:, j]
+
+    return dispatched, remaining_load
+
+
 class PowerDispatcher(ABC):
     """
     Abstract class for dispatching power based on the intermediate process results.
@@ -300,6 +545,45 @@ class PowerDispatcher(ABC):
         """
         pass
 
+    def compute_fleet(self, state: FleetState, positions: np.ndarray, load: int) -> int:
+        """
+        Enriches the fleet state with the power dispatched on the power plants at the provided positions. This default
+        implementation goes through process results, the dispatchers may work on the arrays directly.
+        :param state: the fleet state.
+        :param positions: the ranked positions of the power plants to dispatch.
+        :param load: the load to dispatch.
+        :return: the total dispatched power.
+        """
+        names = state.fleet.names
+        types = state.fleet.types
+        results = [ProcessResult(type=types[i], name=names[i], available_power=int(state.available_power[i]),
+                                 minimum_power=int(state.minimum_power[i]), order=float(state.order[i]),
+                                 cost=float(state.cost[i])) for i in positions]
+        # The dispatchers fill the provided process results
+        self.compute(results, load)
+        state.dispatched_power[positions] = [result.dispatched_power for result in results]
+        return int(state.dispatched_power[positions].sum())
+
+    def dispatch_batch(self, result: BatchProcessResult, ranks: np.ndarray, prices: np.ndarray,
+                       load: np.ndarray) -> np.ndarray:
+        """
+        Dispatches the load of many scenarios on the power plants of one type. This default implementation goes
+        through process results, one scenario at a time, the dispatchers may work on the arrays directly.
+        :param result: the columnar process result of the power plants.
+        :param ranks: the ranked positions of the power plants (scenarios x power plants).
+        :param prices: the fuel data of each scenario (NaN when no single fuel matches).
+        :param load: the load to dispatch for each scenario.
+        :return: the dispatched power (scenarios x power plants, in ranked order).
+        """
+        dispatched = np.zeros(ranks.shape, dtype=np.int64)
+        for s in range(ranks.shape[0]):
+            results = [ProcessResult(type='', name=str(i), available_power=int(result.available_power[s, i]),
+                                     minimum_power=int(result.minimum_power[i]), order=float(result.order[s, i]),
+                                     cost=float(result.cost[s, i])) for i in ranks[s]]
+            self.compute(results, int(load[s]))
+            dispatched[s] = [process_result.dispatched_power for process_result in results]
+        return dispatched
+
 
 class GasFiredDispatcher(PowerDispatcher):
     """
@@ -404,3 +688,15 @@ class SimplePowerDispatcher(PowerDispatcher):
 
         # Job done.
         return processed_results
+
+    def compute_fleet(self, state: FleetState, positions: np.ndarray, load: int) -> int:
+        dispatched, _ = dispatch_simple_batch(state.available_power[positions][None, :],
+                                              state.minimum_power[positions][None, :], np.array([load]))
+        state.dispatched_power[positions] = dispatched[0]
+        return int(dispatched.sum())
+
+    def dispatch_batch(self, result: BatchProcessResult, ranks: np.ndarray, prices: np.ndarray,
+                       load: np.ndarray) -> np.ndarray:
+        dispatched, _ = dispatch_simple_batch(np.take_along_axis(result.available_power, ranks, 1),
+                                              result.minimum_power[ranks], load)
+        return dispatched
@@ -0,0 +1,243 @@
+"""
+This module contains the plan subscriptions: clients subscribe to the production plan of a registered fleet for a
+load, and are pushed a new plan only when a market update (fuel prices and/or wind) actually changes it.
+
+The plans are computed once per fleet and distinct load for all the subscribers (one batch per market update), and
+compared to the last plans pushed. A slow subscriber is only sent the latest plan it missed, not every intermediate one.
+The market state of a fleet is only kept while the fleet has subscribers.
+"""
+import asyncio
+import os
+from typing import Callable, Dict, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from domain.codec import encode_plan
+from domain.engie_objects import ResponseEntry, Scenario
+from domain.fleet import Fleet
+
+# Interval between two heartbeats (comments) sent to an idle subscriber, in seconds
+DEFAULT_SUBSCRIPTION_HEARTBEAT = float(os.environ.get('SUBSCRIPTION_HEARTBEAT', 15))
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Streaming response of server-sent events, ended when the client disconnects. Unlike StreamingResponse, the stream
+    and the listener of the disconnection are run as tasks, as required by asyncio.wait on recent Python versions.
+    """
+    media_type = 'text/event-stream'
+
+    async def __call__(self, scope, receive, send) -> None:
+        tasks = [asyncio.ensure_future(self.stream_response(send)),
+                 asyncio.ensure_future(self.listen_for_disconnect(receive))]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        # The stream is cancelled on disconnection, which ends its subscription
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+
+
+class Subscriber:
+    """
+    Client subscribed to the plans of a fleet for a load, keeping the latest plan not sent yet.
+    """
+    __slots__ = ('_load', '_event', '_plan', '_version', '_closed')
+
+    def __init__(self, load: int) -> None:
+        self._load = load
+        self._event = asyncio.Event()
+        self._plan: Optional[bytes] = None
+        self._version = 0
+        self._closed = False
+
+    @property
+    def load(self) -> int:
+        return self._load
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def push(self, version: int, plan: bytes) -> None:
+        # An unsent plan is replaced: only the latest one matters
+        self._version = version
+        self._plan = plan
+        self._event.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._event.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[tuple]:
+        """
+        Waits for the next plan.
+        :param timeout: the maximum waiting time, in seconds.
+        :return: the version of the market and the plan (JSON bytes), None if the subscription is closed.
+        :raise asyncio.TimeoutError: if no plan came in time.
+        """
+        await asyncio.wait_for(self._event.wait(), timeout)
+        self._event.clear()
+        if self._closed or self._plan is None:
+            return None
+        plan, self._plan = self._plan, None
+        return self._version, plan
+
+
+class FleetSubscriptions:
+    """
+    Subscribers of a fleet, grouped by load, with the market state of the fleet and the last plan of each load.
+    """
+
+    def __init__(self) -> None:
+        self.fuels: Optional[dict] = None
+        self.version = 0
+        # The fleet of the plans: the plans are computed again when the fleet is replaced
+        self.fleet: Optional[Fleet] = None
+        self.plans: Dict[int, bytes] = {}
+        self.subscribers: Dict[int, Set[Subscriber]] = {}
+        # The market updates of the fleet are applied one after the other, so that the plans are pushed in order
+        self.lock = asyncio.Lock()
+
+    def replaces(self, fleet: Fleet) -> bool:
+        """
+        Tells whether the provided fleet differs from the fleet of the plans.
+        """
+        return self.fleet is not fleet and (self.fleet is None or self.fleet.fingerprint != fleet.fingerprint)
+
+
+class PlanSubscriptions:
+    """
+    Registry of the plan subscriptions, by fleet id. Its methods must be called on the event loop of the application,
+    the plans being computed in the thread pool.
+    """
+
+    def __init__(self, planner: Callable[[Fleet, List[Scenario]], List[List[ResponseEntry]]]) -> None:
+        self._planner = planner
+        self._fleets: Dict[str, FleetSubscriptions] = {}
+        self._counters = {'updates': 0, 'computed': 0, 'pushed': 0}
+
+    async def _dispatch(self, subscriptions: FleetSubscriptions, fleet: Fleet, loads: List[int]) -> int:
+        """
+        Computes the plans of the provided loads, then pushes those which changed to their subscribers.
+        :return: the count of changed plans.
+        """
+        subscriptions.fleet = fleet
+        if not loads:
+            return 0
+        plans = await run_in_threadpool(self._planner, fleet, [Scenario(load=load, fuels=subscriptions.fuels)
+                                                               for load in loads])
+        self._counters['computed'] += len(loads)
+        changed = 0
+        for load, plan in zip(loads, plans):
+            plan = encode_plan([entry.name for entry in plan], [entry.p for entry in plan])
+            # The subscribers of the load may have left while the plans were computed
+            if load not in subscriptions.subscribers or plan == subscriptions.plans.get(load):
+                continue
+            changed += 1
+            subscriptions.plans[load] = plan
+            for subscriber in subscriptions.subscribers[load]:
+                subscriber.push(subscriptions.version, plan)
+                self._counters['pushed'] += 1
+        return changed
+
+    async def subscribe(self, fleet_id: str, fleet: Fleet, load: int) -> Subscriber:
+        """
+        Subscribes to the plans of the provided fleet for the provided load. The current plan is pushed at once if the
+        market state of the fleet is known.
+        :param fleet_id: the fleet id.
+        :param fleet: the fleet.
+        :param load: the load.
+        :return: the subscriber.
+        """
+        subscriber = Subscriber(load)
+        subscriptions = self._fleets.setdefault(fleet_id, FleetSubscriptions())
+        # Added before waiting for the lock, so that the fleet isn't dropped meanwhile by the last unsubscribe
+        subscriptions.subscribers.setdefault(load, set()).add(subscriber)
+        async with subscriptions.lock:
+            if subscriptions.fuels is not None:
+                if subscriptions.replaces(fleet):
+                    # The fleet was replaced: the plans of every subscriber are computed again
+                    subscriptions.version += 1
+                    await self._dispatch(subscriptions, fleet, list(subscriptions.subscribers))
+                elif load not in subscriptions.plans:
+                    await self._dispatch(subscriptions, fleet, [load])
+                subscriber.push(subscriptions.version, subscriptions.plans[load])
+        return subscriber
+
+    def unsubscribe(self, fleet_id: str, subscriber: Subscriber) -> None:
+        """
+        Removes the provided subscriber.
+        :param fleet_id: the fleet id.
+        :param subscriber: the subscriber.
+        """
+        subscriptions = self._fleets.get(fleet_id)
+        if subscriptions is None:
+            return
+        subscribers = subscriptions.subscribers.get(subscriber.load, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            # The plan of a load without subscriber isn't kept up to date anymore
+            subscriptions.subscribers.pop(subscriber.load, None)
+            subscriptions.plans.pop(subscriber.load, None)
+        # Nobody watches the fleet anymore: its market state is dropped with it
+        if not subscriptions.subscribers and self._fleets.get(fleet_id) is subscriptions:
+            del self._fleets[fleet_id]
+
+    async def update(self, fleet_id: str, fleet: Fleet, fuels: dict) -> dict:
+        """
+        Applies a market update to the provided fleet (or its replacement, with the same market state): the plans of
+        its subscribed loads are computed again, and pushed to their subscribers if they changed. The update of a fleet
+        without subscribers is ignored.
+        :param fleet_id: the fleet id.
+        :param fleet: the fleet.
+        :param fuels: the changed fuels (prices and/or wind).
+        :return: the version of the market state, the count of computed plans, of changed plans and of notified
+        subscribers.
+        """
+        self._counters['updates'] += 1
+        subscriptions = self._fleets.get(fleet_id)
+        if subscriptions is None:
+            return {'version': 0, 'computed': 0, 'changed': 0, 'notified': 0}
+        async with subscriptions.lock:
+            merged = {**(subscriptions.fuels or {}), **fuels}
+            # Nothing moved, or no market state yet: nothing to compute
+            if not merged or merged == subscriptions.fuels and not subscriptions.replaces(fleet):
+                return {'version': subscriptions.version, 'computed': 0, 'changed': 0, 'notified': 0}
+            subscriptions.fuels = merged
+            subscriptions.version += 1
+
+            pushed = self._counters['pushed']
+            loads = list(subscriptions.subscribers)
+            changed = await self._dispatch(subscriptions, fleet, loads)
+            return {'version': subscriptions.version, 'computed': len(loads), 'changed': changed,
+                    'notified': self._counters['pushed'] - pushed}
+
+    async def replace(self, fleet_id: str, fleet: Fleet) -> None:
+        """
+        Replaces the fleet having the provided id: the plans of its subscribers are computed again with the current
+        market state, and pushed to them if they changed.
+        :param fleet_id: the fleet id.
+        :param fleet: the new fleet.
+        """
+        if fleet_id in self._fleets:
+            await self.update(fleet_id, fleet, {})
+
+    def close(self, fleet_id: str) -> None:
+        """
+        Closes the subscriptions of the provided fleet, and forgets its market state.
+        :param fleet_id: the fleet id.
+        """
+        subscriptions = self._fleets.pop(fleet_id, None)
+        if subscriptions is not None:
+            for subscribers in subscriptions.subscribers.values():
+                for subscriber in subscribers:
+                    subscriber.close()
+
+    def stats(self) -> dict:
+        return {'fleets': len(self._fleets),
+                'subscribers': sum(len(subscribers) for subscriptions in self._fleets.values()
+                                   for subscribers in subscriptions.subscribers.values()),
+                **self._counters}
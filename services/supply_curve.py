@@ -0,0 +1,248 @@
+"""
+This module contains the supply curve of the application: the merit order stack of a fleet is built once for given
+fuels, then the production plan of any load is read from it.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, FuelIndex, ResponseEntry
+from domain.fleet import Fleet
+from services.batch import rank
+from services.merit_order import MeritOrderStack
+from services.plant_types import PLANT_TYPES
+from services.strategy import GasFiredStrategy, TurbojetStrategy, WindTurbineStrategy
+
+# Maximum count of loads in a single sweep
+MAX_SWEEP_SIZE = 100000
+
+# Ranking strategies by power plant type
+STRATEGIES = {WIND_TURBINE: WindTurbineStrategy(), GAS_FIRED: GasFiredStrategy(), TURBOJET: TurbojetStrategy()}
+
+
+class SimpleStack:
+    """
+    The ranked power plants handled by the SimplePowerDispatcher (wind turbines and turbojets), with the cumulative
+    available power so that a load is located by binary search.
+    """
+
+    def __init__(self, names: List[str], available_power: List[int], minimum_power: List[int], costs: List[float]):
+        self._names = names
+        self._available_power = available_power
+        self._minimum_power = minimum_power
+        self._costs = costs
+        self._cum_available_power = [0] + np.cumsum(np.asarray(available_power, dtype=np.int64)).tolist()
+        self._cum_cost = [0.0] + np.cumsum(np.asarray(costs, dtype=np.float64) *
+                                           np.asarray(available_power, dtype=np.float64)).tolist()
+
+    @property
+    def names(self) -> List[str]:
+        return self._names
+
+    @property
+    def costs(self) -> List[float]:
+        return self._costs
+
+    def dispatch(self, load: int) -> Tuple[int, Dict[int, int], int]:
+        """
+        Dispatches the load with the same rules as the SimplePowerDispatcher. The power plants strictly covered by the
+        load run at full power (binary search), then the next ones are handled one by one (local fix-up), which is
+        usually a single step.
+        :param load: the load to dispatch.
+        :return: the count of leading power plants at full power, the dispatched power of the next power plants
+        (by position) and the remaining load.
+        """
+        if load <= 0:
+            return 0, {}, load
+
+        # The power plants before 'full' are such that the load remains strictly greater than their available power
+        full = bisect_left(self._cum_available_power, load, 1) - 1
+        remaining_load = load - self._cum_available_power[full]
+        tail = {}
+
+        for position in range(full, len(self._available_power)):
+            if remaining_load <= 0:
+                break
+            available = self._available_power[position]
+            if remaining_load > available:
+                tail[position] = available
+                remaining_load -= available
+            elif available > remaining_load > self._minimum_power[position]:
+                tail[position] = remaining_load
+                remaining_load = 0
+
+        return full, tail, remaining_load
+
+    def dispatched(self, full: int, tail: Dict[int, int]) -> List[int]:
+        """
+        Expands the outcome of dispatch into the dispatched power of every power plant.
+        """
+        dispatched = self._available_power[:full] + [0] * (len(self._available_power) - full)
+        for position, power in tail.items():
+            dispatched[position] = power
+        return dispatched
+
+    def cost(self, full: int, tail: Dict[int, int]) -> float:
+        """
+        Cost of the outcome of dispatch.
+        """
+        return self._cum_cost[full] + sum(self._costs[position] * power for position, power in tail.items())
+
+    def marginal_cost(self, full: int, tail: Dict[int, int]) -> Optional[float]:
+        """
+        Cost of the most expensive dispatched power plant (the power plants are ranked by cost).
+        """
+        positions = [position for position, power in tail.items() if power > 0]
+        if positions:
+            return self._costs[max(positions)]
+        for position in range(full - 1, -1, -1):
+            if self._available_power[position] > 0:
+                return self._costs[position]
+        return None
+
+
+def type_stack(fleet: Fleet, power_plant_type: str,
+               price: Optional[float]) -> Tuple[List[str], List[int], List[int], List[float]]:
+    """
+    Ranks the power plants of the provided type, for the provided fuel price.
+    :param fleet: the fleet.
+    :param power_plant_type: the power plant type.
+    :param price: the price (or percentage) of the fuel, None if unknown.
+    :return: the names, available power, minimum power and costs of the ranked power plants.
+    """
+    efficiency, pmin, pmax = fleet.columns(power_plant_type)
+    result = STRATEGIES[power_plant_type].compute_batch(efficiency, pmin, pmax,
+                                                        np.array([np.nan if price is None else price],
+                                                                 dtype=np.float64))
+    ranks = rank(result)[0]
+    return (fleet.name_array[fleet.index(power_plant_type)][ranks].tolist(),
+            result.available_power[0, ranks].tolist(),
+            result.minimum_power[ranks].tolist(),
+            result.cost[0, ranks].tolist())
+
+
+def gas_fired_stack(fleet: Fleet, price: Optional[float]) -> Tuple[List[str], MeritOrderStack]:
+    """
+    Builds the merit order stack of the gas fired power plants, for the provided gas price.
+    :param fleet: the fleet.
+    :param price: the gas price, None if unknown.
+    :return: the names of the ranked gas fired power plants and their merit order stack.
+    """
+    names, available_power, minimum_power, costs = type_stack(fleet, GAS_FIRED, price)
+    return names, MeritOrderStack(costs, minimum_power, available_power)
+
+
+class SupplyCurve:
+    """
+    The supply curve of a fleet for fixed fuels. The ranking of the power plants and the merit order stacks are built
+    once, each load being then answered by binary searches in the stacks. The plans are the same as the ones of the
+    '/productionplan' endpoint. Only the wind turbines, the gas fired and the turbojets have a stack: a fleet having
+    other registered types is rejected.
+    """
+
+    def __init__(self, fleet: Fleet, fuels: dict):
+        unstaged_types = PLANT_TYPES.unstaged_types(fleet)
+        if unstaged_types:
+            raise ValueError(f'Power plant types not supported by the supply curve: {", ".join(unstaged_types)}')
+        fuel_index = FuelIndex(fuels)
+        self._wind_turbines = SimpleStack(*type_stack(fleet, WIND_TURBINE, fuel_index.price(WIND_TURBINE)))
+        self._turbojets = SimpleStack(*type_stack(fleet, TURBOJET, fuel_index.price(TURBOJET)))
+        self._gas_fired_names, self._gas_fired = gas_fired_stack(fleet, fuel_index.price(GAS_FIRED))
+
+    @classmethod
+    def from_stacks(cls, wind_turbines: SimpleStack, gas_fired: Tuple[List[str], MeritOrderStack],
+                    turbojets: SimpleStack) -> 'SupplyCurve':
+        """
+        Builds a supply curve from already built stacks.
+        :param wind_turbines: the stack of the wind turbines.
+        :param gas_fired: the names of the ranked gas fired power plants and their merit order stack.
+        :param turbojets: the stack of the turbojets.
+        :return: the supply curve.
+        """
+        supply_curve = cls.__new__(cls)
+        supply_curve._wind_turbines = wind_turbines
+        supply_curve._turbojets = turbojets
+        supply_curve._gas_fired_names, supply_curve._gas_fired = gas_fired
+        return supply_curve
+
+    def plan(self, load: int) -> List[ResponseEntry]:
+        """
+        Gives the production plan of the provided load.
+        :param load: the load.
+        :return: a list of ResponseEntry.
+        """
+        wind_full, wind_tail, remaining_load = self._wind_turbines.dispatch(load * 10)
+        gas_solution = self._gas_fired.solve(remaining_load)
+        remaining_load -= gas_solution.load
+        turbojet_full, turbojet_tail, _ = self._turbojets.dispatch(remaining_load)
+
+        response = []
+        for names, dispatched in ((self._wind_turbines.names, self._wind_turbines.dispatched(wind_full, wind_tail)),
+                                  (self._gas_fired_names, gas_solution.dispatched),
+                                  (self._turbojets.names, self._turbojets.dispatched(turbojet_full, turbojet_tail))):
+            for name, p in zip(names, dispatched):
+                response.append(ResponseEntry(name, p))
+        return response
+
+    def costs(self, load: int) -> Tuple[float, Optional[float]]:
+        """
+        Gives the cost of the production plan of the provided load, without building the plan itself.
+        :param load: the load.
+        :return: the total cost (per hour) and the marginal cost (cost of the most expensive dispatched power plant,
+        None if nothing is dispatched).
+        """
+        _, _, remaining_load = self._wind_turbines.dispatch(load * 10)
+        marginal_cost = 0.0 if remaining_load < load * 10 else None
+
+        # Gas fired: binary search in the merit order stack, the full solve being the fallback
+        gas_cost = 0.0
+        gas_load = 0
+        if remaining_load > 0:
+            split = self._gas_fired.split(remaining_load) \
+                if remaining_load < self._gas_fired.total_available_power else None
+            if split is not None:
+                gas_cost = self._gas_fired.split_cost(*split)
+                gas_load = remaining_load
+                marginal_cost = self._gas_fired.costs[split[0]]
+            else:
+                solution = self._gas_fired.solve(remaining_load)
+                gas_cost = solution.cost
+                gas_load = solution.load
+                order = self._gas_fired.order
+                dispatched = [position for position, index in enumerate(order) if solution.dispatched[index] > 0]
+                if dispatched:
+                    marginal_cost = self._gas_fired.costs[dispatched[-1]]
+        remaining_load -= gas_load
+
+        turbojet_full, turbojet_tail, _ = self._turbojets.dispatch(remaining_load)
+        turbojet_cost = self._turbojets.cost(turbojet_full, turbojet_tail)
+        turbojet_marginal_cost = self._turbojets.marginal_cost(turbojet_full, turbojet_tail)
+        if turbojet_marginal_cost is not None:
+            marginal_cost = turbojet_marginal_cost
+
+        # The power is expressed in tenth of MW
+        return (gas_cost + turbojet_cost) / 10, marginal_cost
+
+    def sweep(self, start: int, stop: int, step: int = 1, plans: bool = False) -> List[dict]:
+        """
+        Gives the costs (and optionally the plans) of a range of loads.
+        :param start: the first load.
+        :param stop: the last load (included).
+        :param step: the step between two loads.
+        :param plans: if the plans have to be given.
+        :return: one entry per load.
+        """
+        if step <= 0:
+            raise ValueError(f'The step must be positive: {step}')
+        if len(range(start, stop + 1, step)) > MAX_SWEEP_SIZE:
+            raise ValueError(f'Too many loads, the maximum is {MAX_SWEEP_SIZE}')
+
+        points = []
+        for load in range(start, stop + 1, step):
+            cost, marginal_cost = self.costs(load)
+            point = {'load': load, 'cost': cost, 'marginal_cost': marginal_cost}
+            if plans:
+                point['plan'] = self.plan(load)
+            points.append(point)
+        return points
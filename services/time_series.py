@@ -0,0 +1,159 @@
+"""
+This module contains the time series services of the application: the production plans of consecutive intervals of
+the same fleet, where only the load and the fuels (mostly the wind) change from one interval to the next.
+"""
+import json
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, FuelIndex, ResponseEntry, Scenario
+from domain.fleet import Fleet
+from services.batch import BatchPlanner
+from services.merit_order import DispatchSolution, MeritOrderStack
+from services.plant_types import PLANT_TYPES
+from services.supply_curve import SimpleStack, SupplyCurve, gas_fired_stack, type_stack
+
+# Maximum length of a line of a stream, in bytes
+MAX_LINE_SIZE = 64 * 1024 * 1024
+
+# Maximum count of gas fired solutions kept by a planner
+MAX_SOLUTIONS = 4096
+
+
+class MemoizedStack:
+    """
+    Merit order stack keeping its last solutions by load (least recently used first out).
+    """
+
+    def __init__(self, stack: MeritOrderStack, max_size: int = MAX_SOLUTIONS):
+        self._stack = stack
+        self._max_size = max_size
+        self._solutions: OrderedDict = OrderedDict()
+
+    def solve(self, load: int) -> DispatchSolution:
+        solution = self._solutions.get(load)
+        if solution is not None:
+            self._solutions.move_to_end(load)
+            return solution
+
+        solution = self._stack.solve(load)
+        self._solutions[load] = solution
+        if len(self._solutions) > self._max_size:
+            self._solutions.popitem(last=False)
+        return solution
+
+
+class TimeSeriesPlanner:
+    """
+    Planner computing the production plans of consecutive intervals of a fleet. The stack of each power plant type
+    is only rebuilt when the price of its fuel changes, the last stack of each type being kept (with its last gas fired
+    solutions): the memory doesn't depend on the count of intervals. The plans are the same as the ones of the
+    '/productionplan' endpoint. A fleet having other registered types than the ones of the stacks is planned by the
+    batch planner, one interval at a time.
+    """
+
+    def __init__(self, fleet: Fleet):
+        self._fleet = fleet
+        self._batch_planner = BatchPlanner() if PLANT_TYPES.unstaged_types(fleet) else None
+        self._stacks: Dict[str, Tuple[Optional[float], object]] = {}
+        self._builds = 0
+
+    @property
+    def builds(self) -> int:
+        """
+        Count of stacks built so far.
+        """
+        return self._builds
+
+    @property
+    def fleet(self) -> Fleet:
+        return self._fleet
+
+    def _stack(self, power_plant_type: str, price: Optional[float]):
+        cached = self._stacks.get(power_plant_type)
+        if cached is not None and self._reusable(power_plant_type, cached[0], price):
+            self._stacks[power_plant_type] = (price, cached[1])
+            return cached[1]
+
+        stack = self._build(power_plant_type, price)
+        self._stacks[power_plant_type] = (price, stack)
+        self._builds += 1
+        return stack
+
+    def _reusable(self, power_plant_type: str, cached_price: Optional[float], price: Optional[float]) -> bool:
+        """
+        Tells if the stack built for the cached price can be used for the provided price.
+        """
+        return cached_price == price
+
+    def _build(self, power_plant_type: str, price: Optional[float]):
+        if power_plant_type == GAS_FIRED:
+            names, stack = gas_fired_stack(self._fleet, price)
+            return names, MemoizedStack(stack)
+        return SimpleStack(*type_stack(self._fleet, power_plant_type, price))
+
+    def plan(self, scenario: Scenario) -> List[ResponseEntry]:
+        """
+        Computes the production plan of the provided interval.
+        :param scenario: the load and the fuels of the interval.
+        :return: a list of ResponseEntry.
+        """
+        if self._batch_planner is not None:
+            return self._batch_planner.plan(self._fleet, [scenario])[0]
+        fuel_index = FuelIndex(scenario.fuels)
+        supply_curve = SupplyCurve.from_stacks(self._stack(WIND_TURBINE, fuel_index.price(WIND_TURBINE)),
+                                               self._stack(GAS_FIRED, fuel_index.price(GAS_FIRED)),
+                                               self._stack(TURBOJET, fuel_index.price(TURBOJET)))
+        return supply_curve.plan(scenario.load)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Splits a stream of chunks into its non blank lines, only the current line being buffered.
+    :param chunks: the chunks.
+    :return: the lines.
+    """
+    buffer = b''
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            if len(buffer) > MAX_LINE_SIZE:
+                raise ValueError(f'Line too long, the maximum is {MAX_LINE_SIZE} bytes')
+            for line in lines:
+                if line.strip():
+                    yield line
+    finally:
+        # The chunks may be left unread, when the stream ends on an error
+        if hasattr(chunks, 'aclose'):
+            await chunks.aclose()
+    if buffer.strip():
+        yield buffer
+
+
+def parse_fleet_line(line: bytes) -> List[dict]:
+    """
+    Parses the first line of a stream: either the list of power plants or an object having a 'powerplants' field.
+    :param line: the line.
+    :return: the raw power plants, to be validated.
+    """
+    data = json.loads(line)
+    if isinstance(data, dict):
+        return data.get('powerplants')
+    return data
+
+
+class LineStreamingResponse(StreamingResponse):
+    """
+    Streaming response of JSON lines, sent while the request body is still being read: unlike StreamingResponse,
+    it doesn't listen for the disconnection of the client, which would consume the request body.
+    """
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        async for chunk in self.body_iterator:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
@@ -0,0 +1,427 @@
+"""
+This module contains the unit commitment engine of the application: the commitment and the dispatch of the thermal
+power plants (gas fired and turbojets) over a horizon of periods, with start-up costs, ramp limits and minimum up and
+down times, the wind turbines being dispatched first at each period.
+
+The engine is a Lagrangian relaxation of the demand of each period. Given the multipliers (the prices of the
+periods), each unit is scheduled on its own by dynamic programming over its on/off durations, all the units at once
+(numpy). The multipliers are then moved by subgradient steps, each new commitment being dispatched (merit order
+within the ramp limits) to keep the best actual plan.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from domain.engie_objects import GAS_FIRED, TURBOJET, WIND_TURBINE, FuelIndex, ResponseEntry, \
+    UnitCommitmentPayload, UnitState
+from domain.fleet import Fleet
+from services.batch import rank
+from services.plant_types import PLANT_TYPES
+from services.strategy import GasFiredStrategy, TurbojetStrategy, WindTurbineStrategy, dispatch_simple_batch
+
+# Maximum count of subgradient iterations
+DEFAULT_MAX_ITERATIONS = 60
+# Relative gap between the best plan and the lower bound at which the solve stops
+DEFAULT_TOLERANCE = 1e-3
+# Cost of the load not served (or of the power produced above the load), in € per MWh
+DEFAULT_VOLL = 3000.0
+
+# Maximum count of repair steps, and relative price increase of each step
+DEFAULT_REPAIR_STEPS = 20
+REPAIR_RATE = 0.05
+
+# Ramp limit standing for 'unlimited', in tenth of MW
+UNLIMITED_RAMP = 10 ** 12
+
+
+class UnitCommitmentProblem:
+    """
+    Class defining a unit commitment problem as arrays: T periods and n thermal units. The power is expressed in tenth
+    of MW, the costs in € per MWh.
+    """
+
+    def __init__(self, names: List[str], cost: np.ndarray, pmin: np.ndarray, pmax: np.ndarray, demand: np.ndarray,
+                 period_hours: float = 1.0, startup_cost: Optional[np.ndarray] = None,
+                 ramp_up: Optional[np.ndarray] = None, ramp_down: Optional[np.ndarray] = None,
+                 min_up: Optional[np.ndarray] = None, min_down: Optional[np.ndarray] = None,
+                 initial_on: Optional[np.ndarray] = None, initial_periods: Optional[np.ndarray] = None,
+                 initial_power: Optional[np.ndarray] = None):
+        size = len(names)
+        self.names = names
+        self.cost = np.asarray(cost, dtype=np.float64).reshape(len(demand), size)
+        self.pmin = np.asarray(pmin, dtype=np.int64)
+        self.pmax = np.asarray(pmax, dtype=np.int64)
+        self.demand = np.asarray(demand, dtype=np.int64)
+        self.period_hours = period_hours
+        self.startup_cost = np.zeros(size) if startup_cost is None else np.asarray(startup_cost, dtype=np.float64)
+        self.ramp_up = np.full(size, UNLIMITED_RAMP) if ramp_up is None else np.asarray(ramp_up, dtype=np.int64)
+        self.ramp_down = np.full(size, UNLIMITED_RAMP) if ramp_down is None else np.asarray(ramp_down, dtype=np.int64)
+        min_up = np.ones(size, dtype=np.int64) if min_up is None else np.maximum(np.asarray(min_up, dtype=np.int64), 1)
+        min_down = np.ones(size, dtype=np.int64) if min_down is None \
+            else np.maximum(np.asarray(min_down, dtype=np.int64), 1)
+        # By default, the units are off since long enough to start
+        self.initial_on = np.zeros(size, dtype=bool) if initial_on is None else np.asarray(initial_on, dtype=bool)
+        self.initial_periods = min_down.copy() if initial_periods is None \
+            else np.maximum(np.asarray(initial_periods, dtype=np.int64), 1)
+        # Periods each unit still has to stay in its initial state (on or off), before the clamp below
+        self.initial_remaining = np.maximum(np.where(self.initial_on, min_up, min_down) - self.initial_periods, 0)
+        # A run never exceeds the horizon: the longer minimum up and down times (which size the states of the schedule)
+        # are clamped, which changes no schedule
+        self.min_up = np.minimum(min_up, len(demand) + 1)
+        self.min_down = np.minimum(min_down, len(demand) + 1)
+        self.initial_power = np.zeros(size, dtype=np.int64) if initial_power is None \
+            else np.where(self.initial_on, np.asarray(initial_power, dtype=np.int64), 0)
+        # Merit order of each period, used by every dispatch
+        self.order = np.argsort(self.cost, axis=1, kind='stable')
+
+    @property
+    def periods(self) -> int:
+        return len(self.demand)
+
+    @property
+    def size(self) -> int:
+        return len(self.names)
+
+
+class UnitCommitmentSolution:
+    """
+    Class defining the outcome of a unit commitment solve.
+    """
+
+    def __init__(self, commitment: np.ndarray, dispatched: np.ndarray, imbalance: np.ndarray, cost: float,
+                 lower_bound: float, multipliers: np.ndarray, iterations: int):
+        self.commitment = commitment
+        self.dispatched = dispatched
+        self.imbalance = imbalance
+        self.cost = cost
+        self.lower_bound = lower_bound
+        self.multipliers = multipliers
+        self.iterations = iterations
+
+    @property
+    def gap(self) -> float:
+        """
+        Relative gap between the cost and the lower bound of the optimal cost.
+        """
+        return (self.cost - self.lower_bound) / max(abs(self.cost), 1.0)
+
+
+class UnitCommitmentSolver:
+    """
+    Lagrangian relaxation solver of unit commitment problems.
+    """
+
+    def __init__(self, max_iterations: int = DEFAULT_MAX_ITERATIONS, tolerance: float = DEFAULT_TOLERANCE,
+                 voll: float = DEFAULT_VOLL, repair_steps: int = DEFAULT_REPAIR_STEPS):
+        self._max_iterations = max_iterations
+        self._repair_steps = repair_steps
+        self._tolerance = tolerance
+        self._voll = voll
+
+    @staticmethod
+    def initial_multipliers(problem: UnitCommitmentProblem) -> np.ndarray:
+        """
+        Gives the merit order price of each period: the cost of the unit covering the demand, ignoring the minimum
+        power and the inter-temporal constraints.
+        """
+        order = problem.order
+        cum_pmax = np.cumsum(problem.pmax[order], axis=1)
+        marginal = np.minimum((cum_pmax < problem.demand[:, None]).sum(axis=1), problem.size - 1)
+        return np.take_along_axis(problem.cost, order, 1)[np.arange(problem.periods), marginal]
+
+    def solve(self, problem: UnitCommitmentProblem, multipliers: Optional[np.ndarray] = None) -> UnitCommitmentSolution:
+        """
+        Solves the provided problem.
+        :param problem: the problem.
+        :param multipliers: the multipliers to start from (e.g. the ones of the previous horizon), in € per MWh.
+        :return: the best plan found.
+        """
+        if problem.size == 0 or problem.periods == 0:
+            dispatched = np.zeros((problem.periods, problem.size), dtype=np.int64)
+            imbalance = problem.demand.copy()
+            cost = self._voll * np.abs(imbalance).sum() * problem.period_hours / 10
+            return UnitCommitmentSolution(dispatched > 0, dispatched, imbalance, cost, cost,
+                                          np.zeros(problem.periods), 0)
+
+        warm = multipliers is not None and len(multipliers) == problem.periods
+        prices = np.asarray(multipliers, dtype=np.float64) if warm else self.initial_multipliers(problem)
+        energy = problem.period_hours / 10
+
+        best: Optional[Tuple[float, np.ndarray, np.ndarray, np.ndarray]] = None
+        lower_bound = -np.inf
+        best_prices = prices
+        evaluated = {}
+        # Step size factor, halved when the lower bound stalls
+        factor = 0.5 if warm else 1.0
+        stall = 0
+        iteration = 0
+
+        for iteration in range(1, self._max_iterations + 1):
+            dual, commitment, on_power = self._relax(problem, prices)
+            if dual > lower_bound + 1e-9 * abs(dual):
+                lower_bound = dual
+                best_prices = prices
+                stall = 0
+            else:
+                stall += 1
+                if stall >= 3:
+                    factor /= 2
+                    stall = 0
+
+            # Actual plan of the commitment, if not seen yet
+            best = self._evaluate(problem, commitment, evaluated, best)
+            if best[0] - lower_bound <= self._tolerance * max(abs(best[0]), 1.0):
+                break
+
+            # Subgradient step (Polyak)
+            subgradient = (problem.demand - (commitment * on_power).sum(axis=1)) * energy
+            norm = float((subgradient ** 2).sum())
+            if norm == 0:
+                break
+            prices = np.maximum(prices + factor * (best[0] - dual) / norm * subgradient, 0.0)
+
+        # The relaxation tends to commit too few units: raise the prices of the periods where the load is not served
+        if best[3].max() > 0:
+            prices = best_prices
+            for _ in range(self._repair_steps):
+                _, commitment, _ = self._relax(problem, prices)
+                best = self._evaluate(problem, commitment, evaluated, best)
+                imbalance = evaluated[commitment.tobytes()]
+                if imbalance.max() <= 0:
+                    break
+                prices = np.where(imbalance > 0, prices * (1 + REPAIR_RATE) + 1.0, prices)
+
+        cost, commitment, dispatched, imbalance = best
+        return UnitCommitmentSolution(commitment, dispatched, imbalance, cost, min(lower_bound, cost), best_prices,
+                                      iteration)
+
+    def _relax(self, problem: UnitCommitmentProblem, prices: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        Solves the relaxed problem: each unit runs at full power when cheaper than the price, else at minimum power,
+        and is committed by the dynamic programming.
+        :return: the value of the relaxed problem (a lower bound), the commitment and the power of the units when on.
+        """
+        energy = problem.period_hours / 10
+        reduced_cost = (problem.cost - prices[:, None]) * energy
+        on_power = np.where(reduced_cost < 0, problem.pmax, problem.pmin)
+        unit_cost, commitment = self._schedule(problem, reduced_cost * on_power)
+        return unit_cost + (prices * problem.demand).sum() * energy, commitment, on_power
+
+    def _evaluate(self, problem: UnitCommitmentProblem, commitment: np.ndarray, evaluated: dict,
+                  best: Optional[tuple]) -> tuple:
+        """
+        Dispatches the provided commitment, if not evaluated yet, and gives the best plan so far.
+        """
+        key = commitment.tobytes()
+        if key in evaluated:
+            return best
+        cost, dispatched, imbalance = self._dispatch(problem, commitment)
+        evaluated[key] = imbalance
+        if best is None or cost < best[0]:
+            return cost, commitment, dispatched, imbalance
+        return best
+
+    @staticmethod
+    def _schedule(problem: UnitCommitmentProblem, on_cost: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        Schedules each unit on its own: dynamic programming over the states 'on for k periods' (k below the minimum
+        up time, the last state meaning at least) and 'off for k periods' (same with the minimum down time).
+        :param problem: the problem.
+        :param on_cost: the cost of each unit when on, for each period.
+        :return: the total cost of the units and their commitment (periods x units).
+        """
+        periods, size = on_cost.shape
+        rows = np.arange(size)
+        max_up = int(problem.min_up.max())
+        # The last state is a spare one, always unreachable
+        states = max_up + int(problem.min_down.max()) + 1
+        # Indexes of the 'at least' states, and of the states just after (reached by the shifts, to be reset)
+        last_on = problem.min_up - 1
+        last_off = max_up + problem.min_down - 1
+        after_on = np.where(last_on + 1 < max_up, last_on + 1, states - 1)
+        after_off = last_off + 1
+
+        # The state reached after the initial periods: the periods left to stay in the initial state are at most the
+        # clamped minimum time minus one
+        remaining = np.minimum(problem.initial_remaining, np.where(problem.initial_on, last_on, last_off - max_up))
+        initial = np.where(problem.initial_on, last_on, last_off) - remaining
+        values = np.full((periods + 1, size, states), np.inf)
+        values[0, rows, initial] = 0.0
+
+        for t in range(periods):
+            previous = values[t]
+            current = values[t + 1]
+            stay_on = previous[rows, last_on]
+            stay_off = previous[rows, last_off]
+            # Start up and shut down, then one more period in the same state
+            current[:, 0] = stay_off + problem.startup_cost
+            current[:, 1:max_up] = previous[:, :max_up - 1]
+            current[:, max_up] = stay_on
+            current[:, max_up + 1:] = previous[:, max_up:-1]
+            current[rows, after_on] = np.inf
+            current[rows, after_off] = np.inf
+            current[rows, last_on] = np.minimum(current[rows, last_on], stay_on)
+            current[rows, last_off] = np.minimum(current[rows, last_off], stay_off)
+            current[:, :max_up] += on_cost[t][:, None]
+
+        # Backtrack, for all the units at once
+        state = values[periods].argmin(axis=1)
+        total = float(values[periods, rows, state].sum())
+        commitment = np.empty((periods, size), dtype=bool)
+        for t in range(periods, 0, -1):
+            previous = values[t - 1]
+            commitment[t - 1] = state < max_up
+            stay_on = previous[rows, last_on]
+            stay_off = previous[rows, last_off]
+            shifted = previous[rows, np.maximum(state - 1, 0)]
+
+            predecessor = state - 1
+            predecessor = np.where(state == 0, last_off, predecessor)
+            predecessor = np.where(state == max_up, last_on, predecessor)
+            incoming_on = np.where(state == 0, stay_off + problem.startup_cost, shifted)
+            predecessor = np.where((state == last_on) & (stay_on <= incoming_on), last_on, predecessor)
+            incoming_off = np.where(state == max_up, stay_on, shifted)
+            predecessor = np.where((state == last_off) & (stay_off <= incoming_off), last_off, predecessor)
+            state = predecessor
+
+        return total, commitment
+
+    def _dispatch(self, problem: UnitCommitmentProblem,
+                  commitment: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        Dispatches the demand of each period among the committed units, in merit order within the ramp limits.
+        :param problem: the problem.
+        :param commitment: the commitment (periods x units).
+        :return: the cost (load not served included), the dispatched power (periods x units) and the imbalance of
+        each period (positive when some load is not served).
+        """
+        dispatched = np.zeros(commitment.shape, dtype=np.int64)
+        previous_power = problem.initial_power
+        previous_on = problem.initial_on
+
+        for t in range(problem.periods):
+            on = commitment[t]
+            running = on & previous_on
+            low = np.where(on, problem.pmin, 0)
+            high = np.where(on, problem.pmax, 0)
+            high = np.where(running, np.minimum(high, previous_power + problem.ramp_up), high)
+            low = np.where(running, np.minimum(np.maximum(low, previous_power - problem.ramp_down), high), low)
+            high = np.where(on & ~previous_on, np.minimum(high, np.maximum(problem.pmin, problem.ramp_up)), high)
+
+            order = problem.order[t]
+            room = (high - low)[order]
+            need = problem.demand[t] - low.sum()
+            power = low
+            power[order] += np.minimum(np.maximum(need - (np.cumsum(room) - room), 0), room)
+            dispatched[t] = power
+            previous_power = power
+            previous_on = on
+
+        imbalance = problem.demand - dispatched.sum(axis=1)
+        starts = commitment & ~np.vstack((problem.initial_on[None, :], commitment[:-1]))
+        energy = problem.period_hours / 10
+        cost = float((problem.cost * dispatched).sum() * energy + (starts * problem.startup_cost).sum()
+                     + self._voll * np.abs(imbalance).sum() * energy)
+        return cost, dispatched, imbalance
+
+
+def final_states(problem: UnitCommitmentProblem, solution: UnitCommitmentSolution) -> List[UnitState]:
+    """
+    Gives the state of each unit at the end of the horizon, to start the next one from.
+    :param problem: the problem.
+    :param solution: the solution.
+    :return: the states.
+    """
+    states = []
+    for i, name in enumerate(problem.names):
+        schedule = solution.commitment[:, i]
+        on = bool(schedule[-1])
+        changes = np.flatnonzero(schedule != on)
+        periods = problem.periods - 1 - int(changes[-1]) if len(changes) else \
+            problem.periods + (int(problem.initial_periods[i]) if problem.initial_on[i] == on else 0)
+        states.append(UnitState(name=name, on=on, periods=periods, p=int(solution.dispatched[-1, i])))
+    return states
+
+
+def plan_unit_commitment(payload: UnitCommitmentPayload, solver: UnitCommitmentSolver) -> dict:
+    """
+    Computes the unit commitment of the provided payload: the wind turbines are dispatched first at each period (as
+    in the production plan), then the thermal power plants are committed over the horizon.
+    :param payload: the payload.
+    :param solver: the solver.
+    :return: the plans of the periods (power plants in the payload order), their cost, the final states and the
+    multipliers to start the next horizon from.
+    :raise ValueError: if the fleet has other registered types than the wind turbines, the gas fired and the turbojets.
+    """
+    fleet = Fleet(payload.powerplants)
+    unstaged_types = PLANT_TYPES.unstaged_types(fleet)
+    if unstaged_types:
+        raise ValueError(f'Power plant types not supported by the unit commitment: {", ".join(unstaged_types)}')
+    fuel_indexes = [FuelIndex(period.fuels) for period in payload.periods]
+    periods = len(payload.periods)
+
+    def prices(power_plant_type: str) -> np.ndarray:
+        values = [fuel_index.price(power_plant_type) for fuel_index in fuel_indexes]
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    # Wind turbines first, as in the production plan
+    dispatched = np.zeros((periods, len(fleet)), dtype=np.int64)
+    wind_positions = fleet.index(WIND_TURBINE)
+    efficiency, pmin, pmax = fleet.columns(WIND_TURBINE)
+    wind_result = WindTurbineStrategy().compute_batch(efficiency, pmin, pmax, prices(WIND_TURBINE))
+    wind_ranks = rank(wind_result)
+    wind_dispatched, demand = dispatch_simple_batch(np.take_along_axis(wind_result.available_power, wind_ranks, 1),
+                                                    wind_result.minimum_power[wind_ranks],
+                                                    np.array([period.load for period in payload.periods],
+                                                             dtype=np.int64) * 10)
+    wind_block = np.zeros((periods, len(wind_positions)), dtype=np.int64)
+    np.put_along_axis(wind_block, wind_ranks, wind_dispatched, 1)
+    dispatched[:, wind_positions] = wind_block
+
+    # Thermal units, with the cost model of the strategies
+    positions, names, costs, minimum_power, maximum_power = [], [], [], [], []
+    for power_plant_type, strategy in ((GAS_FIRED, GasFiredStrategy()), (TURBOJET, TurbojetStrategy())):
+        efficiency, pmin, pmax = fleet.columns(power_plant_type)
+        result = strategy.compute_batch(efficiency, pmin, pmax, prices(power_plant_type))
+        type_positions = fleet.index(power_plant_type)
+        positions.append(type_positions)
+        names += fleet.name_array[type_positions].tolist()
+        costs.append(result.cost.reshape(periods, len(type_positions)))
+        minimum_power.append(result.minimum_power)
+        maximum_power.append(pmax * 10)
+    positions = np.concatenate(positions)
+
+    constraints = {constraint.name: constraint for constraint in payload.constraints}
+    initial = {state.name: state for state in payload.initial}
+    unit_constraints = [constraints.get(name) for name in names]
+    unit_states = [initial.get(name) for name in names]
+
+    def ramp(value: Optional[float]) -> int:
+        return UNLIMITED_RAMP if value is None else int(round(value * 10))
+
+    problem = UnitCommitmentProblem(
+        names, np.concatenate(costs, axis=1), np.concatenate(minimum_power), np.concatenate(maximum_power), demand,
+        period_hours=payload.period_hours,
+        startup_cost=np.array([c.startup_cost if c else 0.0 for c in unit_constraints], dtype=np.float64),
+        ramp_up=np.array([ramp(c.ramp_up if c else None) for c in unit_constraints], dtype=np.int64),
+        ramp_down=np.array([ramp(c.ramp_down if c else None) for c in unit_constraints], dtype=np.int64),
+        min_up=np.array([c.min_up if c else 1 for c in unit_constraints], dtype=np.int64),
+        min_down=np.array([c.min_down if c else 1 for c in unit_constraints], dtype=np.int64),
+        initial_on=np.array([s.on if s else False for s in unit_states], dtype=bool),
+        initial_periods=np.array([s.periods if s else 10 ** 6 for s in unit_states], dtype=np.int64),
+        initial_power=np.array([s.p if s else 0 for s in unit_states], dtype=np.int64))
+
+    solution = solver.solve(problem, payload.multipliers)
+    dispatched[:, positions] = solution.dispatched
+
+    names = fleet.names
+    return {
+        'plans': [[ResponseEntry(name, p) for name, p in zip(names, period)] for period in dispatched.tolist()],
+        'imbalance': solution.imbalance.tolist(),
+        'cost': solution.cost,
+        'lower_bound': solution.lower_bound,
+        'gap': solution.gap,
+        'iterations': solution.iterations,
+        'multipliers': solution.multipliers.tolist(),
+        'final_state': final_states(problem, solution)
+    }
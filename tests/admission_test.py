@@ -0,0 +1,184 @@
+import asyncio
+import threading
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_full_queue(self):
+        # Test that a request is rejected right away when the slots and the queue are taken
+        control = AdmissionControl(max_active=1, max_waiting=0)
+        with control.admit():
+            with self.assertRaises(Overloaded):
+                with control.admit():
+                    pass
+        with control.admit():
+            pass
+        self.assertEqual(control.stats()['admitted'], 2)
+        self.assertEqual(control.stats()['rejected'], 1)
+
+    def test_deadline(self):
+        # Test that a waiting request gives up at its deadline, and that a released slot is given to a waiting one
+        control = AdmissionControl(max_active=1, max_waiting=1)
+        with control.admit():
+            with self.assertRaises(Overloaded):
+                with control.admit(time.monotonic() + 0.01):
+                    pass
+
+        admitted = threading.Event()
+
+        def wait():
+            with control.admit(time.monotonic() + 5):
+                admitted.set()
+
+        with control.admit():
+            thread = threading.Thread(target=wait)
+            thread.start()
+            time.sleep(0.01)
+            self.assertFalse(admitted.is_set())
+        thread.join()
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(control.stats()['active'], 0)
+
+    def test_async_queue(self):
+        # Test that the waiting coroutines hold no thread: the queue is bounded by its own size, beyond the count of
+        # threads of the pool, and the next requests are rejected right away
+        waiting = min(32, (os.cpu_count() or 1) + 4) + 10
+        control = AdmissionControl(max_active=1, max_waiting=waiting, max_wait=5)
+
+        async def scenario():
+            threads = threading.active_count()
+            with control.admit():
+                async def admitted():
+                    async with control.admit_async():
+                        return True
+
+                tasks = [asyncio.ensure_future(admitted()) for _ in range(waiting)]
+                await asyncio.sleep(0.01)
+                self.assertEqual(control.stats()['waiting'], waiting)
+                self.assertEqual(threading.active_count(), threads)
+
+                start = time.perf_counter()
+                with self.assertRaises(Overloaded):
+                    async with control.admit_async():
+                        pass
+                self.assertLess(time.perf_counter() - start, 0.01)
+            # The slot released by a thread is handed over to the waiting coroutines, one after the other
+            self.assertEqual(await asyncio.gather(*tasks), [True] * waiting)
+            self.assertEqual(control.stats()['active'], 0)
+            self.assertEqual(control.stats()['admitted'], waiting + 1)
+
+            with control.admit():
+                with self.assertRaises(Overloaded):
+                    async with control.admit_async(time.monotonic() + 0.01):
+                        pass
+            self.assertEqual(control.stats()['waiting'], 0)
+
+        asyncio.run(scenario())
+
+    def test_arrival_order(self):
+        # Test that the threads and the coroutines are admitted in their arrival order, a released slot going to the
+        # first one whatever its kind, and that a new request never takes the slot of a waiting one
+        control = AdmissionControl(max_active=1, max_waiting=8, max_wait=5)
+        order = []
+
+        async def scenario():
+            async def coroutine(name: str):
+                async with control.admit_async():
+                    order.append(name)
+
+            def thread(name: str):
+                with control.admit():
+                    order.append(name)
+
+            async def queued(count: int):
+                while control.stats()['waiting'] < count:
+                    await asyncio.sleep(0.001)
+
+            loop = asyncio.get_running_loop()
+            with control.admit():
+                first = asyncio.ensure_future(coroutine('first'))
+                await queued(1)
+                second = loop.run_in_executor(None, thread, 'second')
+                await queued(2)
+                third = asyncio.ensure_future(coroutine('third'))
+                await queued(3)
+                fourth = loop.run_in_executor(None, thread, 'fourth')
+                await queued(4)
+            # The slot is handed over to the first coroutine, and so on, while new coroutines keep coming
+            fifth = asyncio.ensure_future(coroutine('fifth'))
+            await asyncio.gather(first, second, third, fourth, fifth)
+
+        asyncio.run(scenario())
+        self.assertEqual(order, ['first', 'second', 'third', 'fourth', 'fifth'])
+        self.assertEqual(control.stats()['active'], 0)
+        self.assertEqual(control.stats()['admitted'], 6)
+
+    def test_request_deadline(self):
+        # Test that the deadline counts from the arrival of the request
+        self.assertIsNone(request_deadline(None))
+        token = current_request.set(RequestTimer(time.perf_counter() - 0.5))
+        try:
+            self.assertAlmostEqual(request_deadline(1.0) - time.monotonic(), 0.5, delta=0.05)
+        finally:
+            current_request.reset(token)
+
+    def test_time_budget(self):
+        # Test that a budgeted request gives the same plan, with its optimality
+        client = TestClient(app)
+        plan_cache.invalidate()
+        expected = client.post('/productionplan', json=self.payload.dict())
+        self.assertEqual(expected.headers['X-Plan-Optimal'], 'true')
+        plan_cache.invalidate()
+        for response in (client.post('/productionplan?budget_ms=500', json=self.payload.dict()),
+                         client.post('/productionplan', json=self.payload.dict(), headers={'X-Time-Budget-Ms': '500'})):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+            self.assertEqual(response.headers['X-Plan-Optimal'], 'true')
+
+        for budget in ('0', '-5', 'soon'):
+            self.assertEqual(client.post('/productionplan?budget_ms=' + budget, json=self.payload.dict()).status_code,
+                             422)
+
+    def test_timed_plan(self):
+        # Test that a past deadline still gives a feasible plan, not proven optimal
+        count = 20
+        power_plants = [PowerPlant(name='gas%d' % i, type=GAS_FIRED, efficiency=0.6 - 0.01 * i, pmin=100 + 4 * i - 1,
+                                   pmax=100 + 4 * i) for i in range(count)]
+        fuels = {**self.payload.fuels, 'wind(%)': 0}
+        load = sum(p.pmax for p in power_plants) // 2 + 1
+        payload = Payload(load=load, fuels=fuels, powerplants=power_plants)
+        plan, optimal = compute_timed_production_plan(payload, time.monotonic() - 1)
+        self.assertFalse(optimal)
+        self.assertEqual(sum(entry.p for entry in plan), load * 10)
+        self.assertTrue(compute_timed_production_plan(payload)[1])
+
+    def test_overloaded(self):
+        # Test that the requests beyond the capacity are rejected with a 503, cached plans being still served
+        client = TestClient(app)
+        control = AdmissionControl(max_active=1, max_waiting=0)
+        plan_cache.invalidate()
+        with mock.patch('app.app.admission_control', control):
+            with control.admit():
+                response = client.post('/productionplan', json=self.payload.dict())
+                self.assertEqual(response.status_code, 503)
+                self.assertIn('Retry-After', response.headers)
+            self.assertEqual(client.post('/productionplan', json=self.payload.dict()).status_code, 200)
+            with control.admit():
+                self.assertEqual(client.post('/productionplan', json=self.payload.dict()).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
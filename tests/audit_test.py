@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class AuditTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'audit.db')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_record_and_query(self):
+        log = AuditLog(self.path, sync_interval=0.05)
+        try:
+            plan = compute_production_plan(self.payload)
+            fleet = Fleet(self.payload.powerplants)
+            self.assertTrue(log.record('a', self.payload.load, self.payload.fuels, plan, self.payload.powerplants))
+            middle = time.time()
+            time.sleep(0.01)
+            self.assertTrue(log.record('b', 300, self.payload.fuels, plan, fleet, 'registered', optimal=False))
+            log.flush()
+
+            plans = log.query()
+            self.assertEqual([entry['key'] for entry in plans], ['b', 'a'])
+            self.assertEqual(plans[1]['plan'], [{'name': entry.name, 'p': entry.p} for entry in plan])
+            self.assertEqual(plans[1]['fuels'], self.payload.fuels)
+            self.assertEqual(plans[0]['load'], 300)
+            self.assertFalse(plans[0]['optimal'])
+
+            # The payloads and the registered fleets are identified by the same fingerprint
+            self.assertEqual(plans[0]['fleet'], plans[1]['fleet'])
+            self.assertEqual(plans[0]['fleet'], fleet.fingerprint)
+            self.assertEqual(len(log.query(fleet=fleet.fingerprint)), 2)
+            self.assertEqual([entry['key'] for entry in log.query(fleet='registered')], ['b'])
+            self.assertEqual([entry['key'] for entry in log.query(since=middle)], ['b'])
+            self.assertEqual([entry['key'] for entry in log.query(until=middle)], ['a'])
+            self.assertEqual([entry['key'] for entry in log.query(key='a')], ['a'])
+            self.assertEqual(len(log.query(limit=1)), 1)
+            self.assertEqual([p['name'] for p in log.fleet(fleet.fingerprint)], fleet.names)
+            self.assertIsNone(log.fleet('unknown'))
+            self.assertEqual(log.stats()['written'], 2)
+        finally:
+            log.close()
+
+    def test_close_writes_queued_plans(self):
+        log = AuditLog(self.path, sync_interval=10)
+        plan = compute_production_plan(self.payload)
+        for i in range(50):
+            log.record(str(i), self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+        log.close()
+        self.assertFalse(log.enabled)
+        self.assertEqual(len(log.query(limit=100)), 50)
+
+    def test_full_queue(self):
+        # Test that the plans are dropped (not waited for) while the writer is blocked
+        log = AuditLog(self.path, max_queue=1, sync_interval=0.05)
+        plan = compute_production_plan(self.payload)
+        blocker = sqlite3.connect(self.path)
+        try:
+            blocker.execute('BEGIN EXCLUSIVE')
+            log.record('first', self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+            deadline = time.monotonic() + 5
+            while log.stats()['queued'] and time.monotonic() < deadline:
+                time.sleep(0.005)
+            self.assertTrue(log.record('second', self.payload.load, self.payload.fuels, plan,
+                                       self.payload.powerplants))
+            start = time.perf_counter()
+            self.assertFalse(log.record('third', self.payload.load, self.payload.fuels, plan,
+                                        self.payload.powerplants))
+            self.assertLess(time.perf_counter() - start, 0.01)
+            self.assertEqual(log.stats()['dropped'], 1)
+        finally:
+            blocker.rollback()
+            blocker.close()
+            log.close()
+        self.assertEqual(sorted(entry['key'] for entry in log.query()), ['first', 'second'])
+
+    def test_overflow(self):
+        # Test that a full queue waits a little then drops the plan (counted as an error), or spills it to a file
+        # written once the writer caught up
+        plan = compute_production_plan(self.payload)
+        with self.assertRaises(ValueError):
+            AuditLog(self.path, overflow='guess')
+        for overflow in (BLOCK, SPILL):
+            path = os.path.join(self.directory.name, f'{overflow}.db')
+            instrumentation = Instrumentation()
+            log = AuditLog(path, max_queue=1, sync_interval=0.05, overflow=overflow, block_timeout=0.05,
+                           instrumentation=instrumentation)
+            blocker = sqlite3.connect(path)
+            try:
+                blocker.execute('BEGIN EXCLUSIVE')
+                log.record('first', self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+                deadline = time.monotonic() + 5
+                while log.stats()['queued'] and time.monotonic() < deadline:
+                    time.sleep(0.005)
+                log.record('second', self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+                start = time.perf_counter()
+                recorded = log.record('third', self.payload.load, self.payload.fuels, encode_plan(
+                    [entry.name for entry in plan], [entry.p for entry in plan]), Fleet(self.payload.powerplants))
+                elapsed = time.perf_counter() - start
+            finally:
+                blocker.rollback()
+                blocker.close()
+                log.close()
+
+            keys = sorted(entry['key'] for entry in log.query())
+            if overflow == BLOCK:
+                self.assertFalse(recorded)
+                self.assertGreaterEqual(elapsed, 0.05)
+                self.assertEqual(log.stats()['dropped'], 1)
+                self.assertEqual(instrumentation.snapshot()['counters'], {'audit_dropped': 1})
+                self.assertEqual(keys, ['first', 'second'])
+            else:
+                self.assertTrue(recorded)
+                self.assertEqual((log.stats()['dropped'], log.stats()['spilled']), (0, 1))
+                self.assertEqual(keys, ['first', 'second', 'third'])
+                self.assertEqual(log.query(key='third')[0]['plan'], log.query(key='first')[0]['plan'])
+                self.assertFalse(os.path.exists(log.spill_path))
+
+    def test_overflow_out_of_the_loop(self):
+        # Test that the event loop never waits for some room in the queue nor spills: the thread pool does
+        plan = compute_production_plan(self.payload)
+        for overflow in (BLOCK, SPILL):
+            path = os.path.join(self.directory.name, f'{overflow}.db')
+            log = AuditLog(path, max_queue=1, overflow=overflow, block_timeout=0.2)
+            blocker = sqlite3.connect(path)
+            threads = []
+            spill = log._spill
+
+            def spilled(item: tuple) -> bool:
+                threads.append(threading.current_thread())
+                return spill(item)
+
+            async def scenario() -> Tuple[bool, float]:
+                for key in ('first', 'second'):
+                    await log.record_async(key, self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+                    deadline = time.monotonic() + 5
+                    while key == 'first' and log.stats()['queued'] and time.monotonic() < deadline:
+                        await asyncio.sleep(0.005)
+                start = time.perf_counter()
+
+                async def tick() -> float:
+                    await asyncio.sleep(0.01)
+                    return time.perf_counter() - start
+
+                return await asyncio.gather(log.record_async('third', self.payload.load, self.payload.fuels, plan,
+                                                             self.payload.powerplants), tick())
+
+            try:
+                blocker.execute('BEGIN EXCLUSIVE')
+                with mock.patch.object(log, '_spill', spilled):
+                    recorded, ticked = asyncio.run(scenario())
+            finally:
+                blocker.rollback()
+                blocker.close()
+                log.close()
+
+            # The loop kept running while the plan waited for some room
+            self.assertLess(ticked, 0.15)
+            if overflow == BLOCK:
+                self.assertFalse(recorded)
+                self.assertEqual(log.stats()['dropped'], 1)
+            else:
+                self.assertTrue(recorded)
+                self.assertEqual(len(threads), 1)
+                self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_spilled_before_restart(self):
+        # Test that the plans spilled by a previous process are written by the next one
+        plan = compute_production_plan(self.payload)
+        log = AuditLog(self.path, overflow=SPILL)
+        log.close()
+        fleet, row = encode_item((time.time(), 'spilled', self.payload.load, self.payload.fuels, plan,
+                                  self.payload.powerplants, None, True))
+        with open(log.spill_path, 'w') as file:
+            file.write(json.dumps({'fleet': fleet, 'plan': row}) + '\n{"cut')
+
+        log = AuditLog(self.path)
+        log.close()
+        self.assertEqual([entry['key'] for entry in log.query()], ['spilled'])
+        self.assertEqual(len(log.fleet(fleet[0])), len(self.payload.powerplants))
+
+    def test_replay_failure(self):
+        # Test that a replay stopped by a failed batch goes on from there, without writing any plan twice
+        plan = compute_production_plan(self.payload)
+        log = AuditLog(self.path, overflow=SPILL)
+        log.close()
+        with open(log.spill_path, 'w') as file:
+            for number in range(5):
+                fleet, row = encode_item((time.time(), str(number), self.payload.load, self.payload.fuels, plan,
+                                          self.payload.powerplants, None, True))
+                file.write(json.dumps({'fleet': fleet, 'plan': row}) + '\n')
+
+        write = AuditLog._write
+        calls = []
+
+        def failing(audit_log: AuditLog, *args) -> bool:
+            calls.append(len(args[1]))
+            return len(calls) != 2 and write(audit_log, *args)
+
+        with mock.patch.object(AuditLog, '_write', failing):
+            log = AuditLog(self.path, batch_size=2)
+            log.close()
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(sorted(entry['key'] for entry in log.query()), ['0', '1'])
+
+        log = AuditLog(self.path, batch_size=2)
+        log.close()
+        self.assertEqual(sorted(entry['key'] for entry in log.query()), ['0', '1', '2', '3', '4'])
+        self.assertFalse(os.path.exists(log.spill_path + REPLAY_SUFFIX))
+
+    def test_record_latency(self):
+        log = AuditLog(self.path)
+        plan = compute_production_plan(self.payload)
+        try:
+            start = time.perf_counter()
+            for i in range(1000):
+                log.record(str(i), self.payload.load, self.payload.fuels, plan, self.payload.powerplants)
+            self.assertLess((time.perf_counter() - start) / 1000, 0.0001)
+        finally:
+            log.close()
+        self.assertEqual(log.stats()['written'], 1000)
+
+    def test_disabled(self):
+        log = AuditLog('')
+        self.assertFalse(log.enabled)
+        self.assertFalse(log.record('a', 1, {}, [], []))
+        with self.assertRaises(ValueError):
+            log.query()
+
+    def test_endpoints(self):
+        client = TestClient(app)
+        self.assertEqual(client.get('/audit/plans').status_code, 404)
+
+        log = AuditLog(self.path, sync_interval=0.05)
+        try:
+            with mock.patch('app.app.audit_log', log):
+                response = client.post('/productionplan', json=self.payload.dict())
+                self.assertEqual(response.status_code, 200)
+                log.flush()
+
+                fingerprint = Fleet(self.payload.powerplants).fingerprint
+                plans = client.get('/audit/plans', params={'fleet': fingerprint}).json()
+                self.assertEqual(len(plans), 1)
+                self.assertEqual(plans[0]['plan'], response.json())
+                self.assertEqual(plans[0]['load'], self.payload.load)
+                self.assertEqual(len(client.get(f'/audit/fleets/{fingerprint}').json()),
+                                 len(self.payload.powerplants))
+                self.assertEqual(client.get('/audit/fleets/unknown').status_code, 404)
+                self.assertEqual(client.get('/metrics').json()['audit']['written'], 1)
+        finally:
+            log.close()
+
+    def test_other_endpoints(self):
+        # Test that the plans served by the fast, stream and async endpoints are kept too
+        client = TestClient(app)
+        client.delete('/cache')
+        log = AuditLog(self.path, sync_interval=0.05)
+        try:
+            with mock.patch('app.app.audit_log', log):
+                for _ in range(2):
+                    response = client.post('/productionplan/fast', json=self.payload.dict())
+                    self.assertEqual(response.status_code, 200)
+                fuels = json.dumps({'load': 300, 'fuels': self.payload.fuels})
+                lines = [json.dumps([p.dict() for p in self.payload.powerplants]), fuels, fuels]
+                response = client.post('/productionplan/stream', data='\n'.join(lines))
+                self.assertEqual(response.status_code, 200)
+                response = client.post('/productionplan/async', json=self.payload.dict())
+                self.assertEqual(response.status_code, 200)
+                log.flush()
+
+                plans = log.query()
+                self.assertEqual(len(plans), 5)
+                self.assertEqual(sorted(plan['load'] for plan in plans), [300, 300] + [self.payload.load] * 3)
+                for plan in plans:
+                    self.assertEqual(plan['fleet'], Fleet(self.payload.powerplants).fingerprint)
+                    self.assertEqual(sum(entry['p'] for entry in plan['plan']), plan['load'] * 10)
+        finally:
+            log.close()
+            plan_pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import csv
+import os
+import random
+import tempfile
+
+from app.app import *
+from backtest import columnar
+from backtest.run import backtest, fuel_columns, load_fleet, main
+from domain_test import *
+
+FUEL_KEYS = ['gas(euro/MWh)', 'kerosine(euro/MWh)', 'co2(euro/ton)', 'wind(%)']
+
+
+class BacktestTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def write_history(self, count: int, fuel_keys: List[str] = FUEL_KEYS) -> List[dict]:
+        generator = random.Random(7)
+        rows = [{'timestamp': f'2021-01-01T{i // 60:02d}:{i % 60:02d}', 'load': generator.randint(0, 600),
+                 'gas(euro/MWh)': round(generator.uniform(5, 30), 2),
+                 'kerosine(euro/MWh)': round(generator.uniform(30, 80), 2),
+                 'co2(euro/ton)': round(generator.uniform(10, 40), 2), 'wind(%)': generator.choice([0, 20, 60, 100])}
+                for i in range(count)]
+        with open(self.path('history.csv'), 'w', newline='') as file:
+            writer = csv.DictWriter(file, ['timestamp', 'load'] + fuel_keys, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        return rows
+
+    def read_plans(self) -> List[dict]:
+        with open(self.path('plans.csv'), newline='') as file:
+            return list(csv.DictReader(file))
+
+    def assert_plans(self, rows: List[dict], plans: List[dict], fuel_keys: List[str] = FUEL_KEYS) -> None:
+        self.assertEqual(len(plans), len(rows))
+        for row, plan in zip(rows, plans):
+            self.assertEqual(plan['timestamp'], row['timestamp'])
+            fuels = {key: row[key] for key in fuel_keys}
+            expected = compute_production_plan(Payload(load=row['load'], fuels=fuels,
+                                                       powerplants=self.payload.powerplants))
+            self.assertEqual({entry.name: entry.p for entry in expected},
+                             {p.name: int(plan[p.name]) for p in self.payload.powerplants})
+            index = FuelIndex(fuels)
+            cost = sum((index.price(p.type) or 0) / p.efficiency * int(plan[p.name])
+                       for p in self.payload.powerplants if p.type != WIND_TURBINE) / 10
+            self.assertAlmostEqual(float(plan['cost']), cost, places=6)
+
+    def test_plans(self):
+        # Test that the backtest gives the production plans of the application, in the order of the history
+        rows = self.write_history(50)
+        summary = backtest(self.payload.powerplants, self.path('history.csv'), self.path('plans.csv'), workers=2,
+                           chunk_size=7)
+        self.assertEqual(summary['rows'], 50)
+        self.assertEqual(summary['chunks'], 8)
+        plans = self.read_plans()
+        self.assert_plans(rows, plans)
+        # The columns which are not fuels of the power plant types (as the co2) are copied
+        self.assertEqual(list(plans[0])[:5], ['timestamp', 'co2(euro/ton)', 'load', 'cost', 'unserved'])
+
+    def test_missing_fuel(self):
+        # Test that a missing fuel column leaves the power plants burning it out, as a missing key of the fuels
+        rows = self.write_history(10, ['gas(euro/MWh)', 'co2(euro/ton)', 'wind(%)'])
+        backtest(self.payload.powerplants, self.path('history.csv'), self.path('plans.csv'), workers=1, chunk_size=4)
+        plans = self.read_plans()
+        for plan in plans:
+            self.assertEqual(int(plan['tj1']), 0)
+        self.assert_plans(rows, plans, ['gas(euro/MWh)', 'co2(euro/ton)', 'wind(%)'])
+
+    def test_fuel_columns(self):
+        self.assertEqual(fuel_columns(['timestamp', 'load'] + FUEL_KEYS),
+                         {WIND_TURBINE: 'wind(%)', GAS_FIRED: 'gas(euro/MWh)', TURBOJET: 'kerosine(euro/MWh)'})
+        # Ambiguous columns are ignored, as in the fuels dict
+        self.assertEqual(fuel_columns(['load', 'gas(euro/MWh)', 'gas(euro/kWh)'])[GAS_FIRED], None)
+
+    def test_read_chunks(self):
+        self.write_history(10)
+        chunks = list(columnar.read_chunks(self.path('history.csv'), 4))
+        self.assertEqual([len(chunk['load']) for chunk in chunks], [4, 4, 2])
+        self.assertEqual(list(chunks[0]), ['timestamp', 'load'] + FUEL_KEYS)
+        self.assertTrue(np.isnan(columnar.to_floats(['1.5', '', None])[1:]).all())
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            columnar.file_format(self.path('history.xlsx'))
+
+    @unittest.skipIf(columnar.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        # Test that the Parquet files give the same plans as the CSV files
+        rows = self.write_history(20)
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.table({key: [row[key] for row in rows]
+                                                   for key in ['timestamp', 'load'] + FUEL_KEYS}),
+                                    self.path('history.parquet'))
+        backtest(self.payload.powerplants, self.path('history.parquet'), self.path('plans.parquet'), workers=2,
+                 chunk_size=6)
+        table = pyarrow.parquet.read_table(self.path('plans.parquet')).to_pylist()
+        self.assert_plans(rows, [{key: str(value) for key, value in plan.items()} for plan in table])
+
+    def test_main(self):
+        self.write_history(5)
+        with open(self.path('fleet.json'), 'w') as file:
+            json.dump([p.dict() for p in self.payload.powerplants], file)
+        self.assertEqual(load_fleet(self.path('fleet.json')), self.payload.powerplants)
+        main(['--fleet', self.path('fleet.json'), '--input', self.path('history.csv'), '--output',
+              self.path('plans.csv'), '--workers', '1'])
+        self.assertEqual(len(self.read_plans()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import copy
+import random
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class BatchPlannerTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    @staticmethod
+    def as_tuples(response: [ResponseEntry]) -> list:
+        return [(entry.name, entry.p) for entry in response]
+
+    def scenarios(self) -> [Scenario]:
+        # Build scenarios around the payload, with various loads, wind and prices
+        random.seed(42)
+        scenarios = []
+        for _ in range(50):
+            fuels = dict(self.payload.fuels)
+            fuels["wind(%)"] = random.choice([0, 25, 33.3, 60, 100])
+            fuels["gas(euro/MWh)"] = random.choice([5, 13.4, 30.1])
+            scenarios.append(Scenario(load=random.randint(0, 1000), fuels=fuels))
+        return scenarios
+
+    def test_same_plans_as_production_plan(self):
+        scenarios = self.scenarios()
+        batch_responses = BatchPlanner().plan(Fleet(self.payload.powerplants), scenarios)
+
+        self.assertEqual(len(batch_responses), len(scenarios))
+        for scenario, batch_response in zip(scenarios, batch_responses):
+            payload = copy.deepcopy(self.payload)
+            payload.load = scenario.load
+            payload.fuels = scenario.fuels
+            self.assertEqual(self.as_tuples(batch_response), self.as_tuples(production_plan(payload)))
+
+    def test_plan_payloads(self):
+        other = copy.deepcopy(self.payload)
+        other.powerplants = other.powerplants[:3]
+        other.load = 300
+
+        responses = BatchPlanner().plan_payloads([self.payload, other, self.payload])
+
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(len(responses[1]), 3)
+        self.assertEqual(self.as_tuples(responses[0]), self.as_tuples(responses[2]))
+        self.assertEqual(self.as_tuples(responses[1]), self.as_tuples(production_plan(copy.deepcopy(other))))
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        body = {
+            "powerplants": [power_plant.dict() for power_plant in self.payload.powerplants],
+            "scenarios": [{"load": 480, "fuels": self.payload.fuels}, {"load": 100, "fuels": self.payload.fuels}]
+        }
+
+        response = client.post("/productionplan/batch", json=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sum(entry["p"] for entry in plan) for plan in response.json()], [4800, 1000])
+
+        response = client.post("/productionplan/batch", json=[self.payload.dict()])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
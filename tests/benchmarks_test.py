@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.compare import compare
+from benchmarks.generator import *
+from benchmarks.load import load_payloads, run_load, synthetic_payloads
+from benchmarks.run import run
+
+
+class BenchmarksTestCase(unittest.TestCase):
+
+    def test_generator_is_seeded(self):
+        self.assertEqual(generate_payload(50, seed=3), generate_payload(50, seed=3))
+        self.assertNotEqual(generate_payload(50, seed=3), generate_payload(50, seed=4))
+
+    def test_generator_mix(self):
+        fleet = generate_fleet(200, mix={GAS_FIRED: 1.0})
+
+        self.assertEqual(len(fleet), 200)
+        self.assertTrue(all(power_plant.is_gas_fired() for power_plant in fleet))
+        self.assertTrue(all(0 < power_plant.pmin < power_plant.pmax for power_plant in fleet))
+
+    def test_run_and_compare(self):
+        report = run([10], repeat=2, seed=0, scenarios=['MeritOrderDispatcher', 'production_plan'])
+
+        self.assertEqual([result['scenario'] for result in report['results']],
+                         ['MeritOrderDispatcher', 'production_plan'])
+        for result in report['results']:
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+        slower = {'results': [dict(result, p50_ms=result['p50_ms'] * 2) for result in report['results']]}
+        self.assertTrue(all(entry['regression'] for entry in compare(report, slower, 0.1)))
+        self.assertFalse(any(entry['regression'] for entry in compare(report, report, 0.1)))
+
+    def test_load(self):
+        # Test a short load test against the application run in process, at two concurrencies
+        report = run_load(synthetic_payloads([10], 3, seed=0), [1, 2], 20, in_process=True, warmup=2)
+
+        self.assertEqual([result['concurrency'] for result in report['results']], [1, 2])
+        for result in report['results']:
+            self.assertEqual(result['requests'], 20)
+            self.assertEqual(result['statuses'], {'200': 20})
+            self.assertEqual(result['error_rate'], 0)
+            self.assertEqual(result['size'], 10)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['throughput_per_s'], 0)
+            self.assertIsNotNone(result['cpu_ms_per_request'])
+
+        # A lower throughput is a regression, a higher one is not
+        slower = {'results': [dict(result, throughput_per_s=result['throughput_per_s'] / 2)
+                              for result in report['results']]}
+        self.assertTrue(all(entry['regression'] for entry in compare(report, slower, 0.1, 'throughput_per_s')))
+        self.assertFalse(any(entry['regression'] for entry in compare(slower, report, 0.1, 'throughput_per_s')))
+
+    def test_load_errors(self):
+        # Test that the rejected requests are counted as errors
+        report = run_load([b'{"load": 10}'], [2], 10, in_process=True, warmup=0)
+        self.assertEqual(report['results'][0]['statuses'], {'422': 10})
+        self.assertEqual(report['results'][0]['error_rate'], 1)
+
+    def test_load_payloads(self):
+        try:
+            bodies = load_payloads('tests/postman/CodingChallenge.postman_collection.json')
+        except FileNotFoundError:
+            bodies = load_payloads('postman/CodingChallenge.postman_collection.json')
+        self.assertTrue(bodies)
+        self.assertTrue(all('powerplants' in json.loads(body) for body in bodies))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'payloads.jsonl')
+            with open(path, 'w') as file:
+                file.write('\n'.join(generate_payload(5, seed).json() for seed in range(3)))
+            self.assertEqual(load_payloads(path), synthetic_payloads([5], 3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import copy
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class PlanCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_payload_key(self):
+        shuffled = copy.deepcopy(self.payload)
+        shuffled.powerplants.reverse()
+        shuffled.fuels = dict(reversed(list(shuffled.fuels.items())))
+        other = copy.deepcopy(self.payload)
+        other.load += 1
+
+        self.assertEqual(payload_key(self.payload), payload_key(shuffled))
+        self.assertNotEqual(payload_key(self.payload), payload_key(other))
+        self.assertEqual(payload_key(self.payload),
+                         plan_key(Fleet(self.payload.powerplants).fingerprint, self.payload.load, self.payload.fuels))
+
+    def test_lru_eviction(self):
+        cache = PlanCache(max_size=2, ttl=60)
+        cache.put("a", [ResponseEntry("a", 1)])
+        cache.put("b", [ResponseEntry("b", 1)])
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", [ResponseEntry("c", 1)])
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = PlanCache(max_size=2, ttl=10, clock=clock)
+        cache.put("a", [ResponseEntry("a", 1)])
+        clock.now = 9
+        self.assertIsNotNone(cache.get("a"))
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_invalidate(self):
+        cache = PlanCache(max_size=10, ttl=10)
+        cache.put("a", [ResponseEntry("a", 1)])
+        cache.put("b", [ResponseEntry("b", 1)])
+
+        self.assertEqual(cache.invalidate("a"), 1)
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_disabled(self):
+        cache = PlanCache(max_size=0)
+        cache.put("a", [ResponseEntry("a", 1)])
+        self.assertIsNone(cache.get("a"))
+
+    def test_endpoints(self):
+        client = TestClient(app)
+        client.delete("/cache")
+        hits = client.get("/metrics").json()["cache"]["hits"]
+
+        first = client.post("/productionplan", json=self.payload.dict())
+        second = client.post("/productionplan", json=self.payload.dict())
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(client.get("/metrics").json()["cache"]["hits"], hits + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import unittest
+
+from services.coalescing import *
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def test_coalesced_calls(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "plan"
+
+        def call():
+            results.append(single_flight.do("key", compute))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=call) for _ in range(5)]
+        for follower in followers:
+            follower.start()
+        # Wait for the followers to be registered as coalesced before releasing the computation
+        while single_flight.stats()["coalesced"] < 5:
+            pass
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["plan"] * 6)
+        self.assertEqual(single_flight.stats(), {"executions": 1, "coalesced": 5, "in_flight": 0})
+
+    def test_error_is_shared(self):
+        single_flight = SingleFlight()
+
+        def compute():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            single_flight.do("key", compute)
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_sequential_calls(self):
+        single_flight = SingleFlight()
+
+        self.assertEqual(single_flight.do("key", lambda: 1), 1)
+        self.assertEqual(single_flight.do("key", lambda: 2), 2)
+        self.assertEqual(single_flight.stats()["executions"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+from fastapi.testclient import TestClient
+
+from app.app import *
+from benchmarks.generator import generate_payload
+from domain_test import *
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            file = 'tests/fixtures/payload1.json'
+            with open(file, 'rb') as json_file:
+                self.body: bytes = json_file.read()
+        except:
+            print("Loading tests from IDE, using another path")
+            file = 'fixtures/payload1.json'
+            with open(file, 'rb') as json_file:
+                self.body: bytes = json_file.read()
+        self.payload: Payload = load_json(file)
+
+    def test_decode_payload(self):
+        # Test that the decoded fleet is the same as the one of the pydantic payload
+        decoded = decode_payload(self.body)
+        self.assertEqual(decoded.load, 480)
+        self.assertEqual(decoded.fuels, self.payload.fuels)
+        self.assertEqual(decoded.fleet.fingerprint, Fleet(self.payload.powerplants).fingerprint)
+
+    def test_non_canonical_payload(self):
+        # Test that anything needing a coercion or failing is left to the pydantic models
+        data = json.loads(self.body)
+        for change in ({'load': '480'}, {'load': True}, {'load': None}, {'fuels': []}, {'powerplants': {}}):
+            with self.assertRaises(NonCanonicalPayload):
+                decode_payload(json.dumps({**data, **change}).encode())
+        for change in ({'pmin': 100.0}, {'efficiency': '0.5'}, {'name': 1}, {'pmax': None}):
+            power_plants = [{**data['powerplants'][0], **change}] + data['powerplants'][1:]
+            with self.assertRaises(NonCanonicalPayload):
+                decode_payload(json.dumps({**data, 'powerplants': power_plants}).encode())
+        for body in (b'', b'{', b'[]', json.dumps({**data, 'powerplants': [1]}).encode()):
+            with self.assertRaises(NonCanonicalPayload):
+                decode_payload(body)
+
+    def test_encode_plan(self):
+        # Test that the bytes are the same as the FastAPI serialisation, escaped names included
+        for names in (['a', 'b'], ['a"b', 'c\\d'], ['é', 'line\nbreak'], []):
+            powers = list(range(len(names)))
+            expected = json.dumps([{'name': name, 'p': p} for name, p in zip(names, powers)], ensure_ascii=False,
+                                  separators=(',', ':')).encode('utf-8')
+            self.assertEqual(encode_plan(names, powers), expected)
+
+    def test_join_plans(self):
+        # Test that the joined plans are the encoded concatenation
+        self.assertEqual(join_plans([encode_plan(['a'], [1]), encode_plan([], []), encode_plan(['b', 'c'], [2, 3])]),
+                         encode_plan(['a', 'b', 'c'], [1, 2, 3]))
+        self.assertEqual(join_plans([]), b'[]')
+
+    def test_endpoint(self):
+        # Test that the fast endpoint gives the same plans as the standard one
+        client = TestClient(app)
+        for body in (self.body, json.dumps(generate_payload(500, 3).dict()).encode()):
+            expected = client.post('/productionplan', data=body)
+            response = client.post('/productionplan/fast', data=body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+
+    def test_endpoint_cached(self):
+        # Test that an identical body is answered from the cache with the same bytes
+        client = TestClient(app)
+        body = json.dumps({**json.loads(self.body), 'load': 431}).encode()
+        first = client.post('/productionplan/fast', data=body)
+        second = client.post('/productionplan/fast', data=body)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_endpoint_fallback(self):
+        # Test that non canonical payloads give the same plans and the same errors as the standard endpoint
+        client = TestClient(app)
+        data = json.loads(self.body)
+        power_plants = [{**data['powerplants'][0], 'pmin': 100.0, 'pmax': '460'}] + data['powerplants'][1:]
+        bodies = [json.dumps({**data, 'load': '480', 'powerplants': power_plants}).encode(),
+                  json.dumps({**data, 'load': 'many'}).encode(),
+                  json.dumps({**data, 'powerplants': [{'name': 'x'}]}).encode(),
+                  json.dumps([data]).encode(), b'{"load": 1,', b'']
+        for body in bodies:
+            expected = client.post('/productionplan', data=body)
+            response = client.post('/productionplan/fast', data=body)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+
+if __name__ == '__main__':
+    unittest.main()
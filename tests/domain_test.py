@@ -41,5 +41,40 @@ class DomainTestCase(unittest.TestCase):
         self.assertEqual(len(self.payload.powerplants), 6)
 
 
+class FuelIndexTestCase(unittest.TestCase):
+
+    def test_parse_fuel_key(self):
+        # Test the name and unit of the keys
+        self.assertEqual(parse_fuel_key('gas(euro/MWh)'), ('gas', 'euro/MWh'))
+        self.assertEqual(parse_fuel_key('wind(%)'), ('wind', '%'))
+        self.assertEqual(parse_fuel_key('gas'), ('gas', None))
+
+    def test_price(self):
+        # Test the price of each power plant type
+        index = FuelIndex({'gas(euro/MWh)': 13.4, 'kerosine(euro/MWh)': 50.8, 'co2(euro/ton)': 20, 'wind(%)': 60})
+        self.assertEqual(index.price(GAS_FIRED), 13.4)
+        self.assertEqual(index.price(TURBOJET), 50.8)
+        self.assertEqual(index.price(WIND_TURBINE), 60)
+        self.assertEqual([fuel.name for fuel in index.fuels(GAS_FIRED)], ['gas(euro/MWh)'])
+
+    def test_ambiguous_or_missing(self):
+        # Test that no price is given unless exactly one fuel matches
+        index = FuelIndex({'gas(euro/MWh)': 13.4, 'naturalgas(euro/MWh)': 12.0})
+        self.assertIsNone(index.price(GAS_FIRED))
+        self.assertIsNone(index.price(TURBOJET))
+        self.assertEqual(len(index.fuels(GAS_FIRED)), 2)
+
+    def test_enriched_power_plant(self):
+        # Test that the enriched power plants are the same with the fuels list or the index
+        fuels = {'gas(euro/MWh)': 13.4, 'kerosine(euro/MWh)': 50.8, 'wind(%)': 60}
+        index = FuelIndex(fuels)
+        for power_plant_type in (GAS_FIRED, TURBOJET, WIND_TURBINE):
+            power_plant = PowerPlant(name='p', type=power_plant_type, efficiency=0.5, pmin=0, pmax=100)
+            from_list = EnrichedPowerPlant(power_plant, [Fuel(name, data) for name, data in fuels.items()])
+            from_index = EnrichedPowerPlant(power_plant, index)
+            self.assertEqual([fuel.name for fuel in from_list.fuels], [fuel.name for fuel in from_index.fuels])
+            self.assertEqual(len(from_index.fuels), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,165 @@
+import logging
+import random
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class FeasibilityTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        # Without the turbojet, the minimum power of the gas fired power plants leaves loads out of reach
+        self.power_plants = [p for p in self.payload.powerplants if p.type != TURBOJET]
+
+    def test_interval_set(self):
+        intervals = IntervalSet([(30, 40), (0, 0), (10, 20), (21, 25), (35, 60)])
+        self.assertEqual(intervals.intervals, [(0, 0), (10, 25), (30, 60)])
+        self.assertIn(0, intervals)
+        self.assertIn(25, intervals)
+        self.assertNotIn(5, intervals)
+        self.assertNotIn(61, intervals)
+        self.assertEqual(intervals.maximum, 60)
+
+        self.assertEqual(intervals.below(28, 10), 20)
+        self.assertEqual(intervals.above(26, 10), 30)
+        self.assertEqual(intervals.above(5, 10), 10)
+        self.assertEqual(intervals.below(5, 10), 0)
+        self.assertIsNone(intervals.above(61, 10))
+
+    def test_reachable(self):
+        # Each power plant is off or between its minimum and maximum power
+        self.assertEqual(reachable(np.array([10, 30]), np.array([20, 40])).intervals, [(0, 0), (10, 20), (30, 60)])
+        # The power plants without minimum power fill the gaps
+        self.assertEqual(reachable(np.array([10, 30, 0]), np.array([20, 40, 5])).intervals,
+                         [(0, 5), (10, 25), (30, 65)])
+        self.assertEqual(reachable(np.array([10, 30, 0]), np.array([20, 40, 10])).intervals, [(0, 70)])
+
+    def test_max_intervals(self):
+        # Too many intervals: the smallest gaps are filled, so that no reachable value is lost
+        pmin = np.array([2 ** i for i in range(12)]) * 3
+        intervals = reachable(pmin, pmin)
+        self.assertLessEqual(len(intervals), MAX_INTERVALS)
+        for value in range(0, int(pmin.sum()) + 1, 3):
+            self.assertIn(value, intervals)
+
+    def test_check(self):
+        index = FeasibilityIndex(Fleet(self.power_plants))
+        # 111.5 MW of wind (60%), then at least 40 MW of gas
+        self.assertEqual(index.wind(self.payload.fuels), 1115)
+        self.assertTrue(index.check(100, self.payload.fuels).feasible)
+
+        feasibility = index.check(130, self.payload.fuels)
+        self.assertFalse(feasibility.feasible)
+        self.assertEqual((feasibility.below, feasibility.above), (111, 152))
+        self.assertEqual(feasibility.nearest, 111)
+        self.assertEqual(index.check(140, self.payload.fuels).nearest, 152)
+
+        feasibility = index.check(2000, self.payload.fuels)
+        self.assertFalse(feasibility.feasible)
+        self.assertEqual(feasibility.maximum, 1241)
+        self.assertEqual((feasibility.below, feasibility.above, feasibility.nearest), (1241, None, 1241))
+
+    def test_sequential_dispatch(self):
+        # Test that the turbojets only fill what the gas fired power plants left: beyond their 216 MW, the remaining
+        # load must exceed the 83 MW of minimum power of the turbojet
+        power_plants = [PowerPlant(name='turbojet', type=TURBOJET, efficiency=0.3, pmin=83, pmax=126),
+                        PowerPlant(name='gas1', type=GAS_FIRED, efficiency=0.5, pmin=8, pmax=173),
+                        PowerPlant(name='gas2', type=GAS_FIRED, efficiency=0.5, pmin=0, pmax=43)]
+        fuels = {**self.payload.fuels, 'wind(%)': 0}
+        index = FeasibilityIndex(Fleet(power_plants))
+        plan = compute_production_plan(Payload(load=222, fuels=fuels, powerplants=power_plants))
+        self.assertNotEqual(sum(entry.p for entry in plan), 2220)
+
+        feasibility = index.check(222, fuels)
+        self.assertFalse(feasibility.feasible)
+        self.assertEqual((feasibility.below, feasibility.above), (216, 300))
+        self.assertTrue(index.check(216, fuels).feasible)
+        self.assertTrue(index.check(300, fuels).feasible)
+
+    def test_matches_dispatch(self):
+        # Test that the index accepts exactly the loads delivered by the dispatch, and that the nearest loads are
+        # delivered too
+        logging.disable(logging.WARNING)
+        rng = random.Random(5)
+        try:
+            for _ in range(40):
+                power_plants = []
+                for i in range(rng.randint(1, 5)):
+                    power_plant_type = rng.choice([GAS_FIRED, GAS_FIRED, TURBOJET, WIND_TURBINE])
+                    pmax = rng.randint(5, 60)
+                    pmin = rng.randint(0, pmax) if power_plant_type != WIND_TURBINE else 0
+                    power_plants.append(PowerPlant(name=f'p{i}', type=power_plant_type,
+                                                   efficiency=rng.choice([0.3, 0.5]), pmin=pmin, pmax=pmax))
+                fuels = {**self.payload.fuels, 'wind(%)': rng.choice([0, 35, 100]),
+                         'gas(euro/MWh)': rng.choice([0, 13.4]), 'kerosine(euro/MWh)': rng.choice([0, 50.8])}
+                index = FeasibilityIndex(Fleet(power_plants))
+                delivered = {}
+                for load in range(0, sum(p.pmax for p in power_plants) + 2):
+                    plan = compute_production_plan(Payload(load=load, fuels=fuels, powerplants=power_plants))
+                    delivered[load] = sum(entry.p for entry in plan) == load * 10
+                for load, expected in delivered.items():
+                    feasibility = index.check(load, fuels)
+                    self.assertEqual(feasibility.feasible, expected, (load, power_plants, fuels))
+                    if not feasibility.feasible:
+                        self.assertTrue(delivered[feasibility.nearest])
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def test_cache(self):
+        indexes = FeasibilityIndexes(max_size=1)
+        fleet = Fleet(self.power_plants)
+        self.assertIs(indexes.get(fleet), indexes.get(Fleet(list(reversed(self.power_plants)))))
+        self.assertIsNot(indexes.get(Fleet(self.payload.powerplants)), indexes.get(fleet))
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        payload = dict(self.payload.dict(), powerplants=[p.dict() for p in self.power_plants], load=130)
+
+        # Ignored by default: the load is not delivered
+        response = client.post('/productionplan', json=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('x-snapped-load', response.headers)
+
+        response = client.post('/productionplan?on_infeasible=reject', json=payload)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['detail']['below'], 111)
+        self.assertEqual(response.json()['detail']['above'], 152)
+
+        response = client.post('/productionplan?on_infeasible=snap', json=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['x-snapped-load'], '111')
+        self.assertEqual(sum(entry['p'] for entry in response.json()), 1110)
+
+        # A reachable load is left alone
+        response = client.post('/productionplan?on_infeasible=reject', json=dict(payload, load=480))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('x-snapped-load', response.headers)
+
+        self.assertEqual(client.post('/productionplan?on_infeasible=guess', json=payload).status_code, 422)
+
+    def test_fleet_endpoint(self):
+        client = TestClient(app)
+        client.put('/fleets/feasibility', json=[p.dict() for p in self.power_plants])
+        try:
+            response = client.post('/productionplan/feasibility?on_infeasible=snap',
+                                   json={'load': 140, 'fuels': self.payload.fuels})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['x-snapped-load'], '152')
+            self.assertEqual(sum(entry['p'] for entry in response.json()), 1520)
+
+            response = client.post('/productionplan/feasibility?on_infeasible=reject',
+                                   json={'load': 140, 'fuels': self.payload.fuels})
+            self.assertEqual(response.status_code, 422)
+        finally:
+            client.delete('/fleets/feasibility')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from fastapi.testclient import TestClient
+
+from app.app import *
+from benchmarks.generator import generate_payload
+from domain_test import *
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    @staticmethod
+    def as_dicts(plan: List[ResponseEntry]) -> List[dict]:
+        return [{'name': entry.name, 'p': entry.p} for entry in plan]
+
+    def expected(self, power_plants: List[PowerPlant], load: int, fuels: dict) -> List[dict]:
+        return self.as_dicts(compute_production_plan(Payload(load=load, fuels=fuels, powerplants=power_plants)))
+
+    @staticmethod
+    def cost(power_plants: List[PowerPlant], fuels: dict, plan: List[dict]) -> float:
+        index = FuelIndex(fuels)
+        costs = {p.name: (index.price(p.type) or 0) / p.efficiency if p.type != WIND_TURBINE else 0
+                 for p in power_plants}
+        return sum(costs[entry['name']] * entry['p'] for entry in plan)
+
+    def test_update(self):
+        # Test that every update gives a plan as good as the one of the '/productionplan' endpoint
+        payload = generate_payload(300, 5)
+        planner = IncrementalPlanner(Fleet(payload.powerplants))
+        load, fuels = payload.load, dict(payload.fuels)
+        self.assertEqual(json.loads(planner.update(load, fuels)), self.expected(payload.powerplants, load, fuels))
+
+        random = np.random.default_rng(5)
+        for _ in range(30):
+            delta = {}
+            change = random.integers(4)
+            if change == 0:
+                load = int(payload.load * random.uniform(0.5, 1.5))
+            elif change == 1:
+                delta['wind(%)'] = float(random.integers(0, 101))
+            elif change == 2:
+                delta['gas(euro/MWh)'] = float(random.uniform(5, 50))
+            else:
+                delta['kerosine(euro/MWh)'] = float(random.uniform(20, 100))
+            fuels.update(delta)
+            plan = json.loads(planner.update(load if change == 0 else None, delta))
+            expected = self.expected(payload.powerplants, load, fuels)
+            # Same power plants and same cost (the cheapest plan may not be unique)
+            self.assertEqual([entry['name'] for entry in plan], [entry['name'] for entry in expected])
+            expected_cost = self.cost(payload.powerplants, fuels, expected)
+            self.assertAlmostEqual(self.cost(payload.powerplants, fuels, plan), expected_cost,
+                                   delta=1e-9 * expected_cost)
+            self.assertEqual(sum(entry['p'] for entry in plan), sum(entry['p'] for entry in expected))
+
+    def test_reuse(self):
+        # Test that a new positive gas price keeps the stack, unlike a null price
+        planner = IncrementalPlanner(Fleet(self.payload.powerplants))
+        planner.update(self.payload.load, self.payload.fuels)
+        builds = planner.builds
+
+        planner.update(fuels={'gas(euro/MWh)': 20.1})
+        planner.update(load=self.payload.load + 10)
+        self.assertEqual(planner.builds, builds)
+        self.assertEqual(planner.reuses, 1)
+
+        planner.update(fuels={'gas(euro/MWh)': 0})
+        self.assertEqual(planner.builds, builds + 1)
+
+    def test_segments(self):
+        # Test that a change of the turbojets price only doesn't encode the other types again
+        planner = IncrementalPlanner(Fleet(self.payload.powerplants))
+        planner.update(self.payload.load, self.payload.fuels)
+        segments = dict(planner._segments)
+        planner.update(fuels={'kerosine(euro/MWh)': 60.0})
+        for power_plant_type in (WIND_TURBINE, GAS_FIRED):
+            self.assertIs(planner._segments[power_plant_type], segments[power_plant_type])
+
+    def test_missing_load(self):
+        planner = IncrementalPlanner(Fleet(self.payload.powerplants))
+        with self.assertRaises(ValueError):
+            planner.update(fuels=self.payload.fuels)
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        client.put('/fleets/incremental', json=[p.dict() for p in self.payload.powerplants])
+
+        # Test the first (full) update, then a delta
+        response = client.patch('/productionplan/incremental',
+                                json={'load': self.payload.load, 'fuels': self.payload.fuels})
+        self.assertEqual(response.json(), self.expected(self.payload.powerplants, self.payload.load,
+                                                        self.payload.fuels))
+        response = client.patch('/productionplan/incremental', json={'fuels': {'wind(%)': 20}})
+        self.assertEqual(response.json(), self.expected(self.payload.powerplants, self.payload.load,
+                                                        {**self.payload.fuels, 'wind(%)': 20}))
+
+        # Test that a replaced fleet starts again
+        client.put('/fleets/incremental', json=[p.dict() for p in self.payload.powerplants])
+        self.assertEqual(client.patch('/productionplan/incremental', json={}).status_code, 422)
+        self.assertEqual(client.patch('/productionplan/unknown', json={}).status_code, 404)
+        client.delete('/fleets/incremental')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import copy
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_histogram(self):
+        histogram = Histogram()
+        histogram.observe(0.0003)
+        histogram.observe(0.002)
+        histogram.observe(100)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 3)
+        self.assertEqual(snapshot["buckets"]["0.5"], 1)
+        self.assertEqual(snapshot["buckets"]["2.5"], 1)
+        self.assertEqual(snapshot["buckets"]["+Inf"], 1)
+
+    def test_stage_and_counters(self):
+        metrics = Instrumentation()
+        with metrics.stage("rank"):
+            pass
+        metrics.increment("load_mismatch")
+        metrics.increment("load_mismatch")
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["stages"]["rank"]["count"], 1)
+        self.assertEqual(snapshot["counters"], {"load_mismatch": 2})
+
+    def test_log_event_is_level_gated(self):
+        with self.assertLogs("powerplant", level="WARNING") as logs:
+            log_event(logging.DEBUG, "hidden")
+            log_event(logging.WARNING, "shown", value=1)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {"value": 1, "event": "shown"})
+
+    def test_metrics_endpoint(self):
+        client = TestClient(app)
+        payload = copy.deepcopy(self.payload)
+        # An unreachable load, counted as a mismatch
+        payload.load = 100000
+
+        client.post("/productionplan", json=payload.dict())
+        metrics = client.get("/metrics").json()
+
+        for stage in ("parse", "rank", "dispatch.gasfired", "serialize", "request"):
+            self.assertGreater(metrics["stages"][stage]["count"], 0)
+        self.assertGreater(metrics["counters"]["load_mismatch"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
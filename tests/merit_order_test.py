@@ -0,0 +1,100 @@
+import time
+import unittest
+
+from services.merit_order import *
+
+
+class MeritOrderStackTestCase(unittest.TestCase):
+
+    def test_single_unit(self):
+        # test a load within the bounds of a single unit
+        solution = MeritOrderStack([10.0], [100], [400]).solve(250)
+
+        self.assertEqual(solution.dispatched, [250])
+        self.assertTrue(solution.optimal)
+
+    def test_cheapest_first(self):
+        # test the cheapest unit is fully used before the expensive one
+        solution = MeritOrderStack([20.0, 10.0], [0, 0], [100, 100]).solve(150)
+
+        self.assertEqual(solution.dispatched, [50, 100])
+        self.assertEqual(solution.cost, 20.0 * 50 + 10.0 * 100)
+
+    def test_minimum_power_gap(self):
+        # test the cheap unit is backed off so that the expensive one reaches its minimum power
+        solution = MeritOrderStack([10.0, 20.0], [100, 50], [200, 200]).solve(230)
+
+        self.assertEqual(solution.load, 230)
+        self.assertEqual(solution.dispatched, [180, 50])
+
+    def test_skip_unit_with_large_minimum_power(self):
+        # test a cheap unit is skipped when its minimum power is above the load
+        solution = MeritOrderStack([10.0, 20.0], [300, 0], [500, 200]).solve(150)
+
+        self.assertEqual(solution.dispatched, [0, 150])
+        self.assertTrue(solution.optimal)
+
+    def test_unit_at_minimum_power(self):
+        # test the cheapest unit stays idle when the minimum power of the next one covers the load
+        solution = MeritOrderStack([10.0, 11.0, 30.0], [0, 100, 0], [90, 100, 100]).solve(100)
+
+        self.assertEqual(solution.dispatched, [0, 100, 0])
+        self.assertTrue(solution.optimal)
+
+    def test_load_above_capacity(self):
+        # test every unit is used at full power when the load is too high
+        solution = MeritOrderStack([10.0, 20.0], [0, 0], [100, 100]).solve(500)
+
+        self.assertEqual(solution.dispatched, [100, 100])
+        self.assertFalse(solution.optimal)
+
+    def test_load_below_minimum_power(self):
+        # test nothing is dispatched when the load is below any minimum power
+        solution = MeritOrderStack([10.0, 20.0], [100, 100], [200, 200]).solve(50)
+
+        self.assertEqual(solution.load, 0)
+
+    def test_large_fleet(self):
+        # test a large fleet of identical units matches the load
+        count = 300
+        solution = MeritOrderStack([25.0] * count, [1000] * count, [4600] * count).solve(123456)
+
+        self.assertEqual(solution.load, 123456)
+        self.assertTrue(solution.optimal)
+
+    def test_deadline(self):
+        # test a past deadline gives the greedy (feasible) plan, not proven optimal, instead of the optimal one
+        count = 20
+        pmax = [1000 + 37 * i for i in range(count)]
+        stack = MeritOrderStack([10.0 + i for i in range(count)], [p - 10 for p in pmax], pmax)
+        load = sum(pmax) // 2 + 5
+        optimal = stack.solve(load)
+        solution = stack.solve(load, deadline=time.monotonic() - 1)
+
+        self.assertTrue(optimal.optimal)
+        self.assertFalse(solution.optimal)
+        self.assertEqual(solution.load, load)
+        self.assertGreater(solution.cost, optimal.cost)
+
+
+class MeritOrderDispatcherTestCase(unittest.TestCase):
+
+    def test_compute(self):
+        results = [
+            ProcessResult(type="gasfired", name="test_01", available_power=4600, minimum_power=1000, cost=25.3),
+            ProcessResult(type="gasfired", name="test_02", available_power=4600, minimum_power=1000, cost=25.3),
+            ProcessResult(type="gasfired", name="test_03", available_power=2100, minimum_power=400, cost=36.2)
+        ]
+
+        dispatched = MeritOrderDispatcher().compute(results, 6000)
+
+        self.assertEqual([result.name for result in dispatched], ["test_01", "test_02", "test_03"])
+        self.assertEqual(sum(result.dispatched_power for result in dispatched), 6000)
+        self.assertEqual(dispatched[2].dispatched_power, 0)
+
+    def test_compute_empty(self):
+        self.assertEqual(MeritOrderDispatcher().compute([], 100), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
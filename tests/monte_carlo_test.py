@@ -0,0 +1,125 @@
+import time
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from benchmarks.generator import generate_payload
+from domain_test import *
+
+
+class MonteCarloTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def plan_cost(self, plan: List[ResponseEntry], fuels: dict) -> float:
+        index = FuelIndex(fuels)
+        costs = {p.name: (index.price(p.type) or 0) / p.efficiency if p.type != WIND_TURBINE else 0
+                 for p in self.payload.powerplants}
+        return sum(costs[entry.name] * entry.p for entry in plan) / 10
+
+    def test_samples(self):
+        # Test that the explicit samples give the same dispatch and costs as the plans of each wind percentage
+        samples = [0.0, 25.0, 60.0, 100.0]
+        scenarios = WindScenarios(load=self.payload.load, fuels=self.payload.fuels, samples=samples,
+                                  quantiles=[0, 100])
+        result = analyze_wind_scenarios(Fleet(self.payload.powerplants), scenarios, BatchPlanner())
+        self.assertEqual(result['scenarios'], 4)
+
+        plans, costs = [], []
+        for wind in samples:
+            fuels = {**self.payload.fuels, 'wind(%)': wind}
+            plans.append({entry.name: entry.p for entry in
+                          compute_production_plan(Payload(load=self.payload.load, fuels=fuels,
+                                                          powerplants=self.payload.powerplants))})
+            costs.append(self.plan_cost(compute_production_plan(
+                Payload(load=self.payload.load, fuels=fuels, powerplants=self.payload.powerplants)), fuels))
+
+        self.assertAlmostEqual(result['cost']['quantiles']['0'], min(costs))
+        self.assertAlmostEqual(result['cost']['quantiles']['100'], max(costs))
+        self.assertAlmostEqual(result['cost']['mean'], sum(costs) / 4)
+        for plant in result['plants']:
+            powers = [plan[plant['name']] for plan in plans]
+            self.assertAlmostEqual(plant['mean'], sum(powers) / 4)
+            self.assertEqual((plant['quantiles']['0'], plant['quantiles']['100']), (min(powers), max(powers)))
+
+    def test_draw_wind(self):
+        for distribution in DISTRIBUTIONS:
+            scenarios = WindScenarios(load=0, fuels={}, distribution=distribution, std=20, count=20000, seed=3)
+            wind = draw_wind(scenarios, 40.0)
+            self.assertEqual(len(wind), 20000)
+            self.assertTrue(np.all((wind >= 0) & (wind <= 100)))
+            self.assertAlmostEqual(wind.mean(), 40.0, delta=1.0)
+            # Same seed, same draw
+            np.testing.assert_array_equal(wind, draw_wind(scenarios, 40.0))
+
+        for change in ({'distribution': 'weibull'}, {'std': -1}, {'count': 0}, {'samples': []}):
+            with self.assertRaises(ValueError):
+                draw_wind(WindScenarios(load=0, fuels={}, **change), 40.0)
+
+    def test_large_fleet(self):
+        # Test that 10k scenarios of a 100 power plants fleet take a few seconds at most
+        payload = generate_payload(100, 7)
+        scenarios = WindScenarios(load=payload.load, fuels={**payload.fuels, 'wind(%)': 50}, count=10000, seed=1,
+                                  std=15)
+        start = time.perf_counter()
+        result = analyze_wind_scenarios(Fleet(payload.powerplants), scenarios, BatchPlanner())
+        self.assertLess(time.perf_counter() - start, 5.0)
+        self.assertEqual(len(result['plants']), 100)
+        self.assertLessEqual(result['cost']['quantiles']['5'], result['cost']['quantiles']['95'])
+
+    def test_dispatched_powers(self):
+        # Test that the scenarios of a large fleet are bounded by the size of their dispatched matrix
+        payload = generate_payload(101, 7)
+        scenarios = WindScenarios(load=payload.load, fuels=payload.fuels, count=MAX_SCENARIOS, seed=1)
+        with self.assertRaises(ValueError):
+            analyze_wind_scenarios(Fleet(payload.powerplants), scenarios, BatchPlanner())
+
+        response = TestClient(app).post('/scenarios/wind', json={**scenarios.dict(), 'powerplants': [
+            p.dict() for p in payload.powerplants]})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('At most 99009 scenarios', response.json()['detail'])
+
+    def test_chunks(self):
+        # Test that the scenarios dispatched and summarized by small chunks give the same analysis
+        payload = generate_payload(20, 5)
+        scenarios = WindScenarios(load=payload.load, fuels={**payload.fuels, 'wind(%)': 40}, count=500, seed=2, std=25,
+                                  quantiles=[0, 5, 50, 95, 100])
+        fleet = Fleet(payload.powerplants)
+        expected = analyze_wind_scenarios(fleet, scenarios, BatchPlanner())
+        with mock.patch('services.monte_carlo.CHUNK_POWERS', 90):
+            result = analyze_wind_scenarios(fleet, scenarios, BatchPlanner())
+        self.assertEqual(result['plants'], expected['plants'])
+        for summary in ('wind', 'cost', 'thermal', 'unserved'):
+            self.assertEqual(result[summary].keys(), expected[summary].keys())
+            for key in ('mean', 'min', 'max'):
+                self.assertAlmostEqual(result[summary][key], expected[summary][key])
+            self.assertEqual(result[summary]['quantiles'], expected[summary]['quantiles'])
+
+    def test_endpoints(self):
+        client = TestClient(app)
+        body = {'load': self.payload.load, 'fuels': self.payload.fuels, 'count': 500, 'seed': 1,
+                'distribution': 'beta'}
+        response = client.post('/scenarios/wind', json={**body, 'powerplants': [p.dict() for p in
+                                                                                 self.payload.powerplants]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['scenarios'], 500)
+
+        client.put('/fleets/scenarios', json=[p.dict() for p in self.payload.powerplants])
+        self.assertEqual(client.post('/fleets/scenarios/scenarios/wind', json=body).json(), response.json())
+        client.delete('/fleets/scenarios')
+
+        self.assertEqual(client.post('/scenarios/wind', json={**body, 'distribution': 'weibull', 'powerplants': []})
+                         .status_code, 422)
+        fuels = {key: value for key, value in self.payload.fuels.items() if key != 'wind(%)'}
+        self.assertEqual(client.post('/scenarios/wind', json={**body, 'fuels': fuels, 'powerplants': []})
+                         .status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
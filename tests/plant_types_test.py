@@ -0,0 +1,107 @@
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class PlantTypeRegistryTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def register_nuclear(self, registry: PlantTypeRegistry) -> None:
+        # A must-run type, dispatched before the wind turbines
+        registry.register(PlantType('nuclear', ['uranium'], GasFiredStrategy(), SimplePowerDispatcher(), -1))
+        self.addCleanup(registry.unregister, 'nuclear')
+
+    def test_default_types(self):
+        self.assertEqual([plant_type.name for plant_type in PLANT_TYPES.types], [WIND_TURBINE, GAS_FIRED, TURBOJET])
+        self.assertIsInstance(PLANT_TYPES.get(GAS_FIRED).dispatcher, MeritOrderDispatcher)
+        self.assertNotIn('nuclear', PLANT_TYPES)
+
+    def test_rank_fleet(self):
+        # Test that the single pass gives the same positions as the ranking of each type
+        orchestrator = StrategyOrchestrator()
+        power_plants = self.payload.powerplants + [PowerPlant(name='x', type='unknown', efficiency=1, pmin=0, pmax=1)]
+        state = orchestrator.process_fleet(Fleet(power_plants), self.payload.fuels)
+        buckets = orchestrator.rank_fleet(state)
+        self.assertEqual([plant_type.name for plant_type, _ in buckets], [WIND_TURBINE, GAS_FIRED, TURBOJET])
+        for plant_type, positions in buckets:
+            self.assertEqual(positions.tolist(), state.ranked(plant_type.name).tolist())
+
+    def test_register_fuels(self):
+        registry = PlantTypeRegistry()
+        self.register_nuclear(registry)
+        self.assertEqual(FuelIndex({'uranium(euro/MWh)': 5.0}, registry.fuel_table).price('nuclear'), 5.0)
+        # The fuels of a registry of its own don't leak into the default fuel table
+        self.assertIsNone(FuelIndex({'uranium(euro/MWh)': 5.0}).price('nuclear'))
+        self.assertNotIn('nuclear', FUELS_BY_TYPE)
+        self.assertTrue(registry.unregister('nuclear'))
+        self.assertIsNone(FuelIndex({'uranium(euro/MWh)': 5.0}, registry.fuel_table).price('nuclear'))
+        self.assertFalse(registry.unregister('nuclear'))
+
+        self.register_nuclear(PLANT_TYPES)
+        self.assertEqual(FuelIndex({'uranium(euro/MWh)': 5.0}).price('nuclear'), 5.0)
+        self.assertEqual(FUELS_BY_TYPE['nuclear'], ['uranium'])
+
+    def test_new_type(self):
+        # Test that a registered type is ranked and dispatched without any other change
+        self.register_nuclear(PLANT_TYPES)
+        power_plants = self.payload.powerplants + [PowerPlant(name='nuclear1', type='nuclear', efficiency=0.33,
+                                                              pmin=0, pmax=100)]
+        payload = Payload(load=self.payload.load, fuels={**self.payload.fuels, 'uranium(euro/MWh)': 3.0},
+                          powerplants=power_plants)
+        plan = compute_production_plan(payload)
+
+        self.assertEqual((plan[0].name, plan[0].p), ('nuclear1', 1000))
+        self.assertEqual(len(plan), len(power_plants))
+        self.assertEqual(sum(entry.p for entry in plan), payload.load * 10)
+        result = StrategyOrchestrator().process_power_plant(EnrichedPowerPlant(power_plants[-1],
+                                                                               FuelIndex(payload.fuels)))
+        self.assertAlmostEqual(result.cost, 3.0 / 0.33)
+
+    def test_endpoints(self):
+        # Test that the plants of a registered type are dispatched by every endpoint, or rejected, never dropped
+        self.register_nuclear(PLANT_TYPES)
+        nuclear = PowerPlant(name='nuke', type='nuclear', efficiency=0.33, pmin=0, pmax=200)
+        payload = Payload(load=self.payload.load, fuels={**self.payload.fuels, 'uranium(euro/MWh)': 3.0},
+                          powerplants=self.payload.powerplants + [nuclear])
+        expected = [{'name': entry.name, 'p': entry.p} for entry in compute_production_plan(payload)]
+        self.assertEqual(expected[0], {'name': 'nuke', 'p': 2000})
+
+        client = TestClient(app)
+        self.addCleanup(plan_pool.shutdown)
+        for path in ('/productionplan', '/productionplan/fast', '/productionplan/async'):
+            self.assertEqual(client.post(path, json=payload.dict()).json(), expected, path)
+        self.assertEqual(client.post('/productionplan/batch', json=[payload.dict()]).json(), [expected])
+        lines = [json.dumps([p.dict() for p in payload.powerplants]),
+                 json.dumps({'load': payload.load, 'fuels': payload.fuels})]
+        response = client.post('/productionplan/stream', data='\n'.join(lines))
+        self.assertEqual([json.loads(line) for line in response.text.splitlines()], [expected])
+
+        client.put('/fleets/nuclear', json=[p.dict() for p in payload.powerplants])
+        self.addCleanup(client.delete, '/fleets/nuclear')
+        scenario = {'load': payload.load, 'fuels': payload.fuels}
+        self.assertEqual(client.post('/productionplan/nuclear', json=scenario).json(), expected)
+        self.assertEqual(client.patch('/productionplan/nuclear', json=scenario).json(), expected)
+        result = client.post('/fleets/nuclear/scenarios/wind', json={**scenario, 'count': 10, 'seed': 1}).json()
+        nuke = result['plants'][-1]
+        self.assertEqual((nuke['name'], nuke['mean'], set(nuke['quantiles'].values())), ('nuke', 2000.0, {2000.0}))
+
+        # The stages of the supply curve and of the unit commitment are the ones of the challenge only
+        response = client.post('/fleets/nuclear/supplycurve', json={**scenario, 'start': 0, 'stop': 100})
+        self.assertEqual(response.status_code, 422)
+        response = client.post('/unitcommitment', json={'powerplants': [p.dict() for p in payload.powerplants],
+                                                        'periods': [scenario]})
+        self.assertEqual(response.status_code, 422)
+        # The loads are not checked, rather than wrongly rejected
+        response = client.post('/productionplan', params={'on_infeasible': 'reject'}, json=payload.dict())
+        self.assertEqual(response.json(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
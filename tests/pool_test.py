@@ -0,0 +1,150 @@
+import asyncio
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class PlanPoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_solve(self):
+        # test the plain data computation gives the same plan as production_plan
+        expected = [(entry.name, entry.p) for entry in compute_production_plan(self.payload)]
+
+        self.assertEqual(solve(*compact(self.payload)), expected)
+
+    def test_pool(self):
+        pool = PlanPool(workers=1)
+        try:
+            plan = asyncio.run(pool.plan(self.payload))
+        finally:
+            pool.shutdown()
+
+        self.assertEqual(sum(entry.p for entry in plan), self.payload.load * 10)
+
+    def test_started_out_of_the_loop(self):
+        # Test that the worker processes are started on first use (or with the application when eager), never on the
+        # event loop
+        started = []
+        original = PlanPool.start
+
+        def start(pool: PlanPool):
+            try:
+                asyncio.get_running_loop()
+                started.append('loop')
+            except RuntimeError:
+                started.append('executor')
+            return original(pool)
+
+        self.assertIn(start_plan_pool, app.router.on_startup)
+        with mock.patch.object(PlanPool, 'start', start):
+            try:
+                # Lazy by default: nothing is started with the application
+                asyncio.run(start_plan_pool())
+                self.assertEqual(started, [])
+                with mock.patch.object(plan_pool, '_eager', True):
+                    asyncio.run(start_plan_pool())
+                self.assertEqual(started, ['executor'])
+                response = TestClient(app).post("/productionplan/async", json=self.payload.dict())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(started, ['executor'])
+            finally:
+                plan_pool.shutdown()
+
+            pool = PlanPool(workers=1)
+            try:
+                asyncio.run(pool.plan(self.payload))
+            finally:
+                pool.shutdown()
+            self.assertEqual(started, ['executor'] * 2)
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        client.delete("/cache")
+
+        response = client.post("/productionplan/async", json=self.payload.dict())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), client.post("/productionplan", json=self.payload.dict()).json())
+        plan_pool.shutdown()
+
+
+class SingleFlightAsyncTestCase(unittest.TestCase):
+
+    def test_coalesced_calls(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "plan"
+
+        async def run():
+            return await asyncio.gather(*[single_flight.do_async("key", compute) for _ in range(4)])
+
+        results = asyncio.run(run())
+
+        self.assertEqual(results, ["plan"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.stats()["coalesced"], 3)
+
+    def test_cancelled_leader(self):
+        # Test that the cancellation of the first caller reaches neither the computation nor the other callers
+        single_flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "plan"
+
+        async def run():
+            leader = asyncio.ensure_future(single_flight.do_async("key", compute))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do_async("key", compute))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(leader, follower, return_exceptions=True)
+
+        leader, follower = asyncio.run(run())
+        self.assertIsInstance(leader, asyncio.CancelledError)
+        self.assertEqual(follower, "plan")
+        self.assertEqual(single_flight.stats(), {"executions": 1, "coalesced": 1, "in_flight": 0})
+
+    def test_cancelled_callers(self):
+        # Test that the computation is cancelled once every caller left, and that a next call runs it again
+        single_flight = SingleFlight()
+        cancelled = []
+
+        async def compute():
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "plan"
+
+        async def run():
+            callers = [asyncio.ensure_future(single_flight.do_async("key", compute)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0)
+            self.assertEqual((cancelled, single_flight.stats()["in_flight"]), ([1], 0))
+            return await single_flight.do_async("key", compute)
+
+        self.assertEqual(asyncio.run(run()), "plan")
+        self.assertEqual(single_flight.stats()["executions"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_requested_mode(self):
+        self.assertEqual(requested_mode({'query_string': b'profile=1', 'headers': []}), STAGES)
+        self.assertEqual(requested_mode({'query_string': b'budget_ms=5&profile=sample', 'headers': []}), SAMPLE)
+        self.assertEqual(requested_mode({'query_string': b'', 'headers': [(b'x-profile', b'Sample')]}), SAMPLE)
+        self.assertIsNone(requested_mode({'query_string': b'', 'headers': [(b'x-time-budget-ms', b'5')]}))
+        self.assertIsNone(requested_mode({'query_string': b'profile=flame', 'headers': []}))
+
+    def test_rate_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            limited = Profiler(directory, per_minute=2)
+            profiles = [limited.begin(STAGES, '/productionplan') for _ in range(3)]
+            self.assertIsNotNone(profiles[0])
+            self.assertIsNotNone(profiles[1])
+            self.assertIsNone(profiles[2])
+            self.assertEqual(limited.stats(), {'captured': 0, 'rate_limited': 1})
+
+            path = limited.finish(profiles[0])
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(limited.stats()['captured'], 1)
+
+            # Disabled
+            self.assertIsNone(Profiler(directory, per_minute=0).begin(STAGES, '/productionplan'))
+
+    def test_sampled_trace(self):
+        # Test that consecutive samples sharing frames are merged into nested events
+        profile = RequestProfile('profile.json', SAMPLE, '/productionplan', 1.0)
+        profile.stop()
+        profile.span('request', 0.0, 0.010)
+        profile.sampler.samples = [(0.001, ('main', 'rank')), (0.002, ('main', 'rank')),
+                                   (0.003, ('main', 'dispatch', 'solve')), (0.004, ('main',))]
+        events = {(event['name'], event['ts'], event['dur']) for event in profile.trace()['traceEvents']
+                  if event.get('cat') == 'sample'}
+        self.assertEqual(events, {('main', 1000.0, 3000.0), ('rank', 1000.0, 2000.0), ('dispatch', 3000.0, 1000.0),
+                                  ('solve', 3000.0, 1000.0)})
+
+    def test_endpoint(self):
+        # Test that a profiled request writes its stages as a Chrome trace, the other ones being left alone
+        client = TestClient(app)
+        payload = self.payload.dict()
+        payload['load'] = 417
+
+        response = client.post('/productionplan', json=payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('x-profile', response.headers)
+
+        payload['load'] = 418
+        response = client.post('/productionplan?profile=sample', json=payload)
+        self.assertEqual(response.status_code, 200)
+        name = response.headers['x-profile']
+        path = os.path.join(profiler.directory, name)
+        try:
+            with open(path) as file:
+                trace = json.load(file)
+        finally:
+            os.remove(path)
+
+        stages = {event['name'] for event in trace['traceEvents'] if event.get('cat') == 'stage'}
+        self.assertTrue({'request', 'parse', 'handle', 'rank', 'dispatch.gasfired', 'serialize'} <= stages)
+        self.assertTrue(all(event['dur'] >= 0 for event in trace['traceEvents'] if event['ph'] == 'X'))
+        self.assertEqual(trace['otherData']['mode'], SAMPLE)
+        self.assertGreaterEqual(client.get('/metrics').json()['profiling']['captured'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class FleetRegistryTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def test_register(self):
+        registry = FleetRegistry()
+        fleet = registry.register("fleet1", self.payload.powerplants)
+
+        self.assertIs(registry.get("fleet1"), fleet)
+        self.assertEqual(registry.ids(), ["fleet1"])
+        self.assertEqual(fleet.summary(), {GAS_FIRED: 3, TURBOJET: 1, WIND_TURBINE: 2})
+        self.assertEqual(list(fleet.index(GAS_FIRED)), [0, 1, 2])
+
+    def test_unregister(self):
+        registry = FleetRegistry()
+        registry.register("fleet1", self.payload.powerplants)
+
+        self.assertTrue(registry.unregister("fleet1"))
+        self.assertFalse(registry.unregister("fleet1"))
+        self.assertIsNone(registry.get("fleet1"))
+
+    def test_endpoints(self):
+        client = TestClient(app)
+        powerplants = [power_plant.dict() for power_plant in self.payload.powerplants]
+
+        response = client.put("/fleets/test_fleet", json=powerplants)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["size"], 6)
+
+        response = client.post("/productionplan/test_fleet", json={"load": 480, "fuels": self.payload.fuels})
+        self.assertEqual(response.status_code, 200)
+        expected = [{"name": entry.name, "p": entry.p} for entry in production_plan(self.payload)]
+        self.assertEqual(response.json(), expected)
+
+        self.assertEqual(client.put("/fleets/batch", json=powerplants).status_code, 422)
+        self.assertEqual(client.delete("/fleets/test_fleet").status_code, 200)
+        self.assertEqual(client.post("/productionplan/test_fleet", json={"load": 480, "fuels": {}}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class SharedFleetsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_read_write(self):
+        fleet = Fleet(self.payload.powerplants)
+        path = os.path.join(self.directory.name, 'fleet.fleet')
+        index = FeasibilityIndex(fleet)
+        write_fleet(path, fleet, index)
+        mapped, mapped_index = read_fleet(path)
+
+        self.assertEqual(mapped.names, fleet.names)
+        self.assertEqual(mapped.types, fleet.types)
+        self.assertEqual(mapped.fingerprint, fleet.fingerprint)
+        self.assertEqual(mapped.summary(), fleet.summary())
+        self.assertEqual(mapped_index.thermal.intervals, index.thermal.intervals)
+        self.assertEqual(mapped_index.gas_fired.intervals, index.gas_fired.intervals)
+        self.assertEqual(mapped_index.check(130, self.payload.fuels).to_dict(),
+                         index.check(130, self.payload.fuels).to_dict())
+        for expected, actual in [(fleet.efficiency, mapped.efficiency), (fleet.pmin, mapped.pmin),
+                                 (fleet.pmax, mapped.pmax), (fleet.type_codes, mapped.type_codes),
+                                 (fleet.index(GAS_FIRED), mapped.index(GAS_FIRED))]:
+            np.testing.assert_array_equal(actual, expected)
+            self.assertEqual(actual.dtype, expected.dtype)
+        for expected, actual in zip(fleet.columns(TURBOJET), mapped.columns(TURBOJET)):
+            np.testing.assert_array_equal(actual, expected)
+
+        # The arrays are read only views of the file, not copies
+        self.assertFalse(mapped.pmax.flags.writeable)
+        self.assertIsInstance(mapped.pmax.base, np.memmap)
+
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            read_fleet(path)
+
+    def test_versions(self):
+        indexes = FeasibilityIndexes()
+        store = SharedFleetStore(self.directory.name, indexes)
+        # Another worker process, using the same directory
+        other = SharedFleetStore(self.directory.name)
+        self.assertIsNone(store.get('fleet'))
+
+        first = store.publish('fleet', Fleet(self.payload.powerplants))
+        self.assertIs(store.get('fleet'), first)
+        self.assertEqual(other.get('fleet').fingerprint, first.fingerprint)
+        self.assertEqual(other.ids(), ['fleet'])
+
+        # A new version replaces the current one, the previous one staying usable
+        second = store.publish('fleet', Fleet(self.payload.powerplants[:2]))
+        self.assertEqual(len(other.get('fleet')), 2)
+        self.assertEqual(len(first), len(self.payload.powerplants))
+        self.assertEqual(int(first.pmax.sum()), sum(p.pmax for p in self.payload.powerplants))
+        self.assertEqual(len([name for name in os.listdir(self.directory.name) if name.endswith('.fleet')]), 1)
+
+        # The feasibility index is built from the stored reachable power
+        self.assertIsNotNone(indexes.get(second))
+        self.assertEqual(store.stats()['published'], 2)
+
+        self.assertTrue(other.remove('fleet'))
+        self.assertIsNone(store.get('fleet'))
+        self.assertFalse(store.remove('fleet'))
+        self.assertEqual(store.ids(), [])
+
+    def test_fleet_ids(self):
+        store = SharedFleetStore(self.directory.name)
+        for fleet_id in ['a/b', '..', 'x.current', 'été']:
+            store.publish(fleet_id, Fleet(self.payload.powerplants))
+        self.assertEqual(store.ids(), sorted(['a/b', '..', 'x.current', 'été']))
+        self.assertEqual(len(store.get('a/b')), len(self.payload.powerplants))
+        self.assertTrue(store.remove('x.current'))
+        self.assertEqual(len(store.ids()), 3)
+
+    def test_other_process(self):
+        # Test that a fleet registered by a process is seen by another one
+        store = SharedFleetStore(self.directory.name)
+        fleet = store.publish('fleet', Fleet(self.payload.powerplants))
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = ('import sys; from services.shared_fleets import SharedFleetStore; '
+                  'fleet = SharedFleetStore(sys.argv[1]).get("fleet"); print(fleet.fingerprint, int(fleet.pmax.sum()))')
+        output = subprocess.run([sys.executable, '-c', script, self.directory.name], cwd=root, check=True,
+                                capture_output=True, text=True).stdout.split()
+        self.assertEqual(output, [fleet.fingerprint, str(int(fleet.pmax.sum()))])
+
+    def test_endpoints(self):
+        client = TestClient(app)
+        registry = FleetRegistry(SharedFleetStore(self.directory.name, feasibility_indexes))
+        expected = client.post('/productionplan', json=self.payload.dict()).json()
+        with mock.patch('app.app.fleet_registry', registry):
+            response = client.put('/fleets/shared', json=[p.dict() for p in self.payload.powerplants])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.get('/fleets').json(), ['shared'])
+
+            response = client.post('/productionplan/shared', json={'load': self.payload.load,
+                                                                   'fuels': self.payload.fuels})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+            self.assertEqual(client.get('/metrics').json()['fleet_store']['published'], 1)
+
+            self.assertEqual(client.delete('/fleets/shared').status_code, 200)
+            self.assertEqual(client.get('/fleets/shared').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 
 from services.strategy import *
 from domain.engie_objects import *
+from domain.fleet import *
 
 
 class StrategyComputeSinglePowerPlantTestCase(unittest.TestCase):
@@ -198,5 +199,52 @@ class StrategyPriceComputingTestCase(unittest.TestCase):
         self.assertTrue(result.order < 0)
 
 
+class StrategyFleetTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.power_plants = [
+            PowerPlant(name="gasfiredbig1", type="gasfired", efficiency=0.53, pmin=100, pmax=460),
+            PowerPlant(name="tj1", type="turbojet", efficiency=0.3, pmin=0, pmax=16),
+            PowerPlant(name="gasfiredsmall", type="gasfired", efficiency=0.37, pmin=40, pmax=210),
+            PowerPlant(name="windpark1", type="windturbine", efficiency=1, pmin=0, pmax=150),
+            PowerPlant(name="windpark2", type="windturbine", efficiency=1, pmin=0, pmax=36)
+        ]
+        self.fuels = StrategyPriceComputingTestCase.get_fuels()
+        self.raw_fuels = {fuel.name: fuel.data for fuel in self.fuels}
+        self.orchestrator = StrategyOrchestrator()
+
+    def test_process_fleet(self):
+        # test the fleet state matches the process results of each power plant
+        state = self.orchestrator.process_fleet(Fleet(self.power_plants), self.raw_fuels)
+
+        for i, power_plant in enumerate(self.power_plants):
+            result = self.orchestrator.process_power_plant(EnrichedPowerPlant(power_plant, self.fuels))
+            self.assertEqual(state.available_power[i], result.available_power)
+            self.assertEqual(state.minimum_power[i], result.minimum_power)
+            self.assertEqual(state.cost[i], result.cost)
+            self.assertEqual(state.order[i], result.order)
+
+    def test_ranked(self):
+        state = self.orchestrator.process_fleet(Fleet(self.power_plants), self.raw_fuels)
+
+        self.assertEqual(list(state.ranked(GAS_FIRED)), [0, 2])
+        self.assertEqual(list(state.ranked(WIND_TURBINE)), [3, 4])
+
+    def test_compute_fleet(self):
+        # test the dispatchers give the same dispatched power on the fleet state and on the process results
+        for dispatcher, power_plant_type, load in ((SimplePowerDispatcher(), WIND_TURBINE, 1000),
+                                                   (GasFiredDispatcher(), GAS_FIRED, 3000)):
+            state = self.orchestrator.process_fleet(Fleet(self.power_plants), self.raw_fuels)
+            positions = state.ranked(power_plant_type)
+            results = [self.orchestrator.process_power_plant(EnrichedPowerPlant(self.power_plants[i], self.fuels))
+                       for i in positions]
+
+            total = dispatcher.compute_fleet(state, positions, load)
+            dispatcher.compute(results, load)
+
+            self.assertEqual(list(state.dispatched_power[positions]), [result.dispatched_power for result in results])
+            self.assertEqual(total, sum(result.dispatched_power for result in results))
+
+
 if __name__ == '__main__':
     unittest.main()
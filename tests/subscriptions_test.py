@@ -0,0 +1,155 @@
+import asyncio
+
+import httpx
+
+from app.app import *
+from benchmarks.load import LocalServer
+from domain_test import *
+
+
+class SubscriptionsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        self.fleet = Fleet(self.payload.powerplants)
+        self.batches = []
+
+        def planner(fleet: Fleet, scenarios: List[Scenario]) -> List[List[ResponseEntry]]:
+            self.batches.append([scenario.load for scenario in scenarios])
+            return BatchPlanner().plan(fleet, scenarios)
+
+        self.subscriptions = PlanSubscriptions(planner)
+
+    def test_shared_updates(self):
+        async def scenario():
+            first = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            second = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            other = await self.subscriptions.subscribe('fleet', self.fleet, 300)
+            # The market state is unknown: nothing to push yet
+            self.assertEqual(self.batches, [])
+            with self.assertRaises(asyncio.TimeoutError):
+                await first.next(0.01)
+
+            # One batch for all the subscribers, one plan per load
+            outcome = await self.subscriptions.update('fleet', self.fleet, self.payload.fuels)
+            self.assertEqual(outcome, {'version': 1, 'computed': 2, 'changed': 2, 'notified': 3})
+            self.assertEqual(self.batches, [[480, 300]])
+            version, plan = await first.next(1)
+            self.assertEqual(version, 1)
+            self.assertEqual(json.loads(plan), [{'name': entry.name, 'p': entry.p}
+                                                for entry in compute_production_plan(self.payload)])
+            self.assertEqual((await second.next(1))[1], plan)
+            self.assertNotEqual((await other.next(1))[1], plan)
+
+            # Nothing moved: nothing computed
+            outcome = await self.subscriptions.update('fleet', self.fleet, {'gas(euro/MWh)': 13.4})
+            self.assertEqual(outcome['computed'], 0)
+
+            # A price moved without changing the dispatch: nothing pushed
+            outcome = await self.subscriptions.update('fleet', self.fleet, {'kerosine(euro/MWh)': 60})
+            self.assertEqual((outcome['computed'], outcome['changed'], outcome['notified']), (2, 0, 0))
+            with self.assertRaises(asyncio.TimeoutError):
+                await first.next(0.01)
+
+            # Less wind changes the dispatch
+            outcome = await self.subscriptions.update('fleet', self.fleet, {'wind(%)': 20})
+            self.assertEqual(outcome['notified'], 3)
+            self.assertEqual((await first.next(1))[0], 3)
+
+            # A new subscriber is given the current plan at once, without computing it again
+            late = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            self.assertEqual(await late.next(1), (3, self.subscriptions._fleets['fleet'].plans[480]))
+            self.assertEqual(len(self.batches), 3)
+
+            for subscriber in (first, second, other, late):
+                self.subscriptions.unsubscribe('fleet', subscriber)
+            # Nobody watches the fleet anymore: its market state is dropped, and the next updates are ignored
+            self.assertEqual((self.subscriptions.stats()['subscribers'], self.subscriptions.stats()['fleets']), (0, 0))
+            self.assertEqual((await self.subscriptions.update('fleet', self.fleet, {'wind(%)': 50}))['computed'], 0)
+            self.assertEqual(self.subscriptions.stats()['fleets'], 0)
+            late = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            with self.assertRaises(asyncio.TimeoutError):
+                await late.next(0.01)
+
+        asyncio.run(scenario())
+
+    def test_replaced_fleet(self):
+        # Test that the plans of a replaced fleet are computed again and pushed, not served from the previous fleet
+        single = Fleet([PowerPlant(name='only', type=GAS_FIRED, efficiency=0.5, pmin=0, pmax=1000)])
+
+        async def scenario():
+            subscriber = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            await self.subscriptions.update('fleet', self.fleet, self.payload.fuels)
+            await subscriber.next(1)
+
+            await self.subscriptions.replace('fleet', single)
+            version, plan = await subscriber.next(1)
+            self.assertEqual((version, json.loads(plan)), (2, [{'name': 'only', 'p': 4800}]))
+            late = await self.subscriptions.subscribe('fleet', single, 480)
+            self.assertEqual(await late.next(1), (2, plan))
+
+            # A subscription with the new fleet, not registered through replace, gives its plan too
+            other = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            self.assertNotEqual((await other.next(1))[1], plan)
+            self.assertNotEqual((await subscriber.next(1))[1], plan)
+
+            # Nothing to compute before the first market update
+            await self.subscriptions.replace('empty', single)
+            await self.subscriptions.subscribe('empty', single, 480)
+            self.assertEqual((await self.subscriptions.update('empty', self.fleet, {}))['computed'], 0)
+
+        asyncio.run(scenario())
+
+    def test_latest_plan_only(self):
+        # Test that a slow subscriber skips the plans replaced before it read them
+        async def scenario():
+            subscriber = await self.subscriptions.subscribe('fleet', self.fleet, 480)
+            await self.subscriptions.update('fleet', self.fleet, self.payload.fuels)
+            await self.subscriptions.update('fleet', self.fleet, {'wind(%)': 20})
+            self.assertEqual((await subscriber.next(1))[0], 2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await subscriber.next(0.01)
+
+            self.subscriptions.close('fleet')
+            self.assertIsNone(await subscriber.next(1))
+            self.assertEqual(self.subscriptions.stats()['fleets'], 0)
+
+        asyncio.run(scenario())
+
+    def test_endpoints(self):
+        with LocalServer(in_process=True) as server, httpx.Client(base_url=server.url, timeout=10) as client:
+            client.put('/fleets/subscribed', json=[p.dict() for p in self.payload.powerplants])
+            self.assertEqual(client.get('/fleets/unknown/plans', params={'load': 480}).status_code, 404)
+            self.assertEqual(client.post('/fleets/unknown/market', json={'fuels': {}}).status_code, 404)
+
+            with client.stream('GET', '/fleets/subscribed/plans', params={'load': 480}) as response:
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.headers['content-type'].startswith('text/event-stream'))
+
+                outcome = client.post('/fleets/subscribed/market', json={'fuels': self.payload.fuels}).json()
+                self.assertEqual(outcome['notified'], 1)
+                lines = response.iter_lines()
+                event = [next(lines) for _ in range(3)]
+                self.assertEqual(event[:2], ['id: 1', 'event: plan'])
+                expected = [{'name': entry.name, 'p': entry.p} for entry in compute_production_plan(self.payload)]
+                self.assertEqual(json.loads(event[2][len('data: '):]), expected)
+
+                self.assertGreaterEqual(client.get('/metrics').json()['subscriptions']['subscribers'], 1)
+
+                # The replacement of the fleet pushes its new plan
+                single = {'name': 'only', 'type': GAS_FIRED, 'efficiency': 0.5, 'pmin': 0, 'pmax': 1000}
+                self.assertEqual(client.put('/fleets/subscribed', json=[single]).status_code, 200)
+                event = [line for line in (next(lines) for _ in range(4)) if line]
+                self.assertEqual(event[:2], ['id: 2', 'event: plan'])
+                self.assertEqual(json.loads(event[2][len('data: '):]), [{'name': 'only', 'p': 4800}])
+                # The removal of the fleet ends the stream
+                client.delete('/fleets/subscribed')
+                self.assertEqual([line for line in lines if line], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
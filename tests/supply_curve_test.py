@@ -0,0 +1,53 @@
+import copy
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class SupplyCurveTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+        self.curve = SupplyCurve(Fleet(self.payload.powerplants), self.payload.fuels)
+
+    def test_same_plans_as_production_plan(self):
+        for load in range(0, 1200, 37):
+            payload = copy.deepcopy(self.payload)
+            payload.load = load
+            expected = [(entry.name, entry.p) for entry in production_plan(payload)]
+            self.assertEqual([(entry.name, entry.p) for entry in self.curve.plan(load)], expected)
+
+    def test_costs(self):
+        # test wind only, then the cheapest gas fired power plant
+        self.assertEqual(self.curve.costs(50), (0.0, 0.0))
+        cost, marginal_cost = self.curve.costs(480)
+        self.assertAlmostEqual(marginal_cost, 13.4 / 0.53)
+        self.assertAlmostEqual(cost, 368.5 * 13.4 / 0.53)
+
+    def test_sweep(self):
+        points = self.curve.sweep(100, 500, 100, True)
+
+        self.assertEqual([point['load'] for point in points], [100, 200, 300, 400, 500])
+        self.assertEqual(sum(entry.p for entry in points[-1]['plan']), 5000)
+        with self.assertRaises(ValueError):
+            self.curve.sweep(0, 10, 0)
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        body = {"fuels": self.payload.fuels, "start": 0, "stop": 1000, "step": 10,
+                "powerplants": [power_plant.dict() for power_plant in self.payload.powerplants]}
+
+        response = client.post("/supplycurve", json=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 101)
+        self.assertNotIn('plan', response.json()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
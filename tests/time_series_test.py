@@ -0,0 +1,99 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class TimeSeriesTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    def intervals(self) -> List[Scenario]:
+        # A day of quarter-hours where the load and the wind change
+        intervals = []
+        for quarter in range(96):
+            fuels = dict(self.payload.fuels)
+            fuels['wind(%)'] = (quarter * 7) % 101
+            intervals.append(Scenario(load=200 + (quarter * 37) % 700, fuels=fuels))
+        return intervals
+
+    @staticmethod
+    def as_dicts(plan: List[ResponseEntry]) -> List[dict]:
+        return [{'name': entry.name, 'p': entry.p} for entry in plan]
+
+    def test_plan(self):
+        # Test that the plans are the same as the ones of the '/productionplan' endpoint
+        planner = TimeSeriesPlanner(Fleet(self.payload.powerplants))
+        for scenario in self.intervals():
+            expected = compute_production_plan(
+                Payload(load=scenario.load, fuels=scenario.fuels, powerplants=self.payload.powerplants))
+            self.assertEqual(self.as_dicts(planner.plan(scenario)), self.as_dicts(expected))
+
+    def test_reuse(self):
+        # Test that only the wind turbines are ranked again when only the wind changes
+        planner = TimeSeriesPlanner(Fleet(self.payload.powerplants))
+        intervals = self.intervals()
+        for scenario in intervals:
+            planner.plan(scenario)
+        wind_changes = len(intervals)
+        self.assertEqual(planner.builds, wind_changes + 2)
+
+    def test_memoized_stack(self):
+        # Test that the solutions are the same and that only the last ones are kept
+        stack = MeritOrderStack([1.0, 2.0], [100, 400], [2000, 1000])
+        memoized = MemoizedStack(stack, max_size=2)
+        for load in (500, 1500, 2500, 500):
+            self.assertEqual(memoized.solve(load).dispatched, stack.solve(load).dispatched)
+        self.assertEqual(len(memoized._solutions), 2)
+
+    def test_iter_lines(self):
+        # Test that the lines are rebuilt whatever the chunks
+        async def chunks():
+            for chunk in (b'{"a"', b': 1}\n\n{"b": 2', b'}\n', b'{"c": 3}'):
+                yield chunk
+
+        async def collect():
+            return [line async for line in iter_lines(chunks())]
+
+        self.assertEqual(asyncio.run(collect()), [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}'])
+
+    def test_endpoint(self):
+        # Test that the endpoint streams one plan per interval
+        client = TestClient(app)
+        intervals = self.intervals()
+        lines = [json.dumps([p.dict() for p in self.payload.powerplants])]
+        lines += [scenario.json() for scenario in intervals]
+        response = client.post('/productionplan/stream', data='\n'.join(lines))
+        self.assertEqual(response.status_code, 200)
+
+        plans = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(plans), len(intervals))
+        for plan, scenario in zip(plans, intervals):
+            expected = compute_production_plan(
+                Payload(load=scenario.load, fuels=scenario.fuels, powerplants=self.payload.powerplants))
+            self.assertEqual(plan, self.as_dicts(expected))
+
+    def test_endpoint_errors(self):
+        client = TestClient(app)
+        # Test the missing or invalid fleet
+        self.assertEqual(client.post('/productionplan/stream', data='').status_code, 422)
+        self.assertEqual(client.post('/productionplan/stream', data='[{"name": "x"}]').status_code, 422)
+
+        # Test that an invalid interval ends the stream with an error line
+        lines = [json.dumps({'powerplants': [p.dict() for p in self.payload.powerplants]}),
+                 self.intervals()[0].json(), '{"load": "many"}', self.intervals()[1].json()]
+        response = client.post('/productionplan/stream', data='\n'.join(lines))
+        results = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[1]['interval'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
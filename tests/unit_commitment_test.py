@@ -0,0 +1,166 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.app import *
+from domain_test import *
+
+
+class UnitCommitmentTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        try:
+            self.payload: Payload = load_json('tests/fixtures/payload1.json')
+        except:
+            print("Loading tests from IDE, using another path")
+            self.payload: Payload = load_json('fixtures/payload1.json')
+
+    @staticmethod
+    def problem(periods: int = 96, size: int = 50, seed: int = 1) -> UnitCommitmentProblem:
+        # A day of quarter-hours, with a sine shaped demand and constrained units
+        random = np.random.default_rng(seed)
+        efficiency = random.uniform(0.3, 0.6, size)
+        cost = np.tile(30 / efficiency, (periods, 1)) * random.uniform(0.9, 1.1, (periods, 1))
+        pmax = random.integers(50, 400, size) * 10
+        pmin = (pmax * random.uniform(0.2, 0.5, size)).astype(np.int64)
+        demand = (pmax.sum() * (0.5 + 0.3 * np.sin(np.arange(periods) / periods * 2 * np.pi))).astype(np.int64)
+        return UnitCommitmentProblem(['unit%d' % i for i in range(size)], cost, pmin, pmax, demand, 0.25,
+                                     startup_cost=random.uniform(500, 5000, size), ramp_up=pmax // 4,
+                                     ramp_down=pmax // 4, min_up=random.integers(1, 16, size),
+                                     min_down=random.integers(1, 16, size))
+
+    @staticmethod
+    def runs(schedule: np.ndarray) -> List[Tuple[bool, int, int]]:
+        # The (state, start, length) of the runs of a schedule
+        changes = np.flatnonzero(schedule[1:] != schedule[:-1]) + 1
+        starts = [0] + changes.tolist()
+        ends = changes.tolist() + [len(schedule)]
+        return [(bool(schedule[start]), start, end - start) for start, end in zip(starts, ends)]
+
+    def test_min_up_down(self):
+        # Test that the runs of each unit are long enough, except the ones at the ends of the horizon
+        problem = self.problem(periods=48, size=20)
+        solution = UnitCommitmentSolver().solve(problem)
+        for i in range(problem.size):
+            for on, start, length in self.runs(solution.commitment[:, i]):
+                if start == 0 or start + length == problem.periods:
+                    continue
+                self.assertGreaterEqual(length, problem.min_up[i] if on else problem.min_down[i])
+
+    def test_schedule(self):
+        # Test a single unit, cheap in the middle of the horizon only, which must stay on 4 periods
+        problem = UnitCommitmentProblem(['a'], np.zeros((8, 1)), [10], [20], np.zeros(8), min_up=4, min_down=2)
+        on_cost = np.array([[5.0], [5.0], [5.0], [-20.0], [5.0], [5.0], [5.0], [5.0]])
+        total, commitment = UnitCommitmentSolver._schedule(problem, on_cost)
+        self.assertEqual(commitment[:, 0].tolist(), [False] * 3 + [True] * 4 + [False])
+        self.assertEqual(total, -5.0)
+
+        # Same with an initial state on for 1 period: it must stay on 3 more periods
+        problem = UnitCommitmentProblem(['a'], np.zeros((8, 1)), [10], [20], np.zeros(8), min_up=4, min_down=2,
+                                        initial_on=[True], initial_periods=[1], initial_power=[10])
+        _, commitment = UnitCommitmentSolver._schedule(problem, np.full((8, 1), 5.0))
+        self.assertEqual(commitment[:, 0].tolist(), [True] * 3 + [False] * 5)
+
+    def test_long_min_up_down(self):
+        # Test that the minimum times longer than the horizon are clamped, keeping the same schedules
+        on_cost = np.array([[5.0], [5.0], [5.0], [-20.0], [5.0], [5.0], [5.0], [5.0]])
+        problem = UnitCommitmentProblem(['a'], np.zeros((8, 1)), [10], [20], np.zeros(8), min_up=[10 ** 6],
+                                        min_down=[10 ** 6])
+        self.assertEqual((problem.min_up.tolist(), problem.min_down.tolist()), ([9], [9]))
+        _, commitment = UnitCommitmentSolver._schedule(problem, on_cost)
+        self.assertEqual(commitment[:, 0].tolist(), [False] * 3 + [True] * 5)
+
+        # Same with an initial state on for 5 periods: it must stay on until the end of the horizon
+        problem = UnitCommitmentProblem(['a'], np.zeros((8, 1)), [10], [20], np.zeros(8), min_up=[10 ** 6],
+                                        min_down=10 ** 6, initial_on=[True], initial_periods=[5], initial_power=[10])
+        _, commitment = UnitCommitmentSolver._schedule(problem, np.full((8, 1), 5.0))
+        self.assertEqual(commitment[:, 0].tolist(), [True] * 8)
+
+        # While it stops as soon as allowed with a minimum up time of 7 periods
+        problem = UnitCommitmentProblem(['a'], np.zeros((8, 1)), [10], [20], np.zeros(8), min_up=7, min_down=10 ** 6,
+                                        initial_on=[True], initial_periods=[5], initial_power=[10])
+        _, commitment = UnitCommitmentSolver._schedule(problem, np.full((8, 1), 5.0))
+        self.assertEqual(commitment[:, 0].tolist(), [True] * 2 + [False] * 6)
+
+    def test_ramps(self):
+        # Test that the dispatch follows the ramp limits, the start-ups included
+        problem = self.problem()
+        solution = UnitCommitmentSolver().solve(problem)
+        previous_power, previous_on = problem.initial_power, problem.initial_on
+        for on, power in zip(solution.commitment, solution.dispatched):
+            running = on & previous_on
+            self.assertTrue(np.all(power[~on] == 0))
+            self.assertTrue(np.all(power[on] >= problem.pmin[on]))
+            self.assertTrue(np.all(power <= problem.pmax))
+            self.assertTrue(np.all((power - previous_power)[running] <= problem.ramp_up[running]))
+            self.assertTrue(np.all((previous_power - power)[running] <= problem.ramp_down[running]))
+            previous_power, previous_on = power, on
+        np.testing.assert_array_equal(solution.imbalance, problem.demand - solution.dispatched.sum(axis=1))
+        self.assertLessEqual(solution.lower_bound, solution.cost)
+
+    def test_time_budget(self):
+        # Test a day of quarter-hours with 50 units (about a second, with some margin for slow machines)
+        problem = self.problem()
+        start = time.perf_counter()
+        solution = UnitCommitmentSolver().solve(problem)
+        self.assertLess(time.perf_counter() - start, 3.0)
+        self.assertLess(solution.gap, 0.25)
+
+    def test_warm_start(self):
+        # Test that the next day starts from the final states, and that the multipliers give a plan as good
+        solver = UnitCommitmentSolver()
+        periods = [Scenario(load=200 + 20 * (t % 24), fuels=self.payload.fuels) for t in range(24)]
+        constraints = [UnitConstraints(name=p.name, startup_cost=1000.0, ramp_up=50.0, ramp_down=50.0, min_up=3,
+                                       min_down=3) for p in self.payload.powerplants if p.type != WIND_TURBINE]
+        payload = UnitCommitmentPayload(powerplants=self.payload.powerplants, periods=periods,
+                                        constraints=constraints)
+        first = plan_unit_commitment(payload, solver)
+        self.assertEqual(len(first['plans']), 24)
+
+        cold = plan_unit_commitment(payload.copy(update={'initial': first['final_state']}), solver)
+        warm = plan_unit_commitment(payload.copy(update={'initial': first['final_state'],
+                                                         'multipliers': first['multipliers']}), solver)
+        self.assertLessEqual(warm['cost'], cold['cost'] * (1 + 1e-3))
+        self.assertLessEqual(warm['iterations'], cold['iterations'])
+
+        # The units running at the end of the first day, and still running, can't jump beyond their ramp
+        final = {state.name: state for state in first['final_state']}
+        for entry in warm['plans'][0]:
+            state = final.get(entry.name)
+            if state is not None and state.on and entry.p > 0:
+                self.assertLessEqual(abs(entry.p - state.p), 500)
+
+    def test_final_states(self):
+        problem = UnitCommitmentProblem(['a', 'b'], np.zeros((4, 2)), [0, 0], [10, 10], np.zeros(4),
+                                        initial_on=[True, False], initial_periods=[2, 5])
+        commitment = np.array([[True, False], [True, False], [False, True], [False, True]])
+        solution = UnitCommitmentSolution(commitment, commitment * 5, np.zeros(4), 0.0, 0.0, np.zeros(4), 0)
+        states = final_states(problem, solution)
+        self.assertEqual([(s.on, s.periods, s.p) for s in states], [(False, 2, 0), (True, 2, 5)])
+
+        solution = UnitCommitmentSolution(np.ones((4, 2), dtype=bool), np.ones((4, 2)), np.zeros(4), 0.0, 0.0,
+                                          np.zeros(4), 0)
+        self.assertEqual([s.periods for s in final_states(problem, solution)], [6, 4])
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        periods = [{'load': load, 'fuels': self.payload.fuels} for load in (300, 480, 200)]
+        body = {'powerplants': [p.dict() for p in self.payload.powerplants], 'periods': periods,
+                'constraints': [{'name': 'gasfiredbig1', 'min_up': 2, 'startup_cost': 500.0}]}
+        response = client.post('/unitcommitment', json=body)
+        self.assertEqual(response.status_code, 200)
+
+        result = response.json()
+        self.assertEqual(len(result['plans']), 3)
+        for plan, period, imbalance in zip(result['plans'], periods, result['imbalance']):
+            self.assertEqual([entry['name'] for entry in plan], [p.name for p in self.payload.powerplants])
+            self.assertEqual(sum(entry['p'] for entry in plan) + imbalance, period['load'] * 10)
+        thermal = [p.name for p in self.payload.powerplants if p.type != WIND_TURBINE]
+        self.assertEqual([state['name'] for state in result['final_state']], thermal)
+        self.assertEqual(len(result['multipliers']), 3)
+
+        self.assertEqual(client.post('/unitcommitment', json={**body, 'periods': []}).status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()